@@ -12,6 +12,27 @@ def detect_beats(audio_file):
     beat_times = librosa.frames_to_time(beat_frames, sr=sr, hop_length=512)
     return beat_times, tempo, beat_frames, y, sr
 
+def _nearest_frames(time_frames, times):
+    """Map each time to the index of the closest frame (ties go to the earlier frame)"""
+    right = np.clip(np.searchsorted(time_frames, times), 1, len(time_frames) - 1)
+    left = right - 1
+    take_left = np.abs(time_frames[left] - times) <= np.abs(time_frames[right] - times)
+    return np.where(take_left, left, right)
+
+def _segment_means(values, start_frames, end_frames):
+    """
+    Mean of values[start:end] for every (start, end) pair
+    
+    Segments are grouped by length so each group is reduced in one call; this keeps
+    the summation order of np.mean on the individual slices, so results match bit for bit.
+    """
+    lengths = end_frames - start_frames
+    means = np.empty(len(lengths), dtype=values.dtype)
+    for length in np.unique(lengths):
+        rows = np.flatnonzero(lengths == length)
+        means[rows] = np.mean(values[start_frames[rows, None] + np.arange(length)], axis=1)
+    return means
+
 def analyze_beat_energy(y, sr, beat_times):
     """
     Analyze energy between every 2 beats
@@ -35,54 +56,72 @@ def analyze_beat_energy(y, sr, beat_times):
     spectral_centroids = gaussian_filter1d(spectral_centroids, sigma=1)
     rms_energy = gaussian_filter1d(rms_energy, sigma=1)
     
+    return aggregate_beat_energy(rms_energy, spectral_centroids, zero_crossing_rate, sr, beat_times, hop_length)
+
+def aggregate_beat_energy(rms_energy, spectral_centroids, zero_crossing_rate, sr, beat_times, hop_length=512):
+    """
+    Average frame-level features over every beat segment in bulk
+    
+    Args:
+        rms_energy: smoothed RMS per frame
+        spectral_centroids: smoothed spectral centroid per frame
+        zero_crossing_rate: zero crossing rate per frame
+        sr: sample rate
+        beat_times: array of beat timestamps
+        hop_length: hop between frames (samples)
+    
+    Returns:
+        list of segments with energy scores
+    """
     # Convert to time frames for indexing
     time_frames = librosa.frames_to_time(range(len(rms_energy)), sr=sr, hop_length=hop_length)
     
-    segments = []
+    beat_times = np.asarray(beat_times)
+    if len(beat_times) < 2 or len(time_frames) < 2:
+        return []
     
-    # Process every single beat
-    for i in range(len(beat_times) - 1):
-        start_time = beat_times[i]
-        end_time = beat_times[i + 1] if i + 1 < len(beat_times) else beat_times[i] + (beat_times[i] - beat_times[i-1])
-        
-        # Find frame indices for this time range
-        start_frame = np.argmin(np.abs(time_frames - start_time))
-        end_frame = np.argmin(np.abs(time_frames - end_time))
-        
-        if start_frame >= end_frame:
-            continue
-            
-        # Calculate average features for this segment
-        segment_rms = np.mean(rms_energy[start_frame:end_frame])
-        segment_centroid = np.mean(spectral_centroids[start_frame:end_frame])
-        segment_zcr = np.mean(zero_crossing_rate[start_frame:end_frame])
-        
-        # Composite energy score
-        """
-        if vocals, rms=0.3, centroid =0.2, zcr= 0.5, 
-        if drums, rms = 0.7, centroid=0.2, zcr=0.1,
-        instruments, rms=0.4, c=0.6, zcr=0.0
-        for whole assortment
-        use 0.4, 0.4, 0.2
-        """
-        silence_threshold = 0.01 * np.max(rms_energy)  # 1% of max RMS
-        if segment_rms < silence_threshold:
-            energy_score = 0.0  # Force silent segments to zero energy
-        else:
-            energy_score = (
-                0.4 * (segment_rms / np.max(rms_energy)) +
-                0.4 * (segment_centroid / np.max(spectral_centroids)) +
-                0.2 * (segment_zcr / np.max(zero_crossing_rate))
-                    )
-        
+    # Find frame indices for every beat boundary in one pass
+    boundary_frames = _nearest_frames(time_frames, beat_times)
+    start_frames = boundary_frames[:-1]
+    end_frames = boundary_frames[1:]
+    
+    # Beats that collapse onto a single frame carry no audio, skip them
+    beat_idx = np.flatnonzero(start_frames < end_frames)
+    start_frames = start_frames[beat_idx]
+    end_frames = end_frames[beat_idx]
+    
+    # Calculate average features for every segment
+    segment_rms = _segment_means(rms_energy, start_frames, end_frames)
+    segment_centroid = _segment_means(spectral_centroids, start_frames, end_frames)
+    segment_zcr = _segment_means(zero_crossing_rate, start_frames, end_frames)
+    
+    # Composite energy score
+    """
+    if vocals, rms=0.3, centroid =0.2, zcr= 0.5, 
+    if drums, rms = 0.7, centroid=0.2, zcr=0.1,
+    instruments, rms=0.4, c=0.6, zcr=0.0
+    for whole assortment
+    use 0.4, 0.4, 0.2
+    """
+    max_rms = np.max(rms_energy)
+    silence_threshold = 0.01 * max_rms  # 1% of max RMS
+    energy_scores = (
+        0.4 * (segment_rms / max_rms) +
+        0.4 * (segment_centroid / np.max(spectral_centroids)) +
+        0.2 * (segment_zcr / np.max(zero_crossing_rate))
+            )
+    energy_scores[segment_rms < silence_threshold] = 0.0  # Force silent segments to zero energy
+    
+    segments = []
+    for k, i in enumerate(beat_idx):
         segments.append({
-            'start_time': start_time,
-            'end_time': end_time,
-            'energy': energy_score,
-            'beat_number': i + 1,
-            'rms': segment_rms,
-            'centroid': segment_centroid,
-            'zcr': segment_zcr  # Added ZCR to the segment data
+            'start_time': beat_times[i],
+            'end_time': beat_times[i + 1],
+            'energy': energy_scores[k],
+            'beat_number': int(i) + 1,
+            'rms': segment_rms[k],
+            'centroid': segment_centroid[k],
+            'zcr': segment_zcr[k]  # Added ZCR to the segment data
         })
     
     return segments
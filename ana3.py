@@ -1,18 +1,188 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from functools import cached_property
 import librosa
 import numpy as np
 from scipy.ndimage import gaussian_filter1d
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+import analysis_cache
+import audio_cache
 
+# Beat segments, neighborhoods and transitions are kept as structured arrays (one row per
+# beat / neighborhood / transition); neighborhoods reference their beats as [start, stop)
+# index ranges. segment_records / neighborhood_records / transition_records give the old
+# list-of-dicts view.
+SEGMENT_DTYPE = np.dtype([
+    ('beat_number', np.int64),
+    ('start_time', np.float64),
+    ('end_time', np.float64),
+    ('energy', np.float64),
+    ('rms', np.float32),
+    ('centroid', np.float64),
+    ('zcr', np.float64),
+    ('high_energy', np.bool_),           # classification
+    ('smoothed_high_energy', np.bool_)   # classification after hysteresis
+])
+NEIGHBORHOOD_DTYPE = np.dtype([
+    ('neighborhood_id', np.int64),
+    ('start', np.int64),
+    ('stop', np.int64),
+    ('high_energy', np.bool_),
+    ('start_time', np.float64),
+    ('end_time', np.float64),
+    ('duration', np.float64),
+    ('avg_energy', np.float64)
+])
+TRANSITION_DTYPE = np.dtype([
+    ('beat_number', np.int64),
+    ('time', np.float64),
+    ('spike', np.bool_),  # SPIKE (verse to chorus) or FALL (chorus to verse)
+    ('energy_change', np.float64),
+    ('relative_change', np.float64),
+    ('current_energy', np.float64),
+    ('baseline_energy', np.float64)
+])
 
-def detect_beats(audio_file):
-    """Detect beat timing in an audio file"""
-    y, sr = librosa.load(audio_file)
-    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr, hop_length=512)
-    beat_times = librosa.frames_to_time(beat_frames, sr=sr, hop_length=512)
+
+FEATURE_NAMES = ('onset_envelope', 'spectral_centroids', 'rms_energy', 'zero_crossing_rate')
+
+def run_task_graph(tasks, serial=False, max_workers=None):
+    """
+    Run a small dependency graph of analysis steps, independent steps concurrently
+    
+    Args:
+        tasks: {name: (function, [dependency names])}; each function is called with the
+               results of its dependencies, in order, as positional arguments
+        serial: run everything on the calling thread, one step at a time (for debugging
+                and for callers that already parallelise across songs)
+        max_workers: thread pool size (default: one per core, at most one per step);
+                     with a single worker the steps run serially on the calling thread
+    
+    Returns:
+        {name: result} for every step
+    
+    The heavy steps (FFTs, librosa's compiled beat tracker) spend most of their time
+    outside the GIL, so threads are enough to overlap them.
+    """
+    results = {}
+    remaining = dict(tasks)
+    workers = max_workers or min(len(tasks), os.cpu_count() or 1)
+    
+    def ready():
+        return [name for name, (_, deps) in remaining.items() if all(dep in results for dep in deps)]
+    
+    if serial or workers <= 1:
+        while remaining:
+            names = ready()
+            if not names:
+                raise ValueError(f"Task graph has a cycle or a missing dependency: {', '.join(remaining)}")
+            for name in names:
+                function, deps = remaining.pop(name)
+                results[name] = function(*[results[dep] for dep in deps])
+        return results
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        while remaining or running:
+            for name in ready():
+                function, deps = remaining.pop(name)
+                running[pool.submit(function, *[results[dep] for dep in deps])] = name
+            if not running:
+                raise ValueError(f"Task graph has a cycle or a missing dependency: {', '.join(remaining)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    return results
+
+def feature_tasks(y, sr, hop_length=512, n_fft=2048, prefix=''):
+    """
+    Steps computing extract_features' arrays, as run_task_graph entries
+    
+    One magnitude spectrogram gives the spectral centroid and the onset strength
+    envelope used for beat tracking; one framing of the waveform gives RMS, and the
+    zero crossing rate is counted from a running sum of sign changes on the same grid.
+    prefix namespaces the step names so the graphs of two signals can be merged.
+    """
+    def onset_envelope(S):
+        mel = librosa.feature.melspectrogram(S=S**2, sr=sr)
+        return librosa.onset.onset_strength(S=librosa.power_to_db(mel), sr=sr, hop_length=hop_length,
+                                            n_fft=n_fft, aggregate=np.median)
+    
+    n_frames = 1 + len(y) // hop_length  # centered framing, as librosa's features use
+    return {
+        prefix + 'spectrogram': (lambda: np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length)), []),
+        prefix + 'onset_envelope': (onset_envelope, [prefix + 'spectrogram']),
+        prefix + 'spectral_centroids': (lambda S: librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=n_fft,
+                                                                                    hop_length=hop_length)[0],
+                                        [prefix + 'spectrogram']),
+        prefix + 'rms_energy': (lambda: librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length)[0], []),
+        prefix + 'zero_crossing_rate': (lambda: _zero_crossing_rate(y, n_frames, n_fft, hop_length), [])
+    }
+
+def extract_features(y, sr, hop_length=512, n_fft=2048, serial=True):
+    """
+    Compute every frame-level feature of the pipeline from a single transform pass
+    
+    Args:
+        y: audio signal
+        sr: sample rate
+        hop_length: hop between frames (samples)
+        n_fft: frame / FFT length (samples)
+        serial: False runs the independent features concurrently (see run_task_graph)
+    
+    Returns:
+        dict of per-frame feature arrays plus the framing parameters
+    """
+    results = run_task_graph(feature_tasks(y, sr, hop_length, n_fft), serial=serial)
+    return {'sr': sr, 'hop_length': hop_length, 'n_fft': n_fft,
+            **{name: results[name] for name in FEATURE_NAMES}}
+
+def _zero_crossing_rate(y, n_frames, frame_length, hop_length, threshold=1e-10):
+    """Same values as librosa.feature.zero_crossing_rate (centered, edge padded) without framing the signal"""
+    y = np.where(np.abs(y) <= threshold, 0, y)
+    crossings = np.signbit(y[1:]) != np.signbit(y[:-1])
+    # counts[j] = number of crossings between consecutive samples up to sample j
+    counts = np.concatenate(([0], np.cumsum(crossings)))
+    
+    # Frame f spans samples f*hop - frame_length//2 ... + frame_length - 1; its first sample has no predecessor in the frame
+    frame_starts = np.arange(n_frames) * hop_length - frame_length // 2
+    first = np.clip(frame_starts, 0, len(y) - 1)
+    last = np.clip(frame_starts + frame_length - 1, 0, len(y) - 1)
+    return (counts[last] - counts[first]) / frame_length
+
+def detect_beats(audio_file, y=None, sr=None, features=None):
+    """Detect beat timing in an audio file (reuses a loaded signal and its features when given)"""
+    if y is None:
+        y, sr = audio_cache.load_analysis_audio(audio_file)
+    if features is None:
+        features = extract_features(y, sr)
+    hop_length = features['hop_length']
+    tempo, beat_frames = librosa.beat.beat_track(onset_envelope=features['onset_envelope'], sr=sr, hop_length=hop_length)
+    beat_times = librosa.frames_to_time(beat_frames, sr=sr, hop_length=hop_length)
     return beat_times, tempo, beat_frames, y, sr
 
-def analyze_beat_energy(y, sr, beat_times):
+def _nearest_frames(time_frames, times):
+    """Map each time to the index of the closest frame (ties go to the earlier frame)"""
+    right = np.clip(np.searchsorted(time_frames, times), 1, len(time_frames) - 1)
+    left = right - 1
+    take_left = np.abs(time_frames[left] - times) <= np.abs(time_frames[right] - times)
+    return np.where(take_left, left, right)
+
+def _segment_means(values, start_frames, end_frames):
+    """
+    Mean of values[start:end] for every (start, end) pair
+    
+    Segments are grouped by length so each group is reduced in one call; this keeps
+    the summation order of np.mean on the individual slices, so results match bit for bit.
+    """
+    lengths = end_frames - start_frames
+    means = np.empty(len(lengths), dtype=values.dtype)
+    for length in np.unique(lengths):
+        rows = np.flatnonzero(lengths == length)
+        means[rows] = np.mean(values[start_frames[rows, None] + np.arange(length)], axis=1)
+    return means
+
+def analyze_beat_energy(y, sr, beat_times, features=None):
     """
     Analyze energy between every 2 beats
     
@@ -20,88 +190,147 @@ def analyze_beat_energy(y, sr, beat_times):
         y: audio signal
         sr: sample rate
         beat_times: array of beat timestamps
+        features: output of extract_features for y (computed here if omitted)
     
     Returns:
-        list of segments with energy classification
+        SEGMENT_DTYPE array of beat segments with energy scores
     """
-    hop_length = 512
-    
-    # Calculate audio features for entire track
-    spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop_length)[0]
-    rms_energy = librosa.feature.rms(y=y, hop_length=hop_length)[0]
-    zero_crossing_rate = librosa.feature.zero_crossing_rate(y, hop_length=hop_length)[0]
+    if features is None:
+        features = extract_features(y, sr)
+    hop_length = features['hop_length']
+    zero_crossing_rate = features['zero_crossing_rate']
     
     # Smooth features
-    spectral_centroids = gaussian_filter1d(spectral_centroids, sigma=1)
-    rms_energy = gaussian_filter1d(rms_energy, sigma=1)
+    spectral_centroids = gaussian_filter1d(features['spectral_centroids'], sigma=1)
+    rms_energy = gaussian_filter1d(features['rms_energy'], sigma=1)
+    
+    return aggregate_beat_energy(rms_energy, spectral_centroids, zero_crossing_rate, sr, beat_times, hop_length)
+
+def aggregate_beat_energy(rms_energy, spectral_centroids, zero_crossing_rate, sr, beat_times, hop_length=512):
+    """
+    Average frame-level features over every beat segment in bulk
+    
+    Args:
+        rms_energy: smoothed RMS per frame
+        spectral_centroids: smoothed spectral centroid per frame
+        zero_crossing_rate: zero crossing rate per frame
+        sr: sample rate
+        beat_times: array of beat timestamps
+        hop_length: hop between frames (samples)
     
+    Returns:
+        SEGMENT_DTYPE array of beat segments with energy scores
+    """
     # Convert to time frames for indexing
     time_frames = librosa.frames_to_time(range(len(rms_energy)), sr=sr, hop_length=hop_length)
     
-    segments = []
+    beat_times = np.asarray(beat_times)
+    if len(beat_times) < 2 or len(time_frames) < 2:
+        return segment_table()
     
-    # Process every single beat
-    for i in range(len(beat_times) - 1):
-        start_time = beat_times[i]
-        end_time = beat_times[i + 1] if i + 1 < len(beat_times) else beat_times[i] + (beat_times[i] - beat_times[i-1])
-        
-        # Find frame indices for this time range
-        start_frame = np.argmin(np.abs(time_frames - start_time))
-        end_frame = np.argmin(np.abs(time_frames - end_time))
-        
-        if start_frame >= end_frame:
-            continue
-            
-        # Calculate average features for this segment
-        segment_rms = np.mean(rms_energy[start_frame:end_frame])
-        segment_centroid = np.mean(spectral_centroids[start_frame:end_frame])
-        segment_zcr = np.mean(zero_crossing_rate[start_frame:end_frame])
-        
-        # Composite energy score
-        """
-        if vocals, rms=0.3, centroid =0.2, zcr= 0.5, 
-        if drums, rms = 0.7, centroid=0.2, zcr=0.1,
-        instruments, rms=0.4, c=0.6, zcr=0.0
-        for whole assortment
-        use 0.4, 0.4, 0.2
-        """
-        silence_threshold = 0.01 * np.max(rms_energy)  # 1% of max RMS
-        if segment_rms < silence_threshold:
-            energy_score = 0.0  # Force silent segments to zero energy
-        else:
-            energy_score = (
-                0.4 * (segment_rms / np.max(rms_energy)) +
-                0.4 * (segment_centroid / np.max(spectral_centroids)) +
-                0.2 * (segment_zcr / np.max(zero_crossing_rate))
-                    )
-        
-        segments.append({
-            'start_time': start_time,
-            'end_time': end_time,
-            'energy': energy_score,
-            'beat_number': i + 1,
-            'rms': segment_rms,
-            'centroid': segment_centroid,
-            'zcr': segment_zcr  # Added ZCR to the segment data
-        })
+    # Find frame indices for every beat boundary in one pass
+    boundary_frames = _nearest_frames(time_frames, beat_times)
+    start_frames = boundary_frames[:-1]
+    end_frames = boundary_frames[1:]
+    
+    # Beats that collapse onto a single frame carry no audio, skip them
+    beat_idx = np.flatnonzero(start_frames < end_frames)
+    start_frames = start_frames[beat_idx]
+    end_frames = end_frames[beat_idx]
+    
+    # Calculate average features for every segment
+    segment_rms = _segment_means(rms_energy, start_frames, end_frames)
+    segment_centroid = _segment_means(spectral_centroids, start_frames, end_frames)
+    segment_zcr = _segment_means(zero_crossing_rate, start_frames, end_frames)
+    
+    energy_scores = energy_score(segment_rms, segment_centroid, segment_zcr,
+                                 np.max(rms_energy), np.max(spectral_centroids), np.max(zero_crossing_rate))
     
+    return segment_table(beat_idx + 1, beat_times[beat_idx], beat_times[beat_idx + 1], energy_scores,
+                         segment_rms, segment_centroid, segment_zcr)
+
+def segment_table(beat_number=(), start_time=(), end_time=(), energy=(), rms=(), centroid=(), zcr=()):
+    """Build a SEGMENT_DTYPE array from per-beat columns (not yet classified)"""
+    segments = np.zeros(len(beat_number), dtype=SEGMENT_DTYPE)
+    segments['beat_number'] = beat_number
+    segments['start_time'] = start_time
+    segments['end_time'] = end_time
+    segments['energy'] = energy
+    segments['rms'] = rms
+    segments['centroid'] = centroid
+    segments['zcr'] = zcr
     return segments
 
-def classify_beat_segments(segments, threshold=0.5):
-    """Classify beat segments as high or low energy"""
-    energies = [seg['energy'] for seg in segments]
-    #energy_threshold = np.percentile(energies, threshold * 100)
-    energy_threshold = np.median(energies)  
+def classification_label(high_energy):
+    return 'HIGH_ENERGY' if high_energy else 'LOW_ENERGY'
+
+def segment_records(segments, classified=True, smoothed=False):
+    """
+    List-of-dicts view of a segment array, in the shape the pipeline used before it went columnar
     
-    classified = []
+    Args:
+        segments: SEGMENT_DTYPE array
+        classified: include the 'classification' key
+        smoothed: report the hysteresis classification, with the raw one as 'original_classification'
+    """
+    records = []
     for seg in segments:
-        classification = 'HIGH_ENERGY' if seg['energy'] >= energy_threshold else 'LOW_ENERGY'
-        
-        classified.append({
-            **seg,
-            'classification': classification
-        })
+        record = {
+            'start_time': seg['start_time'],
+            'end_time': seg['end_time'],
+            'energy': seg['energy'],
+            'beat_number': int(seg['beat_number']),
+            'rms': seg['rms'],
+            'centroid': seg['centroid'],
+            'zcr': seg['zcr']
+        }
+        if smoothed:
+            record['classification'] = classification_label(seg['smoothed_high_energy'])
+            record['original_classification'] = classification_label(seg['high_energy'])
+        elif classified:
+            record['classification'] = classification_label(seg['high_energy'])
+        records.append(record)
+    return records
+
+def neighborhood_records(neighborhoods, segments):
+    """List-of-dicts view of a neighborhood array; each dict carries its (smoothed) segment dicts"""
+    smoothed = segment_records(segments, smoothed=True)
+    return [{
+        'classification': classification_label(n['high_energy']),
+        'start_time': n['start_time'],
+        'end_time': n['end_time'],
+        'segments': smoothed[n['start']:n['stop']],
+        'neighborhood_id': int(n['neighborhood_id']),
+        'duration': n['duration'],
+        'avg_energy': n['avg_energy']
+    } for n in neighborhoods]
+
+def energy_score(segment_rms, segment_centroid, segment_zcr, max_rms, max_centroid, max_zcr):
+    """Composite energy score per segment, normalised by the track-wide feature maxima"""
+    """
+    if vocals, rms=0.3, centroid =0.2, zcr= 0.5, 
+    if drums, rms = 0.7, centroid=0.2, zcr=0.1,
+    instruments, rms=0.4, c=0.6, zcr=0.0
+    for whole assortment
+    use 0.4, 0.4, 0.2
+    """
+    silence_threshold = 0.01 * max_rms  # 1% of max RMS
+    energy_scores = (
+        0.4 * (segment_rms / max_rms) +
+        0.4 * (segment_centroid / max_centroid) +
+        0.2 * (segment_zcr / max_zcr)
+            )
+    energy_scores[segment_rms < silence_threshold] = 0.0  # Force silent segments to zero energy
+    return energy_scores
+
+def classify_beat_segments(segments, threshold=0.5):
+    """Classify beat segments as high or low energy"""
+    #energy_threshold = np.percentile(segments['energy'], threshold * 100)
+    energy_threshold = np.median(segments['energy'])
     
+    classified = segments.copy()
+    classified['high_energy'] = segments['energy'] >= energy_threshold
+    classified['smoothed_high_energy'] = classified['high_energy']
     return classified
 
 def identify_energy_neighborhoods(classified_segments, min_section_duration=8.0, hysteresis_factor=0.15,enable_merging=False):
@@ -110,257 +339,213 @@ def identify_energy_neighborhoods(classified_segments, min_section_duration=8.0,
     Every beat is analyzed but short sections are merged to create meaningful song structure
     
     Args:
-        classified_segments: list of classified beat segments
+        classified_segments: SEGMENT_DTYPE array of classified beat segments; its
+                             smoothed_high_energy column is filled in here
         min_section_duration: minimum duration for a musical section (seconds)
         hysteresis_factor: additional threshold to prevent rapid switching
     
     Returns:
-        list of energy neighborhoods representing song structure
+        NEIGHBORHOOD_DTYPE array of energy neighborhoods representing song structure
     """
-    if not classified_segments:
-        return []
+    if not len(classified_segments):
+        return np.zeros(0, dtype=NEIGHBORHOOD_DTYPE)
     
     # First pass: apply hysteresis to reduce rapid switching
-    smoothed_segments = apply_energy_hysteresis(classified_segments, hysteresis_factor)
+    classified_segments['smoothed_high_energy'] = apply_energy_hysteresis(classified_segments, hysteresis_factor)
     
     # Second pass: create initial neighborhoods
-    initial_neighborhoods = create_initial_neighborhoods(smoothed_segments)
+    initial_neighborhoods = create_initial_neighborhoods(classified_segments)
     
     if enable_merging:
     # Third pass: merge short sections to meet minimum duration
-        final_neighborhoods = merge_short_neighborhoods(initial_neighborhoods, min_section_duration)
+        final_neighborhoods = merge_short_neighborhoods(initial_neighborhoods, classified_segments, min_section_duration)
     else:
         final_neighborhoods = initial_neighborhoods
     
     # Assign final IDs
-    for i, neighborhood in enumerate(final_neighborhoods):
-        neighborhood['neighborhood_id'] = i + 1
-        neighborhood['duration'] = neighborhood['end_time'] - neighborhood['start_time']
-        neighborhood['avg_energy'] = np.mean([s['energy'] for s in neighborhood['segments']])
+    energy = classified_segments['energy']
+    final_neighborhoods['neighborhood_id'] = np.arange(1, len(final_neighborhoods) + 1)
+    final_neighborhoods['duration'] = final_neighborhoods['end_time'] - final_neighborhoods['start_time']
+    final_neighborhoods['avg_energy'] = _segment_means(energy, final_neighborhoods['start'], final_neighborhoods['stop'])
     
     return final_neighborhoods
 
 def apply_energy_hysteresis(classified_segments, hysteresis_factor):
-    """Apply hysteresis to prevent rapid energy classification switching"""
-    if not classified_segments:
-        return []
+    """
+    Apply hysteresis to prevent rapid energy classification switching
+    
+    Returns:
+        smoothed high-energy flag per segment
+    """
+    if not len(classified_segments):
+        return np.zeros(0, dtype=bool)
     
     # Calculate energy threshold with hysteresis bands
-    energies = [seg['energy'] for seg in classified_segments]
+    energies = classified_segments['energy']
     base_threshold = np.percentile(energies, 50)  # median
     
     high_threshold = base_threshold * (1 + hysteresis_factor)
     low_threshold = base_threshold * (1 - hysteresis_factor)
     
-    smoothed = []
-    current_state = classified_segments[0]['classification']
-    
-    for segment in classified_segments:
-        original_energy = segment['energy']
-        
-        # Apply hysteresis logic
-        if current_state == 'LOW_ENERGY':
-            # Need to exceed high threshold to switch to high energy
-            new_classification = 'HIGH_ENERGY' if original_energy > high_threshold else 'LOW_ENERGY'
-        else:  # current_state == 'HIGH_ENERGY'
-            # Need to drop below low threshold to switch to low energy
-            new_classification = 'LOW_ENERGY' if original_energy < low_threshold else 'HIGH_ENERGY'
-        
-        current_state = new_classification
-        
-        # Create smoothed segment
-        smoothed_segment = segment.copy()
-        smoothed_segment['classification'] = new_classification
-        smoothed_segment['original_classification'] = segment['classification']
-        smoothed.append(smoothed_segment)
-    
+    # Above the high band always switches to (or stays) high, below the low band always
+    # to low; in between the previous state holds, starting from the first classification
+    decided = (energies > high_threshold) | (energies < low_threshold)
+    last_decided = np.maximum.accumulate(np.where(decided, np.arange(len(energies)), -1))
+    smoothed = energies[last_decided] > high_threshold
+    smoothed[last_decided < 0] = classified_segments['high_energy'][0]
     return smoothed
 
 def create_initial_neighborhoods(segments):
-    """Create initial neighborhoods from consecutive same-classification segments"""
-    if not segments:
-        return []
-    
-    neighborhoods = []
-    current_neighborhood = {
-        'classification': segments[0]['classification'],
-        'start_time': segments[0]['start_time'],
-        'end_time': segments[0]['end_time'],
-        'segments': [segments[0]]
-    }
-    
-    for segment in segments[1:]:
-        if segment['classification'] == current_neighborhood['classification']:
-            # Extend current neighborhood
-            current_neighborhood['end_time'] = segment['end_time']
-            current_neighborhood['segments'].append(segment)
-        else:
-            # Finalize current neighborhood
-            neighborhoods.append(current_neighborhood)
-            
-            # Start new neighborhood
-            current_neighborhood = {
-                'classification': segment['classification'],
-                'start_time': segment['start_time'],
-                'end_time': segment['end_time'],
-                'segments': [segment]
-            }
-    
-    # Add final neighborhood
-    neighborhoods.append(current_neighborhood)
+    """Create initial neighborhoods from runs of consecutive same-classification segments"""
+    smoothed = segments['smoothed_high_energy']
+    starts = np.flatnonzero(np.concatenate(([True], smoothed[1:] != smoothed[:-1])))
+    stops = np.append(starts[1:], len(segments))
+    
+    neighborhoods = np.zeros(len(starts), dtype=NEIGHBORHOOD_DTYPE)
+    neighborhoods['start'] = starts
+    neighborhoods['stop'] = stops
+    neighborhoods['high_energy'] = smoothed[starts]
+    neighborhoods['start_time'] = segments['start_time'][starts]
+    neighborhoods['end_time'] = segments['end_time'][stops - 1]
     return neighborhoods
 
-def merge_short_neighborhoods(neighborhoods, min_duration):
-    """Merge neighborhoods that are shorter than minimum duration"""
-    if not neighborhoods:
-        return []
+def merge_short_neighborhoods(neighborhoods, segments, min_duration):
+    """
+    Merge neighborhoods that are shorter than minimum duration
     
-    merged = []
+    Runs in one linear pass: merged neighborhoods are contiguous ranges of the input,
+    so their mean energy is read off prefix sums instead of re-averaging their segments.
+    """
+    if not len(neighborhoods):
+        return neighborhoods
+    
+    columns = {name: neighborhoods[name].tolist() for name in ('start_time', 'end_time', 'start', 'stop')}
+    energy_prefix = np.concatenate(([0.0], np.cumsum(segments['energy']))).tolist()
     used = [False] * len(neighborhoods)  # Track which neighborhoods have been consumed
+    first, last = [], []  # range of input neighborhoods behind each merged one
     
-    i = 0
-    while i < len(neighborhoods):
+    for i in range(len(neighborhoods)):
         if used[i]:
-            i += 1
             continue
-            
-        current = neighborhoods[i]
-        current_duration = current['end_time'] - current['start_time']
+        
+        current_duration = columns['end_time'][i] - columns['start_time'][i]
         
         if current_duration >= min_duration:
             # Neighborhood is long enough, keep as is
-            merged.append(current)
-            used[i] = True
-            i += 1
+            consumed = (i, i)
         else:
             # Neighborhood is too short, merge with adjacent ones
-            merged_neighborhood, consumed_indices = expand_neighborhood_to_min_duration(
-                neighborhoods, i, min_duration, used)
-            
-            # Mark all consumed neighborhoods as used
-            for idx in consumed_indices:
-                used[idx] = True
-            
-            merged.append(merged_neighborhood)
-            i += 1
-    
+            consumed = expand_neighborhood_to_min_duration(columns, energy_prefix, i, min_duration, used)
+        
+        # Mark all consumed neighborhoods as used
+        for idx in range(consumed[0], consumed[1] + 1):
+            used[idx] = True
+        first.append(consumed[0])
+        last.append(consumed[1])
+    
+    first = np.array(first, dtype=np.int64)
+    last = np.array(last, dtype=np.int64)
+    merged = neighborhoods[first]
+    merged['stop'] = neighborhoods['stop'][last]
+    merged['end_time'] = neighborhoods['end_time'][last]
+    
+    # Final classification is the majority of the consumed neighborhoods (ties go to high energy)
+    high_prefix = np.concatenate(([0], np.cumsum(neighborhoods['high_energy'])))
+    high_count = high_prefix[last + 1] - high_prefix[first]
+    merged['high_energy'] = 2 * high_count >= last - first + 1
     return merged
 
-def expand_neighborhood_to_min_duration(neighborhoods, center_idx, min_duration, used):
-    """Expand a neighborhood in both directions until minimum duration is reached"""
+def expand_neighborhood_to_min_duration(columns, energy_prefix, center_idx, min_duration, used):
+    """
+    Expand a neighborhood in both directions until minimum duration is reached
+    
+    Args:
+        columns: neighborhood start_time, end_time, start and stop as lists
+        energy_prefix: prefix sums of segment energy (energy_prefix[k] = sum of the first k)
+        center_idx: neighborhood to expand
+        min_duration: minimum duration (seconds)
+        used: flags of neighborhoods already consumed
+    
+    Returns:
+        (first, last) indices of the consumed neighborhoods, or None if center_idx is used
+    """
     if used[center_idx]:
-        return None, []
-    
-    # Start with center neighborhood
-    merged = {
-        'classification': neighborhoods[center_idx]['classification'],
-        'start_time': neighborhoods[center_idx]['start_time'],
-        'end_time': neighborhoods[center_idx]['end_time'],
-        'segments': neighborhoods[center_idx]['segments'][:]
-    }
+        return None
+    
+    def mean_energy(first, last):
+        start, stop = columns['start'][first], columns['stop'][last]
+        return (energy_prefix[stop] - energy_prefix[start]) / (stop - start)
     
-    consumed_indices = [center_idx]
-    left_idx = center_idx - 1
-    right_idx = center_idx + 1
+    first = last = center_idx
+    start_time = columns['start_time'][center_idx]
+    end_time = columns['end_time'][center_idx]
     
     # Expand until we reach minimum duration
-    while (merged['end_time'] - merged['start_time']) < min_duration:
-        can_extend_left = left_idx >= 0 and not used[left_idx]
-        can_extend_right = right_idx < len(neighborhoods) and not used[right_idx]
+    while (end_time - start_time) < min_duration:
+        can_extend_left = first > 0 and not used[first - 1]
+        can_extend_right = last + 1 < len(used) and not used[last + 1]
         
         if not can_extend_left and not can_extend_right:
             break
         
         # Prefer extending in direction with more similar energy
         if can_extend_left and can_extend_right:
-            left_energy = np.mean([s['energy'] for s in neighborhoods[left_idx]['segments']])
-            right_energy = np.mean([s['energy'] for s in neighborhoods[right_idx]['segments']])
-            current_energy = np.mean([s['energy'] for s in merged['segments']])
-            
-            left_similarity = abs(left_energy - current_energy)
-            right_similarity = abs(right_energy - current_energy)
+            current_energy = mean_energy(first, last)
+            left_similarity = abs(mean_energy(first - 1, first - 1) - current_energy)
+            right_similarity = abs(mean_energy(last + 1, last + 1) - current_energy)
             extend_left = left_similarity <= right_similarity
         else:
             extend_left = can_extend_left
         
         if extend_left:
-            # Extend leftward
-            left_neighbor = neighborhoods[left_idx]
-            merged['start_time'] = left_neighbor['start_time']
-            merged['segments'] = left_neighbor['segments'] + merged['segments']
-            consumed_indices.append(left_idx)
-            left_idx -= 1
+            first -= 1
+            start_time = columns['start_time'][first]
         else:
-            # Extend rightward  
-            right_neighbor = neighborhoods[right_idx]
-            merged['end_time'] = right_neighbor['end_time']
-            merged['segments'] = merged['segments'] + right_neighbor['segments']
-            consumed_indices.append(right_idx)
-            right_idx += 1
+            last += 1
+            end_time = columns['end_time'][last]
     
-    # Determine final classification based on majority of segments
-    classifications = [neighborhoods[idx]['classification'] for idx in consumed_indices]
-    high_count = classifications.count('HIGH_ENERGY')
-    low_count = classifications.count('LOW_ENERGY')
-    merged['classification'] = 'HIGH_ENERGY' if high_count >= low_count else 'LOW_ENERGY'
-    
-    return merged, consumed_indices
+    return first, last
 
 def detect_energy_transitions(classified_segments, spike_threshold=0.3, lookback_window=3):
     """
     Detect sharp spikes and falls in energy that indicate verse/chorus transitions
     
     Args:
-        classified_segments: list of classified beat segments
+        classified_segments: SEGMENT_DTYPE array of classified beat segments
         spike_threshold: minimum energy change to consider a transition
         lookback_window: number of beats to look back for comparison
     
     Returns:
-        list of energy transitions (spikes and falls)
+        TRANSITION_DTYPE array of energy transitions (spikes and falls)
     """
     if len(classified_segments) < lookback_window + 1:
-        return []
-    
-    transitions = []
-    
-    for i in range(lookback_window, len(classified_segments)):
-        current_energy = classified_segments[i]['energy']
-        
-        # Calculate baseline energy from lookback window
-        baseline_energies = [classified_segments[j]['energy'] 
-                           for j in range(i - lookback_window, i)]
-        baseline_energy = np.mean(baseline_energies)
-        
-        # Calculate energy change
-        energy_change = current_energy - baseline_energy
-        relative_change = energy_change / baseline_energy if baseline_energy > 0 else 0
-        
-        # Detect significant transitions
-        if abs(relative_change) >= spike_threshold:
-            transition_type = 'SPIKE' if energy_change > 0 else 'FALL'
-            
-            # Determine likely musical transition
-            if transition_type == 'SPIKE':
-                musical_transition = 'VERSE_TO_CHORUS'
-                description = f"Energy spike (+{relative_change:.1%}) - likely verse to chorus"
-            else:
-                musical_transition = 'CHORUS_TO_VERSE'
-                description = f"Energy fall ({relative_change:.1%}) - likely chorus to verse"
-            
-            transition = {
-                'beat_number': classified_segments[i]['beat_number'],
-                'time': classified_segments[i]['start_time'],
-                'transition_type': transition_type,
-                'musical_transition': musical_transition,
-                'energy_change': energy_change,
-                'relative_change': relative_change,
-                'current_energy': current_energy,
-                'baseline_energy': baseline_energy,
-                'description': description
-            }
-            
-            transitions.append(transition)
-    
+        return np.zeros(0, dtype=TRANSITION_DTYPE)
+    
+    energy = classified_segments['energy']
+    current_energy = energy[lookback_window:]
+    
+    # Baseline energy from the lookback window of every beat at once; averaging each
+    # window row keeps np.mean's summation order, so values match the per-beat mean
+    windows = np.lib.stride_tricks.sliding_window_view(energy, lookback_window)[:-1]
+    baseline_energy = np.mean(windows, axis=1)
+    
+    # Calculate energy change
+    energy_change = current_energy - baseline_energy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative_change = np.where(baseline_energy > 0, energy_change / baseline_energy, 0.0)
+    
+    # Detect significant transitions
+    hits = np.flatnonzero(np.abs(relative_change) >= spike_threshold)
+    segment_idx = hits + lookback_window
+    
+    transitions = np.zeros(len(hits), dtype=TRANSITION_DTYPE)
+    transitions['beat_number'] = classified_segments['beat_number'][segment_idx]
+    transitions['time'] = classified_segments['start_time'][segment_idx]
+    transitions['spike'] = energy_change[hits] > 0
+    transitions['energy_change'] = energy_change[hits]
+    transitions['relative_change'] = relative_change[hits]
+    transitions['current_energy'] = current_energy[hits]
+    transitions['baseline_energy'] = baseline_energy[hits]
     return transitions
 
 def refine_transitions(transitions, min_time_gap=5.0):
@@ -369,165 +554,72 @@ def refine_transitions(transitions, min_time_gap=5.0):
     Keep the strongest transition in each time window
     
     Args:
-        transitions: list of detected transitions
+        transitions: TRANSITION_DTYPE array of detected transitions
         min_time_gap: minimum time between transitions (seconds)
     
     Returns:
-        filtered list of significant transitions
+        TRANSITION_DTYPE array of significant transitions
     """
-    if not transitions:
-        return []
+    if not len(transitions):
+        return transitions
     
-    refined = []
-    last_time = -float('inf')
-    
-    # Sort by time
-    transitions_sorted = sorted(transitions, key=lambda x: x['time'])
+    # Sort by time (a no-op for detect_energy_transitions output, which is in beat order)
+    transitions = transitions[np.argsort(transitions['time'], kind='stable')]
+    times = transitions['time'].tolist()
+    strength = np.abs(transitions['relative_change']).tolist()
     
-    for transition in transitions_sorted:
-        if transition['time'] - last_time >= min_time_gap:
-            refined.append(transition)
-            last_time = transition['time']
-        else:
-            # If too close, keep the stronger transition
-            if refined and abs(transition['relative_change']) > abs(refined[-1]['relative_change']):
-                refined[-1] = transition
-    
-    return refined
+    # One pass: a transition at least min_time_gap after the last accepted one opens a new
+    # window, otherwise it replaces the window's pick if it is stronger
+    keep = []
+    last_time = -float('inf')
+    for i, time in enumerate(times):
+        if time - last_time >= min_time_gap:
+            keep.append(i)
+            last_time = time
+        elif strength[i] > strength[keep[-1]]:
+            keep[-1] = i
+    
+    return transitions[keep]
+
+def transition_description(transition):
+    """Human-readable summary of one transition (only needed for reports)"""
+    if transition['spike']:
+        return f"Energy spike (+{transition['relative_change']:.1%}) - likely verse to chorus"
+    return f"Energy fall ({transition['relative_change']:.1%}) - likely chorus to verse"
+
+def transition_records(transitions):
+    """List-of-dicts view of a transition array, descriptions included"""
+    return [{
+        'beat_number': int(t['beat_number']),
+        'time': t['time'],
+        'transition_type': 'SPIKE' if t['spike'] else 'FALL',
+        'musical_transition': 'VERSE_TO_CHORUS' if t['spike'] else 'CHORUS_TO_VERSE',
+        'energy_change': t['energy_change'],
+        'relative_change': t['relative_change'],
+        'current_energy': t['current_energy'],
+        'baseline_energy': t['baseline_energy'],
+        'description': transition_description(t)
+    } for t in transitions]
 
 def analyze_neighborhood_patterns(neighborhoods):
-    """Analyze patterns in energy neighborhoods"""
-    high_energy_neighborhoods = [n for n in neighborhoods if n['classification'] == 'HIGH_ENERGY']
-    low_energy_neighborhoods = [n for n in neighborhoods if n['classification'] == 'LOW_ENERGY']
+    """Analyze patterns in energy neighborhoods (NEIGHBORHOOD_DTYPE array)"""
+    high_energy_neighborhoods = neighborhoods[neighborhoods['high_energy']]
+    low_energy_neighborhoods = neighborhoods[~neighborhoods['high_energy']]
+    high_durations = high_energy_neighborhoods['duration']
+    low_durations = low_energy_neighborhoods['duration']
     
     stats = {
         'total_neighborhoods': len(neighborhoods),
         'high_energy_count': len(high_energy_neighborhoods),
         'low_energy_count': len(low_energy_neighborhoods),
-        'avg_high_energy_duration': np.mean([n['duration'] for n in high_energy_neighborhoods]) if high_energy_neighborhoods else 0,
-        'avg_low_energy_duration': np.mean([n['duration'] for n in low_energy_neighborhoods]) if low_energy_neighborhoods else 0,
-        'longest_high_energy': max([n['duration'] for n in high_energy_neighborhoods]) if high_energy_neighborhoods else 0,
-        'longest_low_energy': max([n['duration'] for n in low_energy_neighborhoods]) if low_energy_neighborhoods else 0
+        'avg_high_energy_duration': np.mean(high_durations) if len(high_durations) else 0,
+        'avg_low_energy_duration': np.mean(low_durations) if len(low_durations) else 0,
+        'longest_high_energy': np.max(high_durations) if len(high_durations) else 0,
+        'longest_low_energy': np.max(low_durations) if len(low_durations) else 0
     }
     
     return stats, high_energy_neighborhoods, low_energy_neighborhoods
 
-def plot_energy_with_transitions(y, sr, beat_times, classified_segments, neighborhoods, transitions, output_file=None):
-    """
-    Plot energy analysis with neighborhoods and transitions
-    
-    Args:
-        y: audio signal
-        sr: sample rate
-        beat_times: beat timestamps
-        classified_segments: classified beat segments
-        neighborhoods: energy neighborhoods
-        transitions: significant transitions
-        output_file: optional file name to save plot
-    """
-    # Create figure with subplots
-    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(15, 12))
-    
-    # Calculate time axis for audio waveform
-    time_axis = np.linspace(0, len(y) / sr, len(y))
-    
-    # Plot 1: Waveform with neighborhoods
-    ax1.plot(time_axis, y, alpha=0.3, color='gray', linewidth=0.5)
-    ax1.set_ylabel('Amplitude')
-    ax1.set_title('Audio Waveform with Energy Neighborhoods')
-    
-    # Add neighborhood background colors
-    for neighborhood in neighborhoods:
-        color = 'red' if neighborhood['classification'] == 'HIGH_ENERGY' else 'blue'
-        alpha = 0.2
-        ax1.axvspan(neighborhood['start_time'], neighborhood['end_time'], 
-                   color=color, alpha=alpha, 
-                   label=f"N{neighborhood['neighborhood_id']} ({neighborhood['classification']})")
-    
-    # Add beat markers
-    ax1.vlines(beat_times, ymin=np.min(y), ymax=np.max(y), 
-              colors='black', alpha=0.1, linewidth=0.5)
-    
-    # Plot 2: Energy levels over time
-    segment_times = [seg['start_time'] for seg in classified_segments]
-    segment_energies = [seg['energy'] for seg in classified_segments]
-    
-    # Color code by classification
-    high_energy_mask = [seg['classification'] == 'HIGH_ENERGY' for seg in classified_segments]
-    low_energy_mask = [seg['classification'] == 'LOW_ENERGY' for seg in classified_segments]
-    
-    ax2.scatter([t for i, t in enumerate(segment_times) if high_energy_mask[i]], 
-               [e for i, e in enumerate(segment_energies) if high_energy_mask[i]], 
-               c='red', alpha=0.6, s=10, label='High Energy')
-    ax2.scatter([t for i, t in enumerate(segment_times) if low_energy_mask[i]], 
-               [e for i, e in enumerate(segment_energies) if low_energy_mask[i]], 
-               c='blue', alpha=0.6, s=10, label='Low Energy')
-    
-    # Add energy trend line
-    ax2.plot(segment_times, segment_energies, color='black', alpha=0.3, linewidth=1)
-    
-    # Mark transitions
-    for transition in transitions:
-        color = 'orange' if transition['transition_type'] == 'SPIKE' else 'purple'
-        ax2.axvline(transition['time'], color=color, linestyle='--', alpha=0.8, linewidth=2)
-        ax2.annotate(f"{transition['musical_transition']}\n{transition['relative_change']:+.1%}", 
-                    xy=(transition['time'], transition['current_energy']),
-                    xytext=(10, 10), textcoords='offset points',
-                    bbox=dict(boxstyle='round,pad=0.3', facecolor=color, alpha=0.7),
-                    fontsize=8, ha='left')
-    
-    ax2.set_ylabel('Energy Level')
-    ax2.set_title('Beat-by-Beat Energy Analysis with Transitions')
-    ax2.legend()
-    ax2.grid(True, alpha=0.3)
-    
-    # Plot 3: Neighborhood timeline
-    for i, neighborhood in enumerate(neighborhoods):
-        y_pos = i % 2  # Alternate positions
-        color = 'red' if neighborhood['classification'] == 'HIGH_ENERGY' else 'blue'
-        
-        # Draw neighborhood bar
-        rect = patches.Rectangle((neighborhood['start_time'], y_pos - 0.1), 
-                               neighborhood['duration'], 0.2,
-                               facecolor=color, alpha=0.6, edgecolor='black')
-        ax3.add_patch(rect)
-        
-        # Add neighborhood label
-        ax3.text(neighborhood['start_time'] + neighborhood['duration']/2, y_pos,
-                f"N{neighborhood['neighborhood_id']}\n{neighborhood['duration']:.1f}s",
-                ha='center', va='center', fontsize=8, fontweight='bold')
-    
-    # Mark transitions on timeline
-    for transition in transitions:
-        ax3.axvline(transition['time'], color='orange' if transition['transition_type'] == 'SPIKE' else 'purple', 
-                   linestyle='--', alpha=0.8, linewidth=2)
-    
-    ax3.set_xlim(0, max([n['end_time'] for n in neighborhoods]) if neighborhoods else len(y)/sr)
-    ax3.set_ylim(-0.5, 1.5)
-    ax3.set_ylabel('Neighborhoods')
-    ax3.set_xlabel('Time (seconds)')
-    ax3.set_title('Song Structure Timeline')
-    ax3.set_yticks([0, 1])
-    ax3.set_yticklabels(['Even', 'Odd'])
-    ax3.grid(True, alpha=0.3)
-    
-    # Add legend for transitions
-    from matplotlib.lines import Line2D
-    legend_elements = [
-        Line2D([0], [0], color='orange', linestyle='--', label='Energy Spike (Verse→Chorus)'),
-        Line2D([0], [0], color='purple', linestyle='--', label='Energy Fall (Chorus→Verse)')
-    ]
-    ax3.legend(handles=legend_elements, loc='upper right')
-    
-    plt.tight_layout()
-    
-    # Save plot if filename provided
-    if output_file:
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
-        print(f"Plot saved as {output_file}")
-    
-    plt.show()
-
 def save_complete_analysis(neighborhoods, stats, transitions, classified_segments, output_file='cigarette_daydreams_vocals.txt'):
     """Save complete analysis including neighborhoods, transitions, and beat-level features"""
     import pandas as pd
@@ -625,27 +717,250 @@ def save_complete_analysis(neighborhoods, stats, transitions, classified_segment
     print(start_and_end_times)
     return start_and_end_times
 
+@dataclass
+class AnalysisResult:
+    """Everything analyze_song produces for one song, ready to hand to later stages without touching disk"""
+    beat_times: np.ndarray
+    segment_table: np.ndarray       # SEGMENT_DTYPE, one row per beat
+    neighborhood_table: np.ndarray  # NEIGHBORHOOD_DTYPE, index ranges into segment_table
+    transition_table: np.ndarray    # TRANSITION_DTYPE
+
+    @property
+    def beats(self):
+        """Beat-by-beat table (columns: beat_number, start_time, rms, ...)"""
+        return self.segment_table
+
+    @cached_property
+    def segments(self):
+        return segment_records(self.segment_table)
+
+    @cached_property
+    def neighborhoods(self):
+        return neighborhood_records(self.neighborhood_table, self.segment_table)
+
+    @cached_property
+    def transitions(self):
+        return transition_records(self.transition_table)
+
+    @property
+    def stats(self):
+        return analyze_neighborhood_patterns(self.neighborhood_table)[0]
+
+    @property
+    def timestamps(self):
+        return neighborhood_timestamps(self.neighborhood_table)
+
+def neighborhood_timestamps(neighborhoods):
+    """Map neighborhood id -> (start_time, end_time)"""
+    return {int(n['neighborhood_id']): (n['start_time'], n['end_time']) for n in neighborhoods}
+
+def export_analysis(result, output_file):
+    """Write the text report and beat CSV for an AnalysisResult (optional side output)"""
+    return save_complete_analysis(result.neighborhoods, result.stats, result.transitions, result.segments, output_file)
+
+# Analysis resolution: rate the song is analysed at, hop between frames and frame length.
+# 'default' is librosa's defaults; bench_profiles.py measures what the others trade.
+ANALYSIS_PROFILES = {
+    'fast': {'sr': 11025, 'hop_length': 512, 'n_fft': 1024},
+    'default': {'sr': 22050, 'hop_length': 512, 'n_fft': 2048},
+    'precise': {'sr': 44100, 'hop_length': 256, 'n_fft': 4096}
+}
+
+def analysis_resolution(profile='default'):
+    """sr / hop_length / n_fft of a named analysis profile"""
+    if profile not in ANALYSIS_PROFILES:
+        raise ValueError(f"Unknown analysis profile '{profile}', expected one of {', '.join(ANALYSIS_PROFILES)}")
+    return ANALYSIS_PROFILES[profile]
+
+# Sources htdemucs separates a song into; store_lyrics.add_to_db saves each one next to the song
+STEM_NAMES = ('drums', 'bass', 'other', 'vocals')
+
+def stem_file(audio_file, stem):
+    """Path of a separated stem of a song, e.g. song_artist_drums.wav"""
+    if stem not in STEM_NAMES:
+        raise ValueError(f"Unknown stem '{stem}', expected one of {', '.join(STEM_NAMES)}")
+    return f"{audio_file[:-4]}_{stem}.wav"
+
+def analysis_stems(audio_file, beat_stem=None, energy_stems=None, fallback=True):
+    """
+    Stem files to analyse a song with instead of the full mix
+    
+    Args:
+        audio_file: path to the song
+        beat_stem: stem to beat-track on (e.g. 'drums'), or None for the mix
+        energy_stems: stems whose sum the energy features are computed on, or None for the mix
+        fallback: use the mix when a stem has not been separated yet; if False, raise FileNotFoundError
+    
+    Returns:
+        (beat stem path or None, {stem: path} or None), None wherever the mix is used
+    """
+    def find(stems):
+        paths = {stem: stem_file(audio_file, stem) for stem in stems}
+        missing = [path for path in paths.values() if not os.path.exists(path)]
+        if missing:
+            if not fallback:
+                raise FileNotFoundError(f"Stems not separated for {audio_file}: {', '.join(missing)}")
+            print(f"No {', '.join(missing)}: analysing the full mix of {audio_file} instead")
+            return None
+        return paths
+    
+    beat_paths = find([beat_stem]) if beat_stem else None
+    energy_paths = find(energy_stems) if energy_stems else None
+    return (beat_paths[beat_stem] if beat_paths else None), energy_paths
+
+def analysis_params(hysteresis_factor=0.01, min_section_duration=1.5, spike_threshold=0.25, lookback_window=4,
+                    min_time_gap=6.0, streaming=False, block_duration=360.0, profile='default', stems=None):
+    """
+    Parameters that determine an analyze_song result (the cache key besides the audio itself)
+    
+    stems holds the content digests of the stem files analysed in place of the mix, so
+    re-separating a song invalidates its cached analysis.
+    """
+    params = {
+        'hysteresis_factor': hysteresis_factor,
+        'min_section_duration': min_section_duration,
+        'spike_threshold': spike_threshold,
+        'lookback_window': lookback_window,
+        'min_time_gap': min_time_gap
+    }
+    if streaming:
+        params['block_duration'] = block_duration
+    if profile != 'default':
+        params['resolution'] = analysis_resolution(profile)
+    if stems:
+        params['stems'] = stems
+    return params
+
+def song_analysis_params(audio_file, hysteresis_factor=0.01, min_section_duration=1.5, spike_threshold=0.25,
+                         lookback_window=4, min_time_gap=6.0, streaming=False, block_duration=360.0,
+                         profile='default', beat_stem=None, energy_stems=None, stem_fallback=True):
+    """
+    Parameters analyze_song caches (and AnalysisDB stores) a song's result under: analysis_params
+    plus the content digests of the stems analysed in place of the mix
+    
+    Returns:
+        (params, beat stem path or None, {stem: path} or None), as analysis_stems finds them
+    """
+    beat_file, energy_files = analysis_stems(audio_file, beat_stem, energy_stems, stem_fallback)
+    if streaming and (beat_file or energy_files):
+        raise ValueError("Stem analysis is not available in streaming mode")
+    stems = {}
+    if beat_file:
+        stems['beat'] = {beat_stem: analysis_cache.file_digest(beat_file)}
+    if energy_files:
+        stems['energy'] = {stem: analysis_cache.file_digest(path) for stem, path in energy_files.items()}
+    params = analysis_params(hysteresis_factor, min_section_duration, spike_threshold, lookback_window,
+                             min_time_gap, streaming, block_duration, profile, stems)
+    return params, beat_file, energy_files
+
+def analyze_song(audio_file, hysteresis_factor=0.01, min_section_duration=1.5, spike_threshold=0.25,
+                 lookback_window=4, min_time_gap=6.0, cache=None, streaming=False, block_duration=360.0,
+                 profile='default', beat_stem=None, energy_stems=None, stem_fallback=True, serial=False):
+    """
+    Run beat, energy, neighborhood and transition analysis for one song
+    
+    Args:
+        audio_file: path to the song
+        hysteresis_factor, min_section_duration: neighborhood parameters
+        spike_threshold, lookback_window, min_time_gap: transition parameters
+        cache: optional AnalysisCache; a hit skips decoding and analysis entirely
+        streaming: analyse in blocks of block_duration seconds with bounded memory
+                   (for long live sets / DJ mixes; songs shorter than a block give identical results)
+        profile: analysis resolution, one of ANALYSIS_PROFILES ('fast', 'default', 'precise')
+        beat_stem: separated stem to beat-track on, e.g. 'drums' (see analysis_stems)
+        energy_stems: separated stems to compute energy on, e.g. ('drums', 'bass', 'other')
+        stem_fallback: analyse the full mix where stems are missing instead of raising
+        serial: compute the features and beats one after another instead of on a thread pool
+    
+    Returns:
+        AnalysisResult with beat times, the classified segment and neighborhood tables
+        and the significant transitions
+    """
+    params, beat_file, energy_files = song_analysis_params(audio_file, hysteresis_factor, min_section_duration,
+                                                           spike_threshold, lookback_window, min_time_gap, streaming,
+                                                           block_duration, profile, beat_stem, energy_stems,
+                                                           stem_fallback)
+    resolution = analysis_resolution(profile)
+    if cache is not None:
+        cached = cache.get(audio_file, params)
+        if cached is not None:
+            return AnalysisResult(**cached)
+    
+    if streaming:
+        import stream_analysis
+        beat_times, segments = stream_analysis.stream_beat_segments(audio_file, block_duration=block_duration,
+                                                                    **resolution)
+    else:
+        # One transform pass feeds beat tracking and every energy feature, unless they come from different stems.
+        # Beat tracking only needs the onset envelope, so it runs alongside the other features.
+        sr, hop_length, n_fft = resolution['sr'], resolution['hop_length'], resolution['n_fft']
+        if energy_files:
+            y = np.sum([audio_cache.load_analysis_audio(path, sr=sr)[0] for path in energy_files.values()], axis=0)
+        else:
+            y, sr = audio_cache.load_analysis_audio(audio_file, sr=sr)
+        tasks = feature_tasks(y, sr, hop_length, n_fft)
+        beat_onset = 'onset_envelope'
+        if beat_file:
+            # The drums carry the beat without vocals and pads smearing the onsets (no HPSS needed)
+            beat_tasks = feature_tasks(audio_cache.load_analysis_audio(beat_file, sr=sr)[0], sr, hop_length, n_fft,
+                                       prefix='beat_')
+            tasks.update({name: beat_tasks[name] for name in ('beat_spectrogram', 'beat_onset_envelope')})
+            beat_onset = 'beat_onset_envelope'
+        tasks['beat_frames'] = (lambda onset_envelope: librosa.beat.beat_track(onset_envelope=onset_envelope, sr=sr,
+                                                                               hop_length=hop_length)[1],
+                                [beat_onset])
+        results = run_task_graph(tasks, serial=serial)
+        features = {'sr': sr, 'hop_length': hop_length, 'n_fft': n_fft,
+                    **{name: results[name] for name in FEATURE_NAMES}}
+        beat_times = librosa.frames_to_time(results['beat_frames'], sr=sr, hop_length=hop_length)
+        segments = analyze_beat_energy(y, sr, beat_times, features)
+    classified_segments = classify_beat_segments(segments)
+    
+    # Neighborhood analysis for song structure
+    neighborhoods = identify_energy_neighborhoods(classified_segments, hysteresis_factor=hysteresis_factor,
+                                                  min_section_duration=min_section_duration, enable_merging=True)
+    
+    # Transition detection for verse/chorus changes
+    raw_transitions = detect_energy_transitions(classified_segments, 
+                                               spike_threshold=spike_threshold, 
+                                               lookback_window=lookback_window)
+    significant_transitions = refine_transitions(raw_transitions, min_time_gap=min_time_gap)
+    
+    result = AnalysisResult(beat_times, classified_segments, neighborhoods, significant_transitions)
+    if cache is not None:
+        cache.put(audio_file, params, result)
+    return result
+
 # Modified main function with transition detection
-def main_with_neighborhoods(audio_file):
-    timestamps = {}
+def main_with_neighborhoods(audio_file, use_cache=True, export=False, store=True, **params):
+    """
+    Analyse a song and record it in the analysis database
+
+    Args:
+        use_cache: go through the default analysis cache
+        export: also write the <song>_analysis.txt / _beats.csv side files
+        store: save the result and its intensity periods with analysis_db.store_analysis
+        params: analyze_song parameters
+    """
+    neighborhoods, stats, significant_transitions, timestamps = [], {}, [], {}
     try:
-        # Existing analysis
-        beat_times, tempo, beat_frames, y, sr = detect_beats(audio_file)
-        segments = analyze_beat_energy(y, sr, beat_times)
-        classified_segments = classify_beat_segments(segments)
-        
-        # Neighborhood analysis for song structure
-        neighborhoods = identify_energy_neighborhoods(classified_segments, hysteresis_factor=0.01, min_section_duration=1.5,enable_merging=True)
-        stats, high_neighborhoods, low_neighborhoods = analyze_neighborhood_patterns(neighborhoods)
+        cache = analysis_cache.default_cache() if use_cache else None
+        result = analyze_song(audio_file, cache=cache, **params)
+        neighborhoods = result.neighborhoods
+        significant_transitions = result.transitions
+        stats = result.stats
+        timestamps = result.timestamps
         
-        # NEW: Transition detection for verse/chorus changes
-        raw_transitions = detect_energy_transitions(classified_segments, 
-                                                   spike_threshold=0.25, 
-                                                   lookback_window=4)
-        significant_transitions = refine_transitions(raw_transitions, min_time_gap=6.0)
+        if store:
+            import analysis_db
+            import metadata_analysis
+            key_params = {name: value for name, value in params.items() if name != 'serial'}
+            periods = metadata_analysis.analyze_moving_average_above_thresholds(result.beats)
+            analysis_db.store_analysis(audio_file, result, periods, song_analysis_params(audio_file, **key_params)[0])
         
         # Save analysis with beat-level features
-        timestamps = save_complete_analysis(neighborhoods, stats, significant_transitions, classified_segments, audio_file[:-4].lower()+'_analysis.txt')
+        if export:
+            export_analysis(result, audio_file[:-4].lower()+'_analysis.txt')
         
     except FileNotFoundError:
         print(f"Error: File '{audio_file}' not found.")
@@ -658,3 +973,4 @@ if __name__ == "__main__":
     file_path='comealittlecloser_cagetheelephant.wav'
 
     neighborhoods, stats, transitions, timestamps = main_with_neighborhoods(file_path)
+    print(analysis_cache.default_cache().stats())
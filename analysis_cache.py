@@ -0,0 +1,183 @@
+import hashlib
+import io
+import json
+import os
+import numpy as np
+
+CACHE_DIR = '.analysis_cache'
+# Bump whenever the analysis output changes so entries written by older code stop matching
+CACHE_VERSION = 3
+
+_digests = {}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    SHA-256 of a file's content
+
+    The digest is remembered per (path, size, mtime) so repeat lookups in the same
+    process don't re-read the audio.
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key not in _digests:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+        _digests[memo_key] = h.hexdigest()
+    return _digests[memo_key]
+
+
+def params_digest(params):
+    """Stable digest of an analysis parameter dict (plus the cache format version)"""
+    payload = json.dumps({'version': CACHE_VERSION, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class AnalysisCache:
+    """
+    On-disk cache of ana3 analysis results keyed by audio content and analysis parameters
+
+    Each entry is one .npz file named <audio sha256>-<params sha256>.npz holding the
+    beat times and the segment, neighborhood and transition tables as flat columns.
+    Renaming or moving a song keeps its entry; editing the audio or changing a parameter
+    misses. Entries are evicted least-recently-used once the cache exceeds max_entries
+    or max_bytes.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=256, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, audio_file, params):
+        return os.path.join(self.cache_dir, f"{file_digest(audio_file)}-{params_digest(params)}.npz")
+
+    def contains(self, audio_file, params):
+        """Check for a valid entry without touching the hit/miss counters"""
+        return os.path.exists(self.entry_path(audio_file, params))
+
+    def get(self, audio_file, params):
+        """Return the cached result fields as a dict, or None on a miss"""
+        path = self.entry_path(audio_file, params)
+        try:
+            with np.load(path) as data:
+                result = decode_result(data)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, KeyError):
+            # Truncated or stale-format entry: drop it and recompute
+            self._remove(path)
+            self.misses += 1
+            return None
+        os.utime(path)  # mark as recently used
+        self.hits += 1
+        return result
+
+    def put(self, audio_file, params, result):
+        path = self.entry_path(audio_file, params)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **encode_result(result))
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def invalidate(self, audio_file=None):
+        """Drop every entry for one audio file (any parameters), or the whole cache"""
+        prefix = file_digest(audio_file) + '-' if audio_file else ''
+        removed = 0
+        for name, _, _ in self._entries():
+            if name.startswith(prefix):
+                self._remove(os.path.join(self.cache_dir, name))
+                removed += 1
+        return removed
+
+    def evict(self):
+        """Remove least-recently-used entries until both size limits hold"""
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total_bytes = sum(size for _, _, size in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            name, _, size = entries.pop(0)
+            self._remove(os.path.join(self.cache_dir, name))
+            total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(size for _, _, size in entries)
+        }
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue  # evicted by another process meanwhile
+                entries.append((name, st.st_mtime_ns, st.st_size))
+        return entries
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Process-wide cache in ./.analysis_cache"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = AnalysisCache()
+    return _default_cache
+
+
+def encode_result(result):
+    """Flatten an ana3.AnalysisResult into named arrays for np.savez"""
+    arrays = {'beat_times': np.asarray(result.beat_times)}
+    for column in result.segment_table.dtype.names:
+        arrays['segment_' + column] = result.segment_table[column]
+    for column in result.neighborhood_table.dtype.names:
+        arrays['neighborhood_' + column] = result.neighborhood_table[column]
+    for column in result.transition_table.dtype.names:
+        arrays['transition_' + column] = result.transition_table[column]
+    return arrays
+
+
+def _table(data, prefix, dtype):
+    table = np.zeros(len(data[prefix + dtype.names[0]]), dtype=dtype)
+    for column in dtype.names:
+        table[column] = data[prefix + column]
+    return table
+
+
+def decode_result(data):
+    """Inverse of encode_result, as the keyword arguments of ana3.AnalysisResult"""
+    import ana3
+    data = {name: data[name] for name in data.files}  # NpzFile decompresses on every access
+    return {
+        'beat_times': data['beat_times'],
+        'segment_table': _table(data, 'segment_', ana3.SEGMENT_DTYPE),
+        'neighborhood_table': _table(data, 'neighborhood_', ana3.NEIGHBORHOOD_DTYPE),
+        'transition_table': _table(data, 'transition_', ana3.TRANSITION_DTYPE)
+    }
@@ -0,0 +1,284 @@
+import os
+import sqlite3
+import time
+import numpy as np
+from analysis_cache import file_digest, params_digest
+from lyrics_db import song_name
+
+DB_PATH = 'lyricsdb2.db'
+
+# Analysis results live in the lyrics database next to records_pickled, one row per beat /
+# segment / neighborhood / transition / intensity period, keyed by song_id. A song has one
+# current analysis; saving it again replaces every row in one transaction.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs(
+    song_id        INTEGER PRIMARY KEY,
+    name           TEXT NOT NULL UNIQUE  -- <title>_<artist>, the audio file name without extension
+);
+CREATE TABLE IF NOT EXISTS analyses(
+    song_id        INTEGER PRIMARY KEY REFERENCES songs(song_id) ON DELETE CASCADE,
+    audio_sha256   TEXT NOT NULL,
+    params_digest  TEXT NOT NULL,
+    analysed_at    REAL NOT NULL,
+    n_beats        INTEGER NOT NULL,
+    duration       REAL NOT NULL,
+    audio_size     INTEGER,              -- size / mtime of the file when it was hashed: if both are
+    audio_mtime_ns INTEGER               -- unchanged, is_analysed trusts audio_sha256 without re-reading it
+);
+CREATE INDEX IF NOT EXISTS analyses_by_content ON analyses(audio_sha256, params_digest);
+CREATE TABLE IF NOT EXISTS beats(
+    song_id        INTEGER NOT NULL REFERENCES songs(song_id) ON DELETE CASCADE,
+    beat_index     INTEGER NOT NULL,
+    time           REAL NOT NULL,
+    PRIMARY KEY(song_id, beat_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS segments(
+    song_id        INTEGER NOT NULL REFERENCES songs(song_id) ON DELETE CASCADE,
+    beat_number    INTEGER NOT NULL,
+    start_time     REAL NOT NULL,
+    end_time       REAL NOT NULL,
+    energy         REAL NOT NULL,
+    rms            REAL NOT NULL,
+    centroid       REAL NOT NULL,
+    zcr            REAL NOT NULL,
+    high_energy    INTEGER NOT NULL,
+    smoothed_high_energy INTEGER NOT NULL,
+    PRIMARY KEY(song_id, beat_number)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS segments_by_time ON segments(song_id, start_time);
+CREATE TABLE IF NOT EXISTS neighborhoods(
+    song_id        INTEGER NOT NULL REFERENCES songs(song_id) ON DELETE CASCADE,
+    neighborhood_id INTEGER NOT NULL,
+    start_beat     INTEGER NOT NULL,  -- [start_beat, stop_beat) rows of the song's segments
+    stop_beat      INTEGER NOT NULL,
+    high_energy    INTEGER NOT NULL,
+    start_time     REAL NOT NULL,
+    end_time       REAL NOT NULL,
+    duration       REAL NOT NULL,
+    avg_energy     REAL NOT NULL,
+    PRIMARY KEY(song_id, neighborhood_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS neighborhoods_by_time ON neighborhoods(song_id, start_time);
+CREATE INDEX IF NOT EXISTS neighborhoods_by_energy ON neighborhoods(high_energy, duration);
+CREATE TABLE IF NOT EXISTS transitions(
+    song_id        INTEGER NOT NULL REFERENCES songs(song_id) ON DELETE CASCADE,
+    transition_index INTEGER NOT NULL,
+    beat_number    INTEGER NOT NULL,
+    time           REAL NOT NULL,
+    spike          INTEGER NOT NULL,
+    energy_change  REAL NOT NULL,
+    relative_change REAL NOT NULL,
+    current_energy REAL NOT NULL,
+    baseline_energy REAL NOT NULL,
+    PRIMARY KEY(song_id, transition_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS intensity_periods(
+    song_id        INTEGER NOT NULL REFERENCES songs(song_id) ON DELETE CASCADE,
+    period_index   INTEGER NOT NULL,
+    start_time     REAL NOT NULL,
+    end_time       REAL NOT NULL,
+    PRIMARY KEY(song_id, period_index)
+) WITHOUT ROWID;
+"""
+
+# Table columns in the order of the structured array fields they hold
+SEGMENT_COLUMNS = ('beat_number', 'start_time', 'end_time', 'energy', 'rms', 'centroid', 'zcr', 'high_energy',
+                   'smoothed_high_energy')
+NEIGHBORHOOD_COLUMNS = ('neighborhood_id', 'start_beat', 'stop_beat', 'high_energy', 'start_time', 'end_time',
+                        'duration', 'avg_energy')
+NEIGHBORHOOD_FIELDS = ('neighborhood_id', 'start', 'stop', 'high_energy', 'start_time', 'end_time', 'duration',
+                       'avg_energy')
+TRANSITION_COLUMNS = ('beat_number', 'time', 'spike', 'energy_change', 'relative_change', 'current_energy',
+                      'baseline_energy')
+# Columns added to analyses after its first version, with their types (added to older databases on open)
+ADDED_ANALYSES_COLUMNS = (('audio_size', 'INTEGER'), ('audio_mtime_ns', 'INTEGER'))
+
+
+def _rows(song_id, table, fields):
+    """Rows of a structured array as plain Python tuples led by song_id"""
+    columns = [table[field].tolist() for field in fields]
+    return [(song_id, *row) for row in zip(*columns)]
+
+
+class AnalysisDB:
+    """
+    Analysis results of the whole library in SQLite
+
+    save() stores an ana3.AnalysisResult (and optionally the intensity periods from
+    metadata_analysis) in one transaction; load() rebuilds the result. The other methods
+    are indexed lookups for single songs and across the library.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(analyses)")}
+        with self.conn:
+            for column, kind in ADDED_ANALYSES_COLUMNS:
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE analyses ADD COLUMN {column} {kind}")
+
+    def close(self):
+        self.conn.close()
+
+    def song_id(self, name, create=False):
+        row = self.conn.execute("SELECT song_id FROM songs WHERE name = ?", (name,)).fetchone()
+        if row:
+            return row[0]
+        if create:
+            return self.conn.execute("INSERT INTO songs (name) VALUES (?)", (name,)).lastrowid
+        return None
+
+    def is_analysed(self, audio_file, params=None, digest=None):
+        """
+        Whether this exact audio has been analysed with these analyze_song parameters
+
+        The song's own row is checked first: if the file still has the size and mtime it had
+        when it was hashed, that row answers without reading the audio. Otherwise (edited,
+        touched, renamed or moved files) the content digest is looked up.
+
+        Args:
+            digest: file_digest(audio_file) if the caller already has it
+        """
+        import ana3
+        params = ana3.analysis_params() if params is None else params
+        if digest is None:
+            st = os.stat(audio_file)
+            row = self.conn.execute(
+                "SELECT 1 FROM analyses JOIN songs USING (song_id) WHERE name = ? AND params_digest = ? "
+                "AND audio_size = ? AND audio_mtime_ns = ?",
+                (song_name(audio_file), params_digest(params), st.st_size, st.st_mtime_ns)).fetchone()
+            if row is not None:
+                return True
+            digest = file_digest(audio_file)
+        row = self.conn.execute(
+            "SELECT 1 FROM analyses WHERE audio_sha256 = ? AND params_digest = ?",
+            (digest, params_digest(params))).fetchone()
+        return row is not None
+
+    def save(self, audio_file, result, periods=None, params=None, name=None):
+        """
+        Store a song's analysis, replacing any previous one, as a single transaction
+
+        Args:
+            audio_file: path to the song
+            result: ana3.AnalysisResult
+            periods: intensity periods ({'start_time', 'end_time'} dicts) from metadata_analysis
+            params: analyze_song parameters the result was computed with (default: the defaults)
+            name: key to store the song under (default: song_name(audio_file))
+        """
+        import ana3
+        params = ana3.analysis_params() if params is None else params
+        name = name or song_name(audio_file)
+        st = os.stat(audio_file)
+        with self.conn:
+            song_id = self.song_id(name, create=True)
+            for table in ('beats', 'segments', 'neighborhoods', 'transitions', 'intensity_periods', 'analyses'):
+                self.conn.execute(f"DELETE FROM {table} WHERE song_id = ?", (song_id,))
+            self.conn.execute(
+                "INSERT INTO analyses (song_id, audio_sha256, params_digest, analysed_at, n_beats, duration, "
+                "audio_size, audio_mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (song_id, file_digest(audio_file), params_digest(params), time.time(), len(result.beat_times),
+                 float(result.beat_times[-1] - result.beat_times[0]) if len(result.beat_times) else 0.0,
+                 st.st_size, st.st_mtime_ns))
+            self.conn.executemany("INSERT INTO beats VALUES (?, ?, ?)",
+                                  [(song_id, i, t) for i, t in enumerate(np.asarray(result.beat_times).tolist())])
+            self.conn.executemany(f"INSERT INTO segments VALUES ({', '.join('?' * 10)})",
+                                  _rows(song_id, result.segment_table, SEGMENT_COLUMNS))
+            self.conn.executemany(f"INSERT INTO neighborhoods VALUES ({', '.join('?' * 9)})",
+                                  _rows(song_id, result.neighborhood_table, NEIGHBORHOOD_FIELDS))
+            self.conn.executemany(f"INSERT INTO transitions VALUES ({', '.join('?' * 9)})",
+                                  [(song_id, i, *row[1:]) for i, row in
+                                   enumerate(_rows(song_id, result.transition_table, TRANSITION_COLUMNS))])
+            self.conn.executemany("INSERT INTO intensity_periods VALUES (?, ?, ?, ?)",
+                                  [(song_id, i, float(p['start_time']), float(p['end_time']))
+                                   for i, p in enumerate(periods or [])])
+        return song_id
+
+    def load(self, name):
+        """AnalysisResult of a song (by song_name), or None if it has not been analysed"""
+        import ana3
+        song_id = self.song_id(name)
+        if song_id is None or not self.conn.execute("SELECT 1 FROM analyses WHERE song_id = ?", (song_id,)).fetchone():
+            return None
+        beat_times = np.array([t for t, in self.conn.execute(
+            "SELECT time FROM beats WHERE song_id = ? ORDER BY beat_index", (song_id,))], dtype=np.float64)
+        segments = self._table(ana3.SEGMENT_DTYPE, SEGMENT_COLUMNS, SEGMENT_COLUMNS,
+                               "segments WHERE song_id = ? ORDER BY beat_number", song_id)
+        neighborhoods = self._table(ana3.NEIGHBORHOOD_DTYPE, NEIGHBORHOOD_COLUMNS, NEIGHBORHOOD_FIELDS,
+                                    "neighborhoods WHERE song_id = ? ORDER BY neighborhood_id", song_id)
+        transitions = self._table(ana3.TRANSITION_DTYPE, TRANSITION_COLUMNS, TRANSITION_COLUMNS,
+                                  "transitions WHERE song_id = ? ORDER BY transition_index", song_id)
+        return ana3.AnalysisResult(beat_times, segments, neighborhoods, transitions)
+
+    def _table(self, dtype, columns, fields, where, song_id):
+        rows = self.conn.execute(f"SELECT {', '.join(columns)} FROM {where}", (song_id,)).fetchall()
+        table = np.zeros(len(rows), dtype=dtype)
+        for field, values in zip(fields, zip(*rows)):
+            table[field] = values
+        return table
+
+    def analysed_songs(self):
+        """Names of every analysed song with when it was analysed"""
+        return self.conn.execute(
+            "SELECT name, analysed_at FROM songs JOIN analyses USING (song_id) ORDER BY name").fetchall()
+
+    def segments_between(self, name, start_time, end_time):
+        """(beat_number, start_time, end_time, energy, high_energy) of a song's beats starting in [start, end)"""
+        return self.conn.execute(
+            "SELECT beat_number, start_time, end_time, energy, smoothed_high_energy FROM segments "
+            "WHERE song_id = ? AND start_time >= ? AND start_time < ? ORDER BY start_time",
+            (self.song_id(name), start_time, end_time)).fetchall()
+
+    def neighborhoods_between(self, name, start_time, end_time):
+        """(neighborhood_id, high_energy, start_time, end_time) of a song's neighborhoods overlapping [start, end)"""
+        return self.conn.execute(
+            "SELECT neighborhood_id, high_energy, start_time, end_time FROM neighborhoods "
+            "WHERE song_id = ? AND start_time < ? AND end_time > ? ORDER BY start_time",
+            (self.song_id(name), end_time, start_time)).fetchall()
+
+    def neighborhood_at(self, name, time_point):
+        """(neighborhood_id, high_energy, start_time, end_time) of the neighborhood playing at a time, or None"""
+        row = self.conn.execute(
+            "SELECT neighborhood_id, high_energy, start_time, end_time FROM neighborhoods "
+            "WHERE song_id = ? AND start_time <= ? ORDER BY start_time DESC LIMIT 1",
+            (self.song_id(name), time_point)).fetchone()
+        return row if row and row[3] > time_point else None
+
+    def high_energy_intervals(self, min_duration=0.0):
+        """(song name, start_time, end_time) of every high-energy neighborhood in the library (chorus candidates)"""
+        return self.conn.execute(
+            "SELECT name, start_time, end_time FROM neighborhoods JOIN songs USING (song_id) "
+            "WHERE high_energy = 1 AND duration >= ? ORDER BY name, start_time", (min_duration,)).fetchall()
+
+    def intensity_periods(self, name=None):
+        """(song name, start_time, end_time) of one song's or the whole library's intensity periods"""
+        if name is None:
+            return self.conn.execute(
+                "SELECT name, start_time, end_time FROM intensity_periods JOIN songs USING (song_id) "
+                "ORDER BY name, period_index").fetchall()
+        return self.conn.execute(
+            "SELECT ?, start_time, end_time FROM intensity_periods WHERE song_id = ? ORDER BY period_index",
+            (name, self.song_id(name))).fetchall()
+
+    def transitions_between(self, name, start_time, end_time):
+        """(time, spike, relative_change) of a song's transitions in [start, end)"""
+        return self.conn.execute(
+            "SELECT time, spike, relative_change FROM transitions WHERE song_id = ? AND time >= ? AND time < ? "
+            "ORDER BY time", (self.song_id(name), start_time, end_time)).fetchall()
+
+
+def store_analysis(audio_file, result, periods=None, params=None, db_path=DB_PATH):
+    """
+    Save one song's analysis (see AnalysisDB.save) with a connection of its own
+
+    For the paths that analyse a single song (the render, ana3.main_with_neighborhoods);
+    batch_analyze keeps one AnalysisDB open for the whole batch instead.
+    """
+    db = AnalysisDB(db_path)
+    try:
+        return db.save(audio_file, result, periods, params)
+    finally:
+        db.close()
@@ -0,0 +1,240 @@
+import multiprocessing
+import os
+import numpy as np
+
+# Diagnostic plots for a song's analysis. Nothing on the render path imports this module's
+# plotting code: main_prg only calls start_report, which hands the work to a separate
+# process, and matplotlib is imported there with the non-interactive Agg backend.
+
+DEFAULT_DPI = 100
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')  # headless: never open a window, safe in worker processes
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def plot_energy_with_transitions(y, sr, beat_times, classified_segments, neighborhoods, transitions,
+                                 output_file, dpi=DEFAULT_DPI):
+    """
+    Plot energy analysis with neighborhoods and transitions
+
+    Args:
+        y: audio signal
+        sr: sample rate
+        beat_times: beat timestamps
+        classified_segments: classified beat segments
+        neighborhoods: energy neighborhoods
+        transitions: significant transitions
+        output_file: file name to save the plot to
+        dpi: resolution of the saved image
+    """
+    plt = _pyplot()
+    from matplotlib import patches
+    from matplotlib.lines import Line2D
+
+    # Create figure with subplots
+    fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(15, 12))
+
+    # Calculate time axis for audio waveform
+    time_axis = np.linspace(0, len(y) / sr, len(y))
+
+    # Plot 1: Waveform with neighborhoods
+    ax1.plot(time_axis, y, alpha=0.3, color='gray', linewidth=0.5)
+    ax1.set_ylabel('Amplitude')
+    ax1.set_title('Audio Waveform with Energy Neighborhoods')
+
+    # Add neighborhood background colors
+    for neighborhood in neighborhoods:
+        color = 'red' if neighborhood['classification'] == 'HIGH_ENERGY' else 'blue'
+        alpha = 0.2
+        ax1.axvspan(neighborhood['start_time'], neighborhood['end_time'],
+                   color=color, alpha=alpha,
+                   label=f"N{neighborhood['neighborhood_id']} ({neighborhood['classification']})")
+
+    # Add beat markers
+    ax1.vlines(beat_times, ymin=np.min(y), ymax=np.max(y),
+              colors='black', alpha=0.1, linewidth=0.5)
+
+    # Plot 2: Energy levels over time
+    segment_times = [seg['start_time'] for seg in classified_segments]
+    segment_energies = [seg['energy'] for seg in classified_segments]
+
+    # Color code by classification
+    high_energy_mask = [seg['classification'] == 'HIGH_ENERGY' for seg in classified_segments]
+    low_energy_mask = [seg['classification'] == 'LOW_ENERGY' for seg in classified_segments]
+
+    ax2.scatter([t for i, t in enumerate(segment_times) if high_energy_mask[i]],
+               [e for i, e in enumerate(segment_energies) if high_energy_mask[i]],
+               c='red', alpha=0.6, s=10, label='High Energy')
+    ax2.scatter([t for i, t in enumerate(segment_times) if low_energy_mask[i]],
+               [e for i, e in enumerate(segment_energies) if low_energy_mask[i]],
+               c='blue', alpha=0.6, s=10, label='Low Energy')
+
+    # Add energy trend line
+    ax2.plot(segment_times, segment_energies, color='black', alpha=0.3, linewidth=1)
+
+    # Mark transitions
+    for transition in transitions:
+        color = 'orange' if transition['transition_type'] == 'SPIKE' else 'purple'
+        ax2.axvline(transition['time'], color=color, linestyle='--', alpha=0.8, linewidth=2)
+        ax2.annotate(f"{transition['musical_transition']}\n{transition['relative_change']:+.1%}",
+                    xy=(transition['time'], transition['current_energy']),
+                    xytext=(10, 10), textcoords='offset points',
+                    bbox=dict(boxstyle='round,pad=0.3', facecolor=color, alpha=0.7),
+                    fontsize=8, ha='left')
+
+    ax2.set_ylabel('Energy Level')
+    ax2.set_title('Beat-by-Beat Energy Analysis with Transitions')
+    ax2.legend()
+    ax2.grid(True, alpha=0.3)
+
+    # Plot 3: Neighborhood timeline
+    for i, neighborhood in enumerate(neighborhoods):
+        y_pos = i % 2  # Alternate positions
+        color = 'red' if neighborhood['classification'] == 'HIGH_ENERGY' else 'blue'
+
+        # Draw neighborhood bar
+        rect = patches.Rectangle((neighborhood['start_time'], y_pos - 0.1),
+                               neighborhood['duration'], 0.2,
+                               facecolor=color, alpha=0.6, edgecolor='black')
+        ax3.add_patch(rect)
+
+        # Add neighborhood label
+        ax3.text(neighborhood['start_time'] + neighborhood['duration']/2, y_pos,
+                f"N{neighborhood['neighborhood_id']}\n{neighborhood['duration']:.1f}s",
+                ha='center', va='center', fontsize=8, fontweight='bold')
+
+    # Mark transitions on timeline
+    for transition in transitions:
+        ax3.axvline(transition['time'], color='orange' if transition['transition_type'] == 'SPIKE' else 'purple',
+                   linestyle='--', alpha=0.8, linewidth=2)
+
+    ax3.set_xlim(0, max([n['end_time'] for n in neighborhoods]) if neighborhoods else len(y)/sr)
+    ax3.set_ylim(-0.5, 1.5)
+    ax3.set_ylabel('Neighborhoods')
+    ax3.set_xlabel('Time (seconds)')
+    ax3.set_title('Song Structure Timeline')
+    ax3.set_yticks([0, 1])
+    ax3.set_yticklabels(['Even', 'Odd'])
+    ax3.grid(True, alpha=0.3)
+
+    # Add legend for transitions
+    legend_elements = [
+        Line2D([0], [0], color='orange', linestyle='--', label='Energy Spike (Verse→Chorus)'),
+        Line2D([0], [0], color='purple', linestyle='--', label='Energy Fall (Chorus→Verse)')
+    ]
+    ax3.legend(handles=legend_elements, loc='upper right')
+
+    plt.tight_layout()
+    fig.savefig(output_file, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    print(f"Plot saved as {output_file}")
+
+def plot_moving_average(times, rms_values, rms_moving_avg, rms_mean, rms_median, min_threshold,
+                        periods, moving_avg_window, output_file, dpi=DEFAULT_DPI):
+    """Save the RMS / moving average / threshold plot with the high-intensity periods highlighted"""
+    plt = _pyplot()
+    fig = plt.figure(figsize=(16, 10))
+
+    # Plot RMS values and moving average
+    plt.plot(times, rms_values, 'o-', color='green', alpha=0.5, markersize=3,
+             linewidth=1, label='RMS Energy')
+    plt.plot(times, rms_moving_avg, '-', color='darkgreen', linewidth=2.5,
+             label=f'RMS Moving Average (window={moving_avg_window})')
+
+    # Add threshold lines
+    plt.axhline(y=rms_mean, color='red', linestyle='--', linewidth=2,
+                label=f'RMS Mean: {rms_mean:.6f}', alpha=0.8)
+    plt.axhline(y=rms_median, color='blue', linestyle='--', linewidth=2,
+                label=f'RMS Median: {rms_median:.6f}', alpha=0.8)
+    plt.axhline(y=min_threshold, color='purple', linestyle=':', linewidth=2,
+                label=f'Min Threshold: {min_threshold:.6f}', alpha=0.8)
+
+    # Highlight periods above both thresholds
+    for i, period in enumerate(periods):
+        plt.axvspan(period['start_time'], period['end_time'], alpha=0.2, color='yellow',
+                   label='Above Both Thresholds' if i == 0 else "")
+
+    plt.xlabel('Time (seconds)')
+    plt.ylabel('RMS Energy')
+    plt.title('RMS Energy Analysis: Periods Above Both Mean and Median')
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    fig.savefig(output_file, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    print(f"\nPlot saved as '{output_file}'")
+
+def report_files(audio_file):
+    """Image paths render_report writes for a song"""
+    prefix = audio_file[:-4].lower()
+    return prefix + '_energy_analysis.png', prefix + '_rms_moving_average_analysis.png'
+
+def render_report(audio_file, result, periods, moving_avg_window=5, dpi=DEFAULT_DPI):
+    """
+    Draw both diagnostic plots for an analysed song
+
+    Args:
+        audio_file: path to the song (re-read here for the waveform panel)
+        result: ana3.AnalysisResult of the song
+        periods: high-intensity periods from metadata_analysis
+        moving_avg_window: window the periods were detected with
+        dpi: resolution of the saved images
+
+    Returns:
+        paths of the images written
+    """
+    import audio_cache
+    import metadata_analysis
+
+    energy_file, intensity_file = report_files(audio_file)
+    y, sr = audio_cache.load_analysis_audio(audio_file)
+    plot_energy_with_transitions(y, sr, result.beat_times, result.segments, result.neighborhoods,
+                                 result.transitions, energy_file, dpi=dpi)
+
+    rms_values = result.beats['rms']
+    rms_mean = np.mean(rms_values)
+    rms_median = np.median(rms_values)
+    plot_moving_average(result.beats['start_time'], rms_values,
+                        metadata_analysis.moving_average(rms_values, moving_avg_window),
+                        rms_mean, rms_median, min(rms_mean, rms_median), periods, moving_avg_window,
+                        intensity_file, dpi=dpi)
+    return [energy_file, intensity_file]
+
+def _report_worker(audio_file, result, periods, moving_avg_window, dpi):
+    if hasattr(os, 'nice'):
+        os.nice(10)  # stay out of the way of the video render running alongside
+    # An exception here prints its traceback and gives the process the non-zero exit code wait_report reports
+    render_report(audio_file, result, periods, moving_avg_window, dpi)
+
+def start_report(audio_file, result, periods, moving_avg_window=5, dpi=DEFAULT_DPI):
+    """
+    Render the diagnostic report in a background process
+
+    Returns immediately; pass the returned process to wait_report to wait for the images.
+    """
+    context = multiprocessing.get_context('spawn')
+    process = context.Process(target=_report_worker, args=(audio_file, result, periods, moving_avg_window, dpi),
+                              name=f"report-{os.path.basename(audio_file)}")
+    process.start()
+    return process
+
+def wait_report(process):
+    """
+    Wait for a report started by start_report
+
+    The report is an optional side stage: a failure is printed as a warning and never
+    raised, so it cannot undo a finished render.
+
+    Returns:
+        True if the report process succeeded, False if it failed (images missing or incomplete)
+    """
+    process.join()
+    if process.exitcode != 0:
+        print(f"Warning: {process.name} failed (exit code {process.exitcode}), diagnostic images not written; "
+              f"see its traceback above")
+        return False
+    return True
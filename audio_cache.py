@@ -0,0 +1,165 @@
+import os
+import shutil
+import numpy as np
+import soundfile as sf
+from analysis_cache import file_digest
+
+AUDIO_CACHE_DIR = '.audio_cache'
+ANALYSIS_SR = 22050  # librosa.load default, what ana3 analyses at
+
+
+class CachedAudio:
+    """
+    Decoded PCM of one song, memory-mapped from the audio cache
+
+    native is the file's own sample rate as a (channels, frames) float32 array, the
+    layout torchaudio.load returns. analysis(sr) is the mono signal librosa.load(path, sr=sr)
+    returns, derived from the native PCM on first use and cached next to it. Both are
+    copy-on-write maps: reading costs no copy and writes never reach the cache files.
+    """
+
+    def __init__(self, cache, entry_dir, sr):
+        self.cache = cache
+        self.entry_dir = entry_dir
+        self.sr = sr
+        self.native = np.load(os.path.join(entry_dir, 'native.npy'), mmap_mode='c')
+
+    @property
+    def channels(self):
+        return self.native.shape[0]
+
+    @property
+    def duration(self):
+        return self.native.shape[1] / self.sr
+
+    def analysis(self, sr=ANALYSIS_SR):
+        """Mono signal at sr, sample for sample what librosa.load(path, sr=sr) gives"""
+        if self.channels == 1 and sr == self.sr:
+            return self.native[0]
+        path = os.path.join(self.entry_dir, f'mono_{sr}.npy')
+        if not os.path.exists(path):
+            import librosa
+            y = librosa.to_mono(self.native)
+            if sr != self.sr:
+                y = librosa.resample(y, orig_sr=self.sr, target_sr=sr)
+            self.cache._write_array(path, np.ascontiguousarray(y, dtype=np.float32))
+            self.cache.resamples += 1
+        return np.load(path, mmap_mode='c')
+
+
+class AudioCache:
+    """
+    Decode-once store of song audio keyed by file content
+
+    Each song gets a directory named after its SHA-256 holding native.npy (the decoded
+    PCM, written block by block so the whole file is never held in memory), sr.txt and
+    any derived mono_<rate>.npy. The first load of a song decodes it exactly once; later
+    loads in this or any other process only map the files. Entries are evicted
+    least-recently-used once the cache exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir=AUDIO_CACHE_DIR, max_bytes=4 * 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.decodes = 0
+        self.resamples = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_dir(self, audio_file):
+        return os.path.join(self.cache_dir, file_digest(audio_file))
+
+    def load(self, audio_file):
+        """CachedAudio for a song, decoding it only if it is not cached yet"""
+        entry_dir = self.entry_dir(audio_file)
+        sr_path = os.path.join(entry_dir, 'sr.txt')
+        if os.path.exists(sr_path):
+            self.hits += 1
+        else:
+            self._decode(audio_file, entry_dir)
+            self.decodes += 1
+            self.evict(keep=entry_dir)
+        os.utime(entry_dir)  # mark as recently used
+        with open(sr_path) as f:
+            return CachedAudio(self, entry_dir, int(f.read()))
+
+    def invalidate(self, audio_file=None):
+        """Drop one song's decoded audio, or the whole cache"""
+        names = [os.path.basename(self.entry_dir(audio_file))] if audio_file else os.listdir(self.cache_dir)
+        for name in names:
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+        return len(names)
+
+    def evict(self, keep=None):
+        """Remove least-recently-used songs until the size limit holds"""
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total_bytes = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'decodes': self.decodes,
+            'resamples': self.resamples,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(size for _, _, size in entries)
+        }
+
+    def _decode(self, audio_file, entry_dir):
+        info = sf.info(audio_file)
+        os.makedirs(entry_dir, exist_ok=True)
+        tmp_path = os.path.join(entry_dir, f'native.{os.getpid()}.tmp.npy')
+        pcm = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(info.channels, info.frames))
+        pos = 0
+        for block in sf.blocks(audio_file, blocksize=1 << 16, dtype='float32', always_2d=True):
+            pcm[:, pos:pos + len(block)] = block.T
+            pos += len(block)
+        pcm.flush()
+        del pcm
+        os.replace(tmp_path, os.path.join(entry_dir, 'native.npy'))
+        # sr.txt goes last: its presence marks the entry complete
+        with open(os.path.join(entry_dir, f'sr.{os.getpid()}.tmp'), 'w') as f:
+            f.write(str(info.samplerate))
+        os.replace(os.path.join(entry_dir, f'sr.{os.getpid()}.tmp'), os.path.join(entry_dir, 'sr.txt'))
+
+    def _write_array(self, path, array):
+        tmp_path = f"{path[:-4]}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                entries.append((path, os.stat(path).st_mtime_ns, size))
+            except (FileNotFoundError, NotADirectoryError):
+                continue  # evicted by another process meanwhile
+        return entries
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Process-wide cache in ./.audio_cache"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = AudioCache()
+    return _default_cache
+
+
+def load_analysis_audio(audio_file, sr=ANALYSIS_SR):
+    """Drop-in for librosa.load(audio_file, sr=sr) served from the default cache"""
+    return default_cache().load(audio_file).analysis(sr), sr
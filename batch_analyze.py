@@ -0,0 +1,138 @@
+import argparse
+import glob
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Side files written next to a song that are not songs themselves
+STEM_SUFFIXES = ('_vocals.wav', '_instrumental.wav', '_drums.wav', '_bass.wav', '_other.wav')
+
+
+def find_songs(directory):
+    """All <title>_<artist>.wav files in a directory, skipping separated stems"""
+    songs = []
+    for path in sorted(glob.glob(os.path.join(directory, '*_*.wav'))):
+        if not path.lower().endswith(STEM_SUFFIXES):
+            songs.append(path)
+    return songs
+
+
+def analysis_outputs(audio_file):
+    """Artifact paths main_with_neighborhoods writes for a song"""
+    txt_file = audio_file[:-4].lower() + '_analysis.txt'
+    return txt_file, txt_file.replace('.txt', '_beats.csv')
+
+
+def _init_worker():
+    # One process per core already; keep BLAS/numba from spawning a thread per core in each of them.
+    # Runs before numpy is imported in the worker (spawn start method, lazy imports below).
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMBA_NUM_THREADS'):
+        os.environ[var] = '1'
+
+
+def analyze_one(audio_file, streaming=False, profile='default', export=False):
+    """
+    Analyse one song (worker entry point)
+
+    Returns:
+        (audio_file, seconds, AnalysisResult or None, intensity periods, error message or None);
+        the parent stores the result, so only one process writes the database
+    """
+    start = time.perf_counter()
+    try:
+        import contextlib
+        import io
+        import ana3
+        import analysis_cache
+        import metadata_analysis
+        # Songs already run one per core: keep each song's analysis steps on its own thread
+        result = ana3.analyze_song(audio_file, cache=analysis_cache.default_cache(), streaming=streaming,
+                                   profile=profile, serial=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            periods = metadata_analysis.analyze_moving_average_above_thresholds(result.beats)
+        if export:
+            ana3.export_analysis(result, analysis_outputs(audio_file)[0])
+        return audio_file, time.perf_counter() - start, result, periods, None
+    except Exception as e:
+        return audio_file, time.perf_counter() - start, None, [], f"{type(e).__name__}: {e}"
+
+
+def is_up_to_date(db, audio_file, streaming=False, profile='default', export=False):
+    """The database holds this audio's analysis with these parameters (and the side files exist, if wanted)"""
+    import ana3
+    params = ana3.analysis_params(streaming=streaming, profile=profile)
+    return (db.is_analysed(audio_file, params)
+            and (not export or all(os.path.exists(path) for path in analysis_outputs(audio_file))))
+
+
+def run_batch(directory, workers=None, streaming=False, force=False, profile='default', db_path=None, export=False):
+    """
+    Analyse every song in a directory across a process pool and store the results in the analysis database
+
+    Returns:
+        list of (audio_file, seconds, neighborhoods, error) for the songs that ran,
+        and the list of songs skipped because their analysis was still valid
+    """
+    import ana3
+    import analysis_db
+    db = analysis_db.AnalysisDB(db_path or analysis_db.DB_PATH)
+    songs = find_songs(directory)
+    skipped = [] if force else [song for song in songs if is_up_to_date(db, song, streaming, profile, export)]
+    pending = [song for song in songs if song not in skipped]
+    workers = workers or os.cpu_count() or 1
+
+    print(f"Found {len(songs)} songs in {directory}: {len(pending)} to analyse, {len(skipped)} up to date")
+    for song in skipped:
+        print(f"  [cached] {os.path.basename(song)}")
+
+    results = []
+    if not pending:
+        return results, skipped
+
+    batch_start = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=context,
+                             initializer=_init_worker) as pool:
+        futures = [pool.submit(analyze_one, song, streaming, profile, export) for song in pending]
+        for future in as_completed(futures):
+            audio_file, seconds, result, periods, error = future.result()
+            n_neighborhoods = 0
+            if result is not None:
+                db.save(audio_file, result, periods, ana3.analysis_params(streaming=streaming, profile=profile))
+                n_neighborhoods = len(result.neighborhood_table)
+            results.append((audio_file, seconds, n_neighborhoods, error))
+            name = os.path.basename(audio_file)
+            if error:
+                print(f"  [failed] {name} after {seconds:.1f}s: {error}")
+            else:
+                print(f"  [ok]     {name} in {seconds:.1f}s ({n_neighborhoods} neighborhoods)")
+    wall = time.perf_counter() - batch_start
+
+    failures = [r for r in results if r[3]]
+    cpu_seconds = sum(r[1] for r in results)
+    print(f"\nAnalysed {len(results) - len(failures)}/{len(results)} songs in {wall:.1f}s wall "
+          f"({cpu_seconds:.1f}s summed per-song time, {cpu_seconds / wall:.1f}x parallel speedup on {workers} workers)")
+    if failures:
+        print("Failed:")
+        for audio_file, _, _, error in failures:
+            print(f"  {audio_file}: {error}")
+    return results, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse every <title>_<artist>.wav in a directory")
+    parser.add_argument('directory', nargs='?', default='.', help="folder with the songs (default: current)")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--streaming', action='store_true', help="bounded-memory analysis for long recordings")
+    parser.add_argument('--force', action='store_true', help="re-analyse songs even if cached analysis is valid")
+    parser.add_argument('--profile', choices=('fast', 'default', 'precise'), default='default',
+                        help="analysis resolution (see bench_profiles.py)")
+    parser.add_argument('--db', default=None, help="analysis database (default: lyricsdb2.db)")
+    parser.add_argument('--export', action='store_true',
+                        help="also write the <song>_analysis.txt / _beats.csv side files")
+    args = parser.parse_args()
+
+    results, skipped = run_batch(args.directory, workers=args.workers, streaming=args.streaming, force=args.force,
+                                 profile=args.profile, db_path=args.db, export=args.export)
+    raise SystemExit(1 if any(error for *_, error in results) else 0)
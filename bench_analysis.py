@@ -0,0 +1,244 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import librosa
+import ana3
+import metadata_analysis
+from bench_metrics import match_f_measure, period_overlap
+
+# Stage timings and accuracy of the analysis pipeline on synthetic songs whose beats,
+# loud sections and silences are known exactly. The JSON report of one commit can be
+# compared with another's through --compare.
+
+# (name, bpm, duration, loud sections, silence gaps); sections and gaps in seconds
+CASES = [
+    ('click_90bpm', 90.0, 60.0, [], []),
+    ('click_120bpm', 120.0, 60.0, [], []),
+    ('click_150bpm', 150.0, 60.0, [], []),
+    ('sections_120bpm', 120.0, 120.0, [(20.0, 40.0), (60.0, 80.0), (100.0, 120.0)], []),
+    ('sections_silence_100bpm', 100.0, 120.0, [(30.0, 60.0), (90.0, 110.0)], [(60.0, 64.0), (110.0, 113.0)]),
+    ('long_128bpm', 128.0, 600.0, [(start, start + 30.0) for start in range(30, 600, 60)], [])
+]
+STAGES = ('extract_features', 'detect_beats', 'analyze_beat_energy', 'classify_beat_segments',
+          'identify_energy_neighborhoods', 'detect_energy_transitions', 'metadata_analysis')
+STAGE_LABELS = ('features', 'beats', 'energy', 'classify', 'neighbors', 'transitions', 'periods')
+# Relative slowdown / absolute accuracy drop that --compare reports as a regression
+TIME_TOLERANCE = 0.25
+ACCURACY_TOLERANCE = 0.02
+
+
+def synthetic_case(bpm, duration, loud_sections=(), silences=(), sr=22050, seed=0):
+    """
+    Click track over a tone and noise bed, louder and brighter inside loud_sections, nothing inside silences
+
+    Returns:
+        (y, sr, ground-truth beat times) - beats inside a silence are not part of the truth
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    loud = np.zeros(len(t), dtype=bool)
+    for start, end in loud_sections:
+        loud |= (t >= start) & (t < end)
+    y = np.where(loud, 0.25, 0.06) * np.sin(2 * np.pi * 220 * t) + np.where(loud, 0.08, 0.01) * rng.standard_normal(len(t))
+    click_length = int(0.03 * sr)
+    click = 0.6 * np.exp(-np.arange(click_length) / (0.004 * sr)) * rng.standard_normal(click_length)
+    beats = np.arange(0.5, duration - 0.1, 60.0 / bpm)
+    for beat in beats:
+        i = int(beat * sr)
+        y[i:i + click_length] += click[:len(y) - i]
+    silent = np.zeros(len(t), dtype=bool)
+    for start, end in silences:
+        silent |= (t >= start) & (t < end)
+        beats = beats[(beats < start) | (beats >= end)]
+    y[silent] = 0.0
+    return (0.9 * y / np.max(np.abs(y))).astype(np.float32), sr, beats
+
+
+def timed(fn, repeats):
+    """Best wall time of fn over repeats calls, and its last result"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def covered_periods(start_times, end_times, mask):
+    """Merge the time spans of consecutive True rows into {'start_time', 'end_time'} periods"""
+    starts, ends = metadata_analysis.find_runs(mask)
+    return [{'start_time': float(start_times[s]), 'end_time': float(end_times[e])} for s, e in zip(starts, ends)]
+
+
+def within_truth(periods, duration):
+    """Clip periods to the part of the song the ground truth covers"""
+    return [{'start_time': max(p['start_time'], 0.0), 'end_time': min(p['end_time'], duration)} for p in periods]
+
+
+def run_case(bpm, duration, loud_sections, silences, repeats=3, beat_tolerance=0.07):
+    """
+    Time every stage on one synthetic song and score the results against its ground truth
+
+    Stages get the previous stage's output, with the parameters analyze_song uses.
+
+    Returns:
+        {'duration', 'n_beats', 'stages': {stage: seconds}, 'total_seconds', 'accuracy': {...}}
+    """
+    y, sr, true_beats = synthetic_case(bpm, duration, loud_sections, silences)
+    params = ana3.analysis_params()
+    stages = {}
+    stages['extract_features'], features = timed(lambda: ana3.extract_features(y, sr), repeats)
+    stages['detect_beats'], (beat_times, tempo, _, _, _) = timed(
+        lambda: ana3.detect_beats(None, y=y, sr=sr, features=features), repeats)
+    stages['analyze_beat_energy'], segments = timed(lambda: ana3.analyze_beat_energy(y, sr, beat_times, features),
+                                                    repeats)
+    stages['classify_beat_segments'], classified = timed(lambda: ana3.classify_beat_segments(segments), repeats)
+    stages['identify_energy_neighborhoods'], neighborhoods = timed(
+        lambda: ana3.identify_energy_neighborhoods(classified, hysteresis_factor=params['hysteresis_factor'],
+                                                   min_section_duration=params['min_section_duration'],
+                                                   enable_merging=True), repeats)
+    stages['detect_energy_transitions'], transitions = timed(
+        lambda: ana3.refine_transitions(ana3.detect_energy_transitions(classified, spike_threshold=params['spike_threshold'],
+                                                                       lookback_window=params['lookback_window']),
+                                        min_time_gap=params['min_time_gap']), repeats)
+    with contextlib.redirect_stdout(io.StringIO()):
+        stages['metadata_analysis'], periods = timed(
+            lambda: metadata_analysis.analyze_moving_average_above_thresholds(classified), repeats)
+
+    accuracy = {
+        'beat_f': match_f_measure(true_beats, beat_times, beat_tolerance),
+        'tempo_error': float(abs(np.atleast_1d(tempo)[0] - bpm) / bpm)
+    }
+    if loud_sections:
+        truth = [{'start_time': start, 'end_time': end} for start, end in loud_sections]
+        high_segments = covered_periods(classified['start_time'], classified['end_time'], classified['high_energy'])
+        high_neighborhoods = [{'start_time': n['start_time'], 'end_time': n['end_time']}
+                              for n in neighborhoods if n['high_energy']]
+        accuracy['segment_iou'] = period_overlap(truth, high_segments)
+        accuracy['neighborhood_iou'] = period_overlap(truth, high_neighborhoods)
+        accuracy['period_iou'] = period_overlap(truth, within_truth(periods, duration))
+        # Every entry into a loud section should be found as a spike within two beats
+        spikes = transitions['time'][transitions['spike']]
+        accuracy['spike_f'] = match_f_measure([start for start, _ in loud_sections if start > 0], spikes,
+                                              2 * 60.0 / bpm)
+    if silences:
+        silent = np.zeros(len(classified), dtype=bool)
+        for start, end in silences:
+            silent |= (classified['start_time'] >= start) & (classified['end_time'] <= end)
+        # Beats tracked through a gap must come out silent (zero energy) and LOW
+        accuracy['silence_low'] = float(np.mean((classified['energy'][silent] == 0) & ~classified['high_energy'][silent])
+                                        if silent.any() else 1.0)
+        accuracy['beats_in_silence'] = int(np.sum([(beat_times >= start + beat_tolerance) & (beat_times < end - beat_tolerance)
+                                                   for start, end in silences]))
+    return {'duration': duration, 'n_beats': int(len(beat_times)),
+            'stages': {stage: stages[stage] for stage in STAGES},
+            'total_seconds': sum(stages.values()), 'accuracy': accuracy}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(cases=CASES, repeats=3):
+    """Run every case; returns the JSON-serialisable report"""
+    # librosa's beat tracker is JIT-compiled on first use; keep that out of the first case's time
+    y, sr, _ = synthetic_case(120.0, 10.0)
+    ana3.detect_beats(None, y=y, sr=sr)
+    report = {
+        'revision': git_revision(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                        'librosa': librosa.__version__, 'cpus': os.cpu_count()},
+        'repeats': repeats,
+        'cases': {}
+    }
+    for name, bpm, duration, loud_sections, silences in cases:
+        report['cases'][name] = run_case(bpm, duration, loud_sections, silences, repeats)
+    return report
+
+
+def compare_reports(baseline, current, time_tolerance=TIME_TOLERANCE, accuracy_tolerance=ACCURACY_TOLERANCE):
+    """
+    Regressions of current against baseline
+
+    A stage regresses when it takes more than (1 + time_tolerance) times as long, an
+    accuracy score when it drops by more than accuracy_tolerance (tempo_error and
+    beats_in_silence: when they grow).
+
+    Returns:
+        list of human-readable regression lines (empty if none)
+    """
+    lower_is_better = ('tempo_error', 'beats_in_silence')
+    regressions = []
+    for name, case in current['cases'].items():
+        old = baseline['cases'].get(name)
+        if old is None:
+            continue
+        for stage, seconds in case['stages'].items():
+            old_seconds = old['stages'].get(stage)
+            # Sub-millisecond stages are all timer noise
+            if old_seconds and seconds > 1e-3 and seconds > (1 + time_tolerance) * old_seconds:
+                regressions.append(f"{name} {stage}: {old_seconds * 1000:.2f} -> {seconds * 1000:.2f} ms")
+        for metric, value in case['accuracy'].items():
+            old_value = old['accuracy'].get(metric)
+            if old_value is None:
+                continue
+            change = old_value - value if metric not in lower_is_better else value - old_value
+            if change > accuracy_tolerance:
+                regressions.append(f"{name} {metric}: {old_value:.3f} -> {value:.3f}")
+    return regressions
+
+
+def print_report(report):
+    print(f"revision {report['revision']}, {report['environment']['cpus']} CPUs, best of {report['repeats']}\n")
+    header = ''.join(f"{label:>12}" for label in STAGE_LABELS)
+    print(f"{'case':<25}{header}{'total':>9}   (ms)")
+    for name, case in report['cases'].items():
+        timings = ''.join(f"{case['stages'][stage] * 1000:>12.2f}" for stage in STAGES)
+        print(f"{name:<25}{timings}{case['total_seconds'] * 1000:>9.1f}")
+    print()
+    for name, case in report['cases'].items():
+        scores = '  '.join(f"{metric} {value:.3f}" if isinstance(value, float) else f"{metric} {value}"
+                           for metric, value in case['accuracy'].items())
+        print(f"{name:<25}{scores}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stage timings and ground-truth accuracy of the analysis on synthetic songs")
+    parser.add_argument('--output', help="write the JSON report here (default: stdout summary only)")
+    parser.add_argument('--compare', help="baseline JSON report to check for speed and accuracy regressions")
+    parser.add_argument('--cases', nargs='+', choices=[case[0] for case in CASES], help="run only these cases")
+    parser.add_argument('--repeats', type=int, default=3, help="runs per stage (the best one counts)")
+    parser.add_argument('--time-tolerance', type=float, default=TIME_TOLERANCE,
+                        help="relative slowdown that counts as a regression")
+    parser.add_argument('--accuracy-tolerance', type=float, default=ACCURACY_TOLERANCE,
+                        help="accuracy drop that counts as a regression")
+    args = parser.parse_args()
+
+    cases = [case for case in CASES if not args.cases or case[0] in args.cases]
+    report = run_suite(cases, args.repeats)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.time_tolerance, args.accuracy_tolerance)
+        print(f"\nAgainst {args.compare} (revision {baseline.get('revision')}): "
+              f"{len(regressions) or 'no'} regression{'s' if len(regressions) != 1 else ''}")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1 if regressions else 0)
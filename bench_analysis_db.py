@@ -0,0 +1,59 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import numpy as np
+import ana3
+import analysis_db
+import metadata_analysis
+
+
+def timed(function, repeats=20):
+    """Best wall time of a call in milliseconds, and its result"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write and query times of the analysis database for a library")
+    parser.add_argument('song', help="audio file whose analysis stands in for every song of the library")
+    parser.add_argument('--songs', type=int, default=500, help="library size")
+    args = parser.parse_args()
+
+    result = ana3.analyze_song(args.song)
+    with contextlib.redirect_stdout(io.StringIO()):
+        periods = metadata_analysis.analyze_moving_average_above_thresholds(result.beats)
+    db = analysis_db.AnalysisDB(os.path.join(tempfile.mkdtemp(), 'library.db'))
+    names = [f"song{i:04d}_artist{i % 37}" for i in range(args.songs)]
+
+    start = time.perf_counter()
+    for name in names:
+        db.save(args.song, result, periods, name=name)
+    save_ms = (time.perf_counter() - start) * 1000 / len(names)
+
+    loaded = db.load(names[-1])
+    assert np.array_equal(loaded.segment_table, result.segment_table)
+    assert np.array_equal(loaded.neighborhood_table, result.neighborhood_table)
+    assert np.array_equal(loaded.transition_table, result.transition_table)
+    assert np.array_equal(loaded.beat_times, result.beat_times)
+
+    print(f"{len(names)} songs x {len(result.segment_table)} beats, {len(result.neighborhood_table)} neighborhoods, "
+          f"{os.path.getsize(db.db_path) / 2**20:.1f} MB")
+    print(f"save (one transaction per song)      {save_ms:8.2f} ms/song")
+    for label, query in (
+            ("already analysed? (indexed lookup)", lambda: db.is_analysed(args.song)),
+            ("load one song's AnalysisResult", lambda: db.load(names[len(names) // 2])),
+            ("one song's beats in a 10 s window", lambda: db.segments_between(names[7], 30.0, 40.0)),
+            ("neighborhood playing at a time", lambda: db.neighborhood_at(names[7], 45.0)),
+            ("high-energy intervals, whole library", lambda: db.high_energy_intervals(min_duration=4.0)),
+            ("intensity periods, whole library", lambda: db.intensity_periods()),
+            ("list analysed songs", lambda: db.analysed_songs())):
+        ms, rows = timed(query)
+        count = len(rows) if isinstance(rows, list) else 1
+        print(f"{label:<37}{ms:8.2f} ms  ({count} rows)")
@@ -0,0 +1,91 @@
+import sys
+import time
+import numpy as np
+import librosa
+from scipy.ndimage import gaussian_filter1d
+import ana3
+
+
+def aggregate_beat_energy_loop(rms_energy, spectral_centroids, zero_crossing_rate, sr, beat_times, hop_length=512):
+    """Per-beat reference implementation that ana3.aggregate_beat_energy replaced"""
+    time_frames = librosa.frames_to_time(range(len(rms_energy)), sr=sr, hop_length=hop_length)
+
+    segments = []
+    for i in range(len(beat_times) - 1):
+        start_time = beat_times[i]
+        end_time = beat_times[i + 1]
+        start_frame = np.argmin(np.abs(time_frames - start_time))
+        end_frame = np.argmin(np.abs(time_frames - end_time))
+        if start_frame >= end_frame:
+            continue
+        segment_rms = np.mean(rms_energy[start_frame:end_frame])
+        segment_centroid = np.mean(spectral_centroids[start_frame:end_frame])
+        segment_zcr = np.mean(zero_crossing_rate[start_frame:end_frame])
+        silence_threshold = 0.01 * np.max(rms_energy)
+        if segment_rms < silence_threshold:
+            energy_score = 0.0
+        else:
+            energy_score = (
+                0.4 * (segment_rms / np.max(rms_energy)) +
+                0.4 * (segment_centroid / np.max(spectral_centroids)) +
+                0.2 * (segment_zcr / np.max(zero_crossing_rate))
+            )
+        segments.append({
+            'start_time': start_time,
+            'end_time': end_time,
+            'energy': energy_score,
+            'beat_number': i + 1,
+            'rms': segment_rms,
+            'centroid': segment_centroid,
+            'zcr': segment_zcr
+        })
+    return segments
+
+
+def synthetic_track(duration=600.0, sr=22050, bpm=120.0, seed=0):
+    """Noise bed with a click on every beat and alternating loud/quiet 20s sections"""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    t = np.arange(n) / sr
+    y = 0.05 * rng.standard_normal(n)
+    y *= np.where((t // 20) % 2 == 0, 1.0, 0.3)
+    click_t = np.arange(int(0.03 * sr)) / sr
+    click = np.exp(-click_t / 0.005) * np.sin(2 * np.pi * 1000 * click_t)
+    for onset in np.arange(0, duration, 60.0 / bpm):
+        i = int(onset * sr)
+        y[i:i + len(click)] += click[:n - i]
+    return y.astype(np.float32), sr
+
+
+def best_of(fn, repeats=5):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == "__main__":
+    # Usage: python bench_beat_energy.py [song.wav]   (defaults to a synthetic 10-minute track)
+    if len(sys.argv) > 1:
+        y, sr = librosa.load(sys.argv[1])
+    else:
+        y, sr = synthetic_track()
+    tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr, hop_length=512)
+    beat_times = librosa.frames_to_time(beat_frames, sr=sr, hop_length=512)
+
+    hop_length = 512
+    spectral_centroids = gaussian_filter1d(librosa.feature.spectral_centroid(y=y, sr=sr, hop_length=hop_length)[0], sigma=1)
+    rms_energy = gaussian_filter1d(librosa.feature.rms(y=y, hop_length=hop_length)[0], sigma=1)
+    zero_crossing_rate = librosa.feature.zero_crossing_rate(y, hop_length=hop_length)[0]
+    features = (rms_energy, spectral_centroids, zero_crossing_rate, sr, beat_times, hop_length)
+    print(f"Audio: {len(y) / sr:.1f}s, {len(rms_energy)} frames, {len(beat_times)} beats")
+
+    loop_time, expected = best_of(lambda: aggregate_beat_energy_loop(*features))
+    vector_time, actual = best_of(lambda: ana3.aggregate_beat_energy(*features))
+
+    assert ana3.segment_records(actual, classified=False) == expected, "vectorized segments differ from the per-beat loop"
+    print(f"Per-beat loop: {loop_time * 1000:.1f} ms")
+    print(f"Vectorized:    {vector_time * 1000:.1f} ms")
+    print(f"Speedup:       {loop_time / vector_time:.1f}x ({len(actual)} identical segments)")
@@ -0,0 +1,118 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+import ana3
+import audio_cache
+import stream_analysis
+from bench_metrics import match_f_measure
+
+
+def synthetic_song(path, duration=90.0, bpm=118.0, section_duration=10.0, sr=22050, seed=0):
+    """
+    Write a click track over alternating quiet and loud sections as a WAV
+
+    The clicks are the same throughout, so the offline beat tracker keeps every section
+    (real intros and outros often get trimmed) and both analyses see the same beats.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    loud = (t // section_duration) % 2 == 1
+    y = np.where(loud, 0.25, 0.06) * np.sin(2 * np.pi * 220 * t) + np.where(loud, 0.08, 0.01) * rng.standard_normal(len(t))
+    click_length = int(0.03 * sr)
+    click = 0.6 * np.exp(-np.arange(click_length) / (0.004 * sr)) * rng.standard_normal(click_length)
+    for beat in np.arange(0.5, duration - 0.1, 60.0 / bpm):
+        i = int(beat * sr)
+        y[i:i + click_length] += click[:len(y) - i]
+    sf.write(path, (0.9 * y / np.max(np.abs(y))).astype(np.float32), sr)
+    return path
+
+
+def replay(audio_file, chunk_duration=0.1, latency_beats=4):
+    """
+    Feed a song to IncrementalAnalyzer chunk by chunk, as a live source would deliver it
+
+    Returns:
+        (segments, emitted_at) - every emitted SEGMENT_DTYPE row, and the stream time in
+        seconds at which each row came out of poll()
+    """
+    y = audio_cache.load_analysis_audio(audio_file)[0]
+    analyzer = stream_analysis.IncrementalAnalyzer(latency_beats=latency_beats)
+    chunk = int(chunk_duration * analyzer.sr)
+    batches, emitted_at = [], []
+    for start in range(0, len(y), chunk):
+        analyzer.feed(y[start:start + chunk])
+        segments = analyzer.poll()
+        batches.append(segments)
+        emitted_at.extend([analyzer.n_samples / analyzer.sr] * len(segments))
+    segments = analyzer.finish()
+    batches.append(segments)
+    emitted_at.extend([len(y) / analyzer.sr] * len(segments))
+    return np.concatenate(batches), np.array(emitted_at)
+
+
+def agreement(offline, online, tolerance=0.07):
+    """
+    Match online segments to offline ones by end beat time and compare them
+
+    Returns:
+        {'beat_f', 'matched', 'energy_error', 'class_agreement'}, the last two as per-match arrays
+    """
+    offline_ends, online_ends = offline['end_time'], online['end_time']
+    nearest = np.clip(np.searchsorted(offline_ends, online_ends), 1, max(len(offline_ends) - 1, 1))
+    nearest = np.where(np.abs(offline_ends[nearest - 1] - online_ends) < np.abs(offline_ends[nearest] - online_ends),
+                       nearest - 1, nearest)
+    matched = (np.abs(offline_ends[nearest] - online_ends) <= tolerance) & \
+              (np.abs(offline['start_time'][nearest] - online['start_time']) <= tolerance)
+    offline_matched, online_matched = offline[nearest[matched]], online[matched]
+    return {
+        'beat_f': match_f_measure(offline_ends, online_ends, tolerance),
+        'matched': online_matched['end_time'],
+        'energy_error': np.abs(online_matched['energy'] - offline_matched['energy']) /
+                        np.maximum(offline_matched['energy'], 1e-9),
+        'class_agreement': online_matched['high_energy'] == offline_matched['high_energy']
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay songs through IncrementalAnalyzer and compare with the offline analysis")
+    parser.add_argument('songs', nargs='*', help="audio files (default: a synthetic song)")
+    parser.add_argument('--chunk', type=float, default=0.1, help="seconds of audio per feed() call")
+    parser.add_argument('--latency-beats', type=int, default=4)
+    parser.add_argument('--min-beat-f', type=float, default=0.9, help="required beat F-measure over the second half")
+    parser.add_argument('--min-agreement', type=float, default=0.85,
+                        help="required HIGH/LOW agreement over the second half")
+    args = parser.parse_args()
+    if not args.songs:
+        args.songs = [synthetic_song(os.path.join(tempfile.mkdtemp(), 'incremental_check.wav'))]
+
+    failures = 0
+    for audio_file in args.songs:
+        offline = ana3.analyze_song(audio_file).segment_table
+        start = time.perf_counter()
+        online, emitted_at = replay(audio_file, args.chunk, args.latency_beats)
+        seconds = time.perf_counter() - start
+        duration = audio_cache.default_cache().load(audio_file).duration
+
+        # Running maxima and median settle as the song goes on: judge convergence on the second half
+        half = duration / 2
+        second_half = agreement(offline[offline['end_time'] >= half], online[online['end_time'] >= half])
+        first_half = agreement(offline[offline['end_time'] < half], online[online['end_time'] < half])
+        streamed = emitted_at < duration  # the rows finish() flushes have no real latency
+        latency = emitted_at[streamed] - online['end_time'][streamed]
+
+        print(f"{audio_file}: {len(online)} online / {len(offline)} offline beats, "
+              f"{seconds:.2f} s for {duration:.1f} s of audio ({duration / seconds:.0f}x real time)")
+        print(f"  latency after beat: median {np.median(latency):.2f} s, max {np.max(latency):.2f} s")
+        for name, scores in (('first half', first_half), ('second half', second_half)):
+            print(f"  {name:<12} beat F {scores['beat_f']:.3f}   "
+                  f"energy error {np.median(scores['energy_error']):.1%}   "
+                  f"HIGH/LOW agreement {np.mean(scores['class_agreement']):.1%}")
+        if second_half['beat_f'] < args.min_beat_f or np.mean(second_half['class_agreement']) < args.min_agreement:
+            print("  FAILED: online analysis did not converge to the offline result")
+            failures += 1
+
+    if failures:
+        raise SystemExit(f"{failures} of {len(args.songs)} songs did not converge")
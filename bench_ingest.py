@@ -0,0 +1,66 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import lyrics_db
+from bench_lyrics_db import synthetic_timings
+from lyric_timings import WordTimings
+
+
+def aligned_library(n_songs, seed=0):
+    """(name, sentences, words) entries shaped like store_lyrics.align_song's output"""
+    songs = []
+    for i in range(n_songs):
+        sentences, words = synthetic_timings(seed=seed + i)
+        songs.append((f"song{i}_artist{i}", sentences,
+                      WordTimings.from_dict(words, sentences).as_dict()))
+    return songs
+
+
+def one_commit_per_song(db_path, songs):
+    """
+    What calling add_to_db in a loop did: a plain connection (rollback journal, full sync)
+    and one commit per song
+    """
+    conn = sqlite3.connect(db_path)
+    conn.executescript(lyrics_db.SCHEMA)
+    start = time.perf_counter()
+    for name, sentences, words in songs:
+        song_id = conn.execute("INSERT INTO songs (name) VALUES (?)", (name,)).lastrowid
+        conn.executemany("INSERT INTO sentences VALUES (?, ?, ?, ?, ?)", lyrics_db._timing_rows(song_id, sentences))
+        conn.executemany("INSERT INTO words VALUES (?, ?, ?, ?, ?)", lyrics_db._timing_rows(song_id, words))
+        conn.commit()
+    seconds = time.perf_counter() - start
+    conn.close()
+    return seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-song commits vs. one bulk upsert transaction")
+    parser.add_argument('--songs', type=int, default=2000, help="songs in the synthetic library")
+    parser.add_argument('--directory', default=None, help="where to create the test databases (default: a temp dir)")
+    args = parser.parse_args()
+
+    songs = aligned_library(args.songs)
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+        per_song_seconds = one_commit_per_song(os.path.join(tmp, 'per_song.db'), songs)
+
+        db_path = os.path.join(tmp, 'bulk.db')
+        db = lyrics_db.LyricsDB(db_path)
+        bulk = db.save_many(songs)
+        # Re-ingest with every song re-aligned: the stale rows must all be replaced
+        realigned = aligned_library(args.songs, seed=10000)
+        rerun = db.save_many(realigned)
+        for name, sentences, words in realigned[::97]:
+            assert db.sentence_timings(name) == sentences and db.timings(name).records() == list(words.values())
+        n_rows = db.conn.execute("SELECT (SELECT COUNT(*) FROM sentences) + (SELECT COUNT(*) FROM words)").fetchone()[0]
+        assert n_rows == sum(len(s) + len(w) for _, s, w in realigned), "stale rows left behind"
+        db_bytes = os.path.getsize(db_path) + os.path.getsize(db_path + '-wal') \
+            if os.path.exists(db_path + '-wal') else os.path.getsize(db_path)
+        db.close()
+
+    print(f"{bulk['songs']} songs, {bulk['rows']} rows ({db_bytes / 2**20:.1f} MB)\n")
+    print(f"one commit per song:   {per_song_seconds:7.2f} s  {bulk['rows'] / per_song_seconds:>10.0f} rows/s")
+    print(f"bulk, first ingestion: {bulk['seconds']:7.2f} s  {bulk['rows_per_second']:>10.0f} rows/s")
+    print(f"bulk, re-ingestion:    {rerun['seconds']:7.2f} s  {rerun['rows_per_second']:>10.0f} rows/s")
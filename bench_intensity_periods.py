@@ -0,0 +1,111 @@
+import contextlib
+import io
+import time
+import numpy as np
+import metadata_analysis
+
+
+def moving_average_loop(data, window_size):
+    """Per-beat moving average the vectorized one replaced"""
+    moving_avg = []
+    for i in range(len(data)):
+        if i < window_size - 1:
+            moving_avg.append(np.mean(data[:i + 1]))
+        else:
+            moving_avg.append(np.mean(data[i - window_size + 1:i + 1]))
+    return moving_avg
+
+
+def intensity_periods_loop(beats, moving_avg_window=5):
+    """Per-beat reference implementation that the vectorized period detector replaced"""
+    start_times, rms_values = beats['start_time'], beats['rms']
+    rms_mean = np.mean(rms_values)
+    rms_median = np.median(rms_values)
+    min_threshold = min(rms_mean, rms_median)
+
+    rms_moving_avg = moving_average_loop(rms_values, moving_avg_window)
+    above_both = (np.array(rms_moving_avg) > rms_mean) & (np.array(rms_moving_avg) > rms_median)
+
+    segments = []
+    start_idx = None
+    for i in range(len(above_both)):
+        if above_both[i] and start_idx is None:
+            start_idx = i
+        elif not above_both[i] and start_idx is not None:
+            segments.append((start_idx, i - 1))
+            start_idx = None
+    if start_idx is not None:
+        segments.append((start_idx, len(above_both) - 1))
+
+    merged_segments = []
+    for start, end in segments:
+        if not merged_segments:
+            merged_segments.append([start, end])
+            continue
+        gap_start = merged_segments[-1][1] + 1
+        gap_end = start - 1
+        gap_length = gap_end - gap_start + 1
+        if 0 < gap_length < 4 and all(val >= min_threshold for val in rms_moving_avg[gap_start:gap_end + 1]):
+            merged_segments[-1][1] = end
+        else:
+            merged_segments.append([start, end])
+
+    return [{'start_time': start_times[start], 'end_time': start_times[end]} for start, end in merged_segments]
+
+
+def synthetic_beat_table(rng, dtype, decimals=None):
+    """
+    Beat table with loud/quiet sections, short dips and noise, like a song's per-beat RMS
+
+    With decimals the RMS values are rounded, so many beats repeat a value and window
+    averages land exactly on the mean or median (a rounding error would flip those beats)
+    """
+    n_beats = int(rng.integers(8, 1200))
+    levels = []
+    while len(levels) < n_beats:
+        section = int(rng.integers(1, 40))
+        levels.extend([rng.uniform(0.02, 0.4)] * section)
+    rms = np.array(levels[:n_beats]) * rng.uniform(0.7, 1.3, n_beats)
+    # Brief dips of 1-5 beats, the case the merge rule is about
+    for start in rng.integers(0, n_beats, size=n_beats // 25):
+        rms[start:start + rng.integers(1, 6)] *= rng.uniform(0.1, 0.9)
+    if decimals is not None:
+        rms = np.round(rms, decimals)
+    start_time = np.cumsum(rng.uniform(0.3, 0.7, n_beats))
+    return {
+        'beat_number': np.arange(1, n_beats + 1),
+        'start_time': start_time,
+        'rms': rms.astype(dtype)
+    }
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    tables = [synthetic_beat_table(rng, dtype) for dtype in (np.float32, np.float64) for _ in range(150)]
+    tables += [synthetic_beat_table(rng, dtype, decimals) for dtype in (np.float32, np.float64)
+               for decimals in (1, 2) for _ in range(75)]
+
+    loop_time = vector_time = 0.0
+    for table in tables:
+        start = time.perf_counter()
+        expected = intensity_periods_loop(table)
+        loop_time += time.perf_counter() - start
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            actual = metadata_analysis.analyze_moving_average_above_thresholds(table)
+            vector_time += time.perf_counter() - start
+
+        assert actual == expected, f"periods differ on a {len(table['rms'])}-beat {table['rms'].dtype} table"
+        for window in (1, 3, 5, 8):
+            assert (metadata_analysis.moving_average(table['rms'], window).tolist()
+                    == moving_average_loop(table['rms'], window)), f"window {window} averages differ"
+
+    n_beats = sum(len(table['rms']) for table in tables)
+    n_periods = sum(len(intensity_periods_loop(table)) for table in tables)
+    print(f"{len(tables)} synthetic beat tables ({len(tables) // 2} with repeated RMS values), {n_beats} beats, "
+          f"{n_periods} periods: identical moving averages and periods")
+    # The vectorized time includes the prints and statistics the reference leaves out
+    print(f"Per-beat loop: {loop_time * 1000:.1f} ms")
+    print(f"Vectorized:    {vector_time * 1000:.1f} ms")
+    print(f"Speedup:       {loop_time / vector_time:.1f}x")
@@ -0,0 +1,110 @@
+import argparse
+import os
+import pickle
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import lyrics_db
+from bench_lyrics_db import synthetic_timings
+from lyric_timings import WordTimings
+
+
+def running_averages(word_timings):
+    """The per-key averaging loop main_prg and restoring_lyrics ran over the timing dicts"""
+    avg_gap = avg_dur = prev = 0.0
+    for i in range(len(word_timings)):
+        avg_gap = (avg_gap * i + (word_timings[i][1] - prev)) / (i + 1)
+        avg_dur = (avg_dur * i + (word_timings[i][2] - word_timings[i][1])) / (i + 1)
+        prev = word_timings[i][2]
+    return avg_dur, avg_gap
+
+
+def sentence_slices(word_timings, sentences):
+    """The per-sentence word lookup of create_lyric_video_pil over the timing dict"""
+    total_words, slices = 0, []
+    for k in range(len(sentences)):
+        n = len(sentences[k][0].split())
+        slices.append([word_timings[i] for i in range(total_words, total_words + n)])
+        total_words += n
+    return slices
+
+
+def per_call(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def traced_size(build):
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Timing dicts vs. the array-backed WordTimings")
+    parser.add_argument('--songs', type=int, default=200, help="songs held in memory for the memory figure")
+    parser.add_argument('--repeats', type=int, default=200, help="calls per timing")
+    args = parser.parse_args()
+
+    # A song's worth of lyrics (60 sentences of 8 words, ~5 minutes) for the timings, a library for the memory
+    library = [synthetic_timings(seed=seed) for seed in range(args.songs)]
+    dict_bytes, _ = traced_size(lambda: [pickle.loads(pickle.dumps(words)) for _, words in library])
+    array_bytes, _ = traced_size(lambda: [WordTimings.from_dict(words, sentences) for sentences, words in library])
+    sentences, words = library[0]
+    timings = WordTimings.from_dict(words, sentences)
+    view = timings.as_dict()
+
+    loop_seconds, (loop_dur, loop_gap) = per_call(lambda: running_averages(words), args.repeats)
+    array_seconds, (array_dur, array_gap) = per_call(lambda: (timings.average_duration(), timings.average_gap()),
+                                                     args.repeats)
+    assert abs(loop_dur - array_dur) < 1e-5 and abs(loop_gap - array_gap) < 1e-5, "averages differ"
+    assert running_averages(view) == running_averages(view) and len(view) == len(words)
+
+    def fresh_slices():
+        # A new container each time, so the one-off decoding of the records is included, as in a render
+        fresh = WordTimings(timings.vocabulary, timings.word_ids, timings.start, timings.end, timings.sentence_offsets)
+        return [fresh.sentence_records(k) for k in range(fresh.n_sentences)]
+    slice_dict_seconds, expected = per_call(lambda: sentence_slices(words, sentences), args.repeats)
+    slice_array_seconds, actual = per_call(fresh_slices, args.repeats)
+    slice_warm_seconds, _ = per_call(lambda: [timings.sentence_records(k) for k in range(timings.n_sentences)],
+                                     args.repeats)
+    assert actual == expected, "sentence slices differ"
+    assert view[7] == words[7] and timings.record(7) == words[7], "times are not the stored values"
+
+    # create_dct leaves out sentences it cannot match: the others must keep their own words
+    gapped = {k: sentence for k, sentence in sentences.items() if k not in (0, 3, 4, 17)}
+    gapped_timings = WordTimings.from_dict(words, gapped)
+    assert all(gapped_timings.sentence_records(k) == expected[k] for k in gapped), "gaps shift the words"
+    assert gapped_timings.n_sentences == len(sentences) and gapped_timings.sentence_span(3)[0] == 24
+    with tempfile.TemporaryDirectory() as tmp:
+        db = lyrics_db.LyricsDB(os.path.join(tmp, 'lyrics.db'))
+        db.save('gapped', gapped, words)
+        assert np.array_equal(db.timings('gapped').sentence_offsets, gapped_timings.sentence_offsets)
+        db.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, 'timings')
+        timings.save(directory)
+        load_seconds, loaded = per_call(lambda: WordTimings.load(directory), args.repeats)
+        assert loaded.records() == timings.records() and loaded.sentence_records(5) == expected[5]
+        pickle_path = os.path.join(tmp, 'words.pkl')
+        with open(pickle_path, 'wb') as f:
+            pickle.dump(words, f)
+
+        def unpickle():
+            with open(pickle_path, 'rb') as f:
+                return pickle.load(f)
+        unpickle_seconds, _ = per_call(unpickle, args.repeats)
+
+    print(f"{len(words)} words per song, {args.songs} songs in memory\n")
+    print(f"{'':<24}{'dict':>12}{'WordTimings':>14}")
+    print(f"{'library memory (MB)':<24}{dict_bytes / 2**20:>12.1f}{array_bytes / 2**20:>14.1f}")
+    print(f"{'averages (ms)':<24}{loop_seconds * 1000:>12.2f}{array_seconds * 1000:>14.3f}")
+    print(f"{'sentence slices (ms)':<24}{slice_dict_seconds * 1000:>12.2f}{slice_array_seconds * 1000:>14.2f}")
+    print(f"{'  already decoded (ms)':<24}{'':>12}{slice_warm_seconds * 1000:>14.2f}")
+    print(f"{'load from disk (ms)':<24}{unpickle_seconds * 1000:>12.2f}{load_seconds * 1000:>14.2f}")
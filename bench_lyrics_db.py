@@ -0,0 +1,135 @@
+import argparse
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+import numpy as np
+import lyrics_db
+
+
+def synthetic_timings(n_sentences=60, words_per_sentence=8, seed=0):
+    """Sentence and word timing dicts shaped like store_lyrics.create_dct's output"""
+    rng = np.random.default_rng(seed)
+    sentences, words = {}, {}
+    t = 5.0
+    for s in range(n_sentences):
+        sentence_words = []
+        sentence_start = t
+        for _ in range(words_per_sentence):
+            duration = float(rng.uniform(0.15, 0.5))
+            word = ''.join(rng.choice(list('abcdefghijklmnopqrstuvwxyz'), int(rng.integers(2, 8))))
+            words[len(words)] = (word, t, t + duration)
+            sentence_words.append(word)
+            t += duration + float(rng.uniform(0.02, 0.1))
+        sentences[s] = (' '.join(sentence_words).upper(), sentence_start, words[len(words) - 1][2])
+        t += float(rng.uniform(0.5, 3.0))
+    return sentences, words
+
+
+def pickled_library(db_path, n_songs):
+    """A lyricsdb2.db as store_lyrics wrote it before: one records_pickled blob per song and kind"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE IF NOT EXISTS records_pickled(record_id TEXT PRIMARY KEY, data BLOB NOT NULL)")
+    library = {}
+    for i in range(n_songs):
+        name = f"song{i}_artist{i}"
+        sentences, words = synthetic_timings(seed=i)
+        library[name] = (sentences, words)
+        conn.execute("INSERT INTO records_pickled VALUES (?, ?)", (name + 'sentences', pickle.dumps(sentences)))
+        conn.execute("INSERT INTO records_pickled VALUES (?, ?)", (name + 'words', pickle.dumps(words)))
+    conn.commit()
+    conn.close()
+    return library
+
+
+def pickled_words_between(db_path, name, start, end):
+    """A time range of words the old way: fetch and unpickle the whole blob, then filter"""
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("SELECT data FROM records_pickled WHERE record_id = ?", (name + 'words',)).fetchone()
+    conn.close()
+    words = pickle.loads(row[0])
+    return {i: w for i, w in words.items() if w[1] < end and w[2] > start}
+
+
+def pickled_style_read(db_path, name):
+    """Open a connection, read a song's sentences and words, close, as each caller did before the store"""
+    db = lyrics_db.LyricsDB(db_path)
+    try:
+        return db.sentence_timings(name), db.timings(name).as_dict()
+    finally:
+        db.close()
+
+
+def shared_reads(store, names, n_threads):
+    """Every thread reads every song through the same store; returns seconds and (name, timings) pairs"""
+    results = []
+
+    def read():
+        for song in names:
+            results.append((song, store.get_timings(song)))
+    threads = [threading.Thread(target=read) for _ in range(n_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, results
+
+
+def per_call(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate a pickled lyrics library and time the indexed lookups")
+    parser.add_argument('--songs', type=int, default=500, help="songs in the synthetic library")
+    parser.add_argument('--repeats', type=int, default=200, help="calls per timed lookup")
+    parser.add_argument('--threads', type=int, default=8, help="threads sharing one LyricsStore")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'lyricsdb2.db')
+        library = pickled_library(db_path, args.songs)
+
+        start = time.perf_counter()
+        db = lyrics_db.LyricsDB(db_path)
+        migrated = db.migrate_pickled()
+        migrate_seconds = time.perf_counter() - start
+        assert len(migrated) == args.songs and db.migrate_pickled() == [], "migration is not one-shot"
+        for name, (sentences, words) in library.items():
+            assert db.sentence_timings(name) == sentences and db.word_timings(name) == words, f"{name} differs"
+
+        names = sorted(library)
+        name = f"song{args.songs // 2}_artist{args.songs // 2}"
+        sentences, words = library[name]
+        expected = {i: w for i, w in words.items() if w[1] < 40.0 and w[2] > 30.0}
+        old_seconds, old_range = per_call(lambda: pickled_words_between(db_path, name, 30.0, 40.0), args.repeats)
+        range_seconds, new_range = per_call(lambda: db.words_between(name, 30.0, 40.0), args.repeats)
+        assert old_range == new_range == expected
+        # Every call opens its own connection and reads both tables, as the callers used to
+        open_seconds, _ = per_call(lambda: pickled_style_read(db_path, name), args.repeats)
+        store = lyrics_db.LyricsStore(db_path, max_songs=64)
+        cold_seconds, _ = per_call(lambda: [store.get_timings(n) for n in names[:64]], 1)
+        warm_seconds, _ = per_call(lambda: store.get_timings(names[0]), args.repeats)
+        threads_seconds, shared = shared_reads(store, names[:64], args.threads)
+        assert all(result == (library[n][0], store.get_words(n).as_dict()) for n, result in shared)
+        stats = store.stats()
+        store.close()
+        at_seconds, row = per_call(lambda: db.sentence_at(name, sentences[10][1] + 0.1), args.repeats)
+        assert row[0] == 10
+        db.close()
+
+        print(f"{args.songs} songs migrated in {migrate_seconds:.2f} s, "
+              f"database {os.path.getsize(db_path) / 2**20:.1f} MB (pickled rows kept)\n")
+        print(f"10 s of words, unpickling the blob:  {old_seconds * 1000:.3f} ms")
+        print(f"10 s of words, indexed query:        {range_seconds * 1000:.3f} ms")
+        print(f"sentence at a time:                  {at_seconds * 1000:.3f} ms")
+        print(f"whole song, new connection per call: {open_seconds * 1000:.3f} ms")
+        print(f"whole song, LyricsStore cold:        {cold_seconds / 64 * 1000:.3f} ms")
+        print(f"whole song, LyricsStore warm (LRU):  {warm_seconds * 1000:.4f} ms")
+        print(f"{args.threads} threads x 64 songs on one store: {threads_seconds * 1000:.1f} ms, {stats}")
@@ -0,0 +1,57 @@
+import numpy as np
+
+# Accuracy measures shared by the bench_*.py scripts: event times matched within a
+# tolerance, and overlap of time periods.
+
+
+def match_f_measure(reference, estimated, tolerance):
+    """
+    F-measure of two sets of event times, an event counting as found within +-tolerance seconds
+
+    Each reference event can be matched by at most one estimated event (greedy in time order).
+    """
+    reference = np.sort(np.asarray(reference, dtype=float))
+    estimated = np.sort(np.asarray(estimated, dtype=float))
+    if len(reference) == 0 and len(estimated) == 0:
+        return 1.0
+    if len(reference) == 0 or len(estimated) == 0:
+        return 0.0
+    matched = 0
+    j = 0
+    for t in reference:
+        while j < len(estimated) and estimated[j] < t - tolerance:
+            j += 1
+        if j < len(estimated) and estimated[j] <= t + tolerance:
+            matched += 1
+            j += 1
+    precision = matched / len(estimated)
+    recall = matched / len(reference)
+    return 2 * precision * recall / (precision + recall) if matched else 0.0
+
+
+def period_overlap(reference, estimated):
+    """Intersection over union of the time covered by two lists of {'start_time', 'end_time'} periods"""
+    def covered(periods):
+        return [(float(p['start_time']), float(p['end_time'])) for p in periods]
+
+    reference, estimated = covered(reference), covered(estimated)
+    union_length = _union_length(reference + estimated)
+    if union_length == 0:
+        return 1.0
+    intersection = sum(max(0.0, min(e1, e2) - max(s1, s2)) for s1, e1 in reference for s2, e2 in estimated)
+    return intersection / union_length
+
+
+def _union_length(intervals):
+    total = 0.0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
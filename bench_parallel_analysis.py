@@ -0,0 +1,40 @@
+import argparse
+import os
+import time
+import numpy as np
+import ana3
+import audio_cache
+
+
+def time_analysis(audio_file, serial, repeats=5):
+    """Best wall time of analyze_song over a few runs, and the last result"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = ana3.analyze_song(audio_file, serial=serial)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def same_result(a, b):
+    return (np.array_equal(a.beat_times, b.beat_times) and np.array_equal(a.segment_table, b.segment_table)
+            and np.array_equal(a.neighborhood_table, b.neighborhood_table)
+            and np.array_equal(a.transition_table, b.transition_table))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Wall time of one song's analysis, serial vs. on the thread pool")
+    parser.add_argument('songs', nargs='+', help="audio files")
+    parser.add_argument('--repeats', type=int, default=5, help="runs per mode (the best one counts)")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs\n")
+    print(f"{'song':<32}{'serial (s)':>12}{'threaded (s)':>14}{'speedup':>9}  identical")
+    for audio_file in args.songs:
+        # Decode and resample once outside the timings, and let librosa's beat tracker compile
+        audio_cache.load_analysis_audio(audio_file)
+        ana3.analyze_song(audio_file, serial=True)
+        serial_seconds, serial_result = time_analysis(audio_file, serial=True, repeats=args.repeats)
+        threaded_seconds, threaded_result = time_analysis(audio_file, serial=False, repeats=args.repeats)
+        print(f"{os.path.basename(audio_file):<32}{serial_seconds:>12.3f}{threaded_seconds:>14.3f}"
+              f"{serial_seconds / threaded_seconds:>8.2f}x  {same_result(serial_result, threaded_result)}")
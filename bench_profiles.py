@@ -0,0 +1,91 @@
+import argparse
+import contextlib
+import io
+import time
+import numpy as np
+import ana3
+import audio_cache
+import batch_analyze
+import metadata_analysis
+from bench_metrics import match_f_measure, period_overlap
+
+REFERENCE_PROFILE = 'precise'
+
+
+def neighborhood_boundaries(result):
+    """Times where one neighborhood ends and the next starts"""
+    return result.neighborhood_table['start_time'][1:]
+
+
+def run_profile(audio_file, profile):
+    """Analyse one song with one profile; returns seconds taken, the result and its high-intensity periods"""
+    start = time.perf_counter()
+    result = ana3.analyze_song(audio_file, profile=profile)
+    seconds = time.perf_counter() - start
+    with contextlib.redirect_stdout(io.StringIO()):
+        periods = metadata_analysis.analyze_moving_average_above_thresholds(result.beats)
+    return seconds, result, periods
+
+
+def compare_profiles(songs, beat_tolerance=0.07, boundary_tolerance=0.5):
+    """
+    Run every profile over the songs and score each against the reference profile
+
+    Returns:
+        {profile: {'seconds', 'beat_f', 'boundary_f', 'period_iou'}} averaged over songs
+        (seconds is the total)
+    """
+    scores = {profile: {'seconds': 0.0, 'beat_f': [], 'boundary_f': [], 'period_iou': []}
+              for profile in ana3.ANALYSIS_PROFILES}
+    warmed_up = False
+    for audio_file in songs:
+        try:
+            # Decode and resample outside the timings: the audio cache serves repeat runs without either
+            cached = audio_cache.default_cache().load(audio_file)
+            for profile in ana3.ANALYSIS_PROFILES:
+                cached.analysis(ana3.ANALYSIS_PROFILES[profile]['sr'])
+            if not warmed_up:
+                # librosa's beat tracker is JIT-compiled on first use; keep that out of the first profile's time
+                ana3.analyze_song(audio_file)
+                warmed_up = True
+            runs = {profile: run_profile(audio_file, profile) for profile in ana3.ANALYSIS_PROFILES}
+        except Exception as e:
+            print(f"Skipping {audio_file}: {type(e).__name__}: {e}")
+            continue
+        _, reference, reference_periods = runs[REFERENCE_PROFILE]
+        for profile, (seconds, result, periods) in runs.items():
+            score = scores[profile]
+            score['seconds'] += seconds
+            score['beat_f'].append(match_f_measure(reference.beat_times, result.beat_times, beat_tolerance))
+            score['boundary_f'].append(match_f_measure(neighborhood_boundaries(reference),
+                                                       neighborhood_boundaries(result), boundary_tolerance))
+            score['period_iou'].append(period_overlap(reference_periods, periods))
+
+    return {profile: {'seconds': score['seconds'],
+                      'beat_f': float(np.mean(score['beat_f'])),
+                      'boundary_f': float(np.mean(score['boundary_f'])),
+                      'period_iou': float(np.mean(score['period_iou']))}
+            for profile, score in scores.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Wall time and agreement with the precise profile for every analysis profile")
+    parser.add_argument('directory', nargs='?', default='.', help="folder with <title>_<artist>.wav songs (default: current)")
+    parser.add_argument('--beat-tolerance', type=float, default=0.07, help="beat match window in seconds")
+    parser.add_argument('--boundary-tolerance', type=float, default=0.5, help="neighborhood boundary match window in seconds")
+    args = parser.parse_args()
+
+    songs = batch_analyze.find_songs(args.directory)
+    if not songs:
+        raise SystemExit(f"No songs found in {args.directory}")
+    print(f"{len(songs)} songs, reference profile '{REFERENCE_PROFILE}'\n")
+    summary = compare_profiles(songs, args.beat_tolerance, args.boundary_tolerance)
+
+    reference_seconds = summary[REFERENCE_PROFILE]['seconds']
+    print(f"{'profile':<10}{'sr':>7}{'hop':>6}{'n_fft':>7}{'time (s)':>10}{'speedup':>9}"
+          f"{'beat F':>9}{'bound. F':>10}{'period IoU':>12}")
+    for profile, score in summary.items():
+        resolution = ana3.ANALYSIS_PROFILES[profile]
+        print(f"{profile:<10}{resolution['sr']:>7}{resolution['hop_length']:>6}{resolution['n_fft']:>7}"
+              f"{score['seconds']:>10.2f}{reference_seconds / score['seconds']:>8.1f}x"
+              f"{score['beat_f']:>9.3f}{score['boundary_f']:>10.3f}{score['period_iou']:>12.3f}")
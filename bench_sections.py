@@ -0,0 +1,59 @@
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import section_detection
+from bench_metrics import match_f_measure
+
+
+def synthetic_features(n_beats, section_beats=32, n_features=24, seed=0):
+    """
+    Beat-level features of a song built from a few repeating sections
+
+    Every section type has its own feature centroid; beats add noise around it.
+
+    Returns:
+        (features, section index of every beat, the section types in order)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((5, n_features))
+    n_sections = -(-n_beats // section_beats)
+    order = rng.integers(0, len(centroids), n_sections)
+    section_of_beat = np.repeat(np.arange(n_sections), section_beats)[:n_beats]
+    features = centroids[order[section_of_beat]] + 0.5 * rng.standard_normal((n_beats, n_features))
+    return features.astype(np.float32), section_of_beat, order
+
+
+def measure(n_beats, block_size=1024):
+    """
+    Run the detector on synthetic features of n_beats beats
+
+    Returns:
+        seconds, peak traced bytes, detected sections and the times where the section type changes
+        (a boundary between two sections of the same type is invisible to any detector)
+    """
+    features, section_of_beat, order = synthetic_features(n_beats)
+    beat_times = np.arange(n_beats + 1) * 0.5
+    tracemalloc.start()
+    start = time.perf_counter()
+    sections = section_detection.sections_from_features(features, beat_times, block_size=block_size)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    type_changes = beat_times[np.flatnonzero(np.diff(order[section_of_beat])) + 1]
+    return seconds, peak, sections, type_changes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and peak memory of the self-similarity section detector")
+    parser.add_argument('--beats', type=int, nargs='+', default=[400, 1200, 4800, 14400],
+                        help="input lengths in beats (1200 ~ a 10-minute song at 120 BPM)")
+    args = parser.parse_args()
+
+    print(f"{'beats':>7}{'time (s)':>10}{'peak MB':>9}{'dense f64 MB':>14}{'sections':>10}{'boundary F':>12}")
+    for n_beats in args.beats:
+        seconds, peak, sections, type_changes = measure(n_beats)
+        found = [section['start_time'] for section in sections[1:]]
+        boundary_f = match_f_measure(type_changes, found, tolerance=1.0)
+        print(f"{n_beats:>7}{seconds:>10.2f}{peak / 2**20:>9.1f}{n_beats**2 * 8 / 2**20:>14.1f}"
+              f"{len(sections):>10}{boundary_f:>12.3f}")
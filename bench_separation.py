@@ -0,0 +1,132 @@
+import argparse
+import os
+import tempfile
+import time
+import separation_worker
+
+STUB_LOAD_SECONDS = 1.0
+
+
+def load_per_song(songs):
+    """What add_to_db did: build htdemucs and load its weights for every song, then separate"""
+    seconds = []
+    for audio_file in songs:
+        start = time.perf_counter()
+        model, device = separation_worker.load_model()
+        separation_worker.separate_stems(model, audio_file, audio_file[:-4], device)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def warm_worker(songs, torch_threads, max_jobs):
+    """Per-song latency through a SeparationWorker whose model was loaded beforehand"""
+    worker = separation_worker.SeparationWorker(torch_threads=torch_threads, max_jobs=max_jobs)
+    worker.start()
+    seconds = []
+    for audio_file in songs:
+        start = time.perf_counter()
+        worker.separate(audio_file)
+        seconds.append(time.perf_counter() - start)
+    stats = worker.stats()
+    worker.close()
+    return seconds, stats
+
+
+def stub_load(device, torch_threads):
+    """Stand-in for load_model: takes STUB_LOAD_SECONDS, like loading weights, without torch"""
+    time.sleep(STUB_LOAD_SECONDS)
+    return 'stub-model', device or 'cpu'
+
+
+def stub_separate(model, audio_file, vocals_prefix, device):
+    """Stand-in for separate_stems: returns the paths and the worker's pid; a song named 'crash' kills the worker"""
+    if os.path.basename(audio_file).startswith('crash'):
+        os._exit(3)
+    if os.path.basename(audio_file).startswith('broken'):
+        raise ValueError("cannot decode")
+    return {'vocals': vocals_prefix + '_vocals.wav', 'instrumental': vocals_prefix + '_instrumental.wav',
+            'pid': os.getpid(), 'model': model}
+
+
+def check_lifecycle(max_jobs=3):
+    """
+    Run the worker's process handling with the stub model: warm_up, recycling after max_jobs,
+    a song that fails, and the process dying between and during jobs
+
+    Returns:
+        (seconds of the first song after warm_up, seconds of a song after a restart, stats)
+    """
+    worker = separation_worker.SeparationWorker(max_jobs=max_jobs, load=stub_load, separate=stub_separate)
+    song = os.path.join(tempfile.gettempdir(), 'song_artist.wav')
+
+    separation_worker.warm_up(worker).join()
+    assert worker.stats()['running'] and worker.model_loads == 1, "warm_up did not load the model"
+    start = time.perf_counter()
+    pids = [worker.separate(song)['pid']]
+    warm_seconds = time.perf_counter() - start
+    assert pids[0] == worker.process.pid
+
+    # max_jobs songs per process, then a fresh one
+    for _ in range(2 * max_jobs - 1):
+        pids.append(worker.separate(song)['pid'])
+    assert len(set(pids[:max_jobs])) == 1 and len(set(pids[max_jobs:])) == 1 and pids[0] != pids[-1], pids
+    assert worker.model_loads == 2 and not worker.stats()['running'], "worker not recycled after max_jobs"
+
+    # A failing song is reported and counts towards max_jobs; the same process takes the next song
+    first = worker.separate(song)['pid']
+    try:
+        worker.separate('broken.wav')
+        raise AssertionError("the failure was not reported")
+    except RuntimeError as e:
+        assert 'cannot decode' in str(e)
+    assert worker.separate(song)['pid'] == first and worker.model_loads == 3
+
+    # Killed between jobs (that third song recycled the process, so this one runs in a new one):
+    # the next song starts another
+    worker.separate(song)
+    worker.process.kill()
+    worker.process.join()
+    start = time.perf_counter()
+    after_kill = worker.separate(song)['pid']
+    restart_seconds = time.perf_counter() - start
+    assert after_kill != first and worker.model_loads == 5
+
+    # Dying during a job: that song fails, the next one gets a new process
+    try:
+        worker.separate('crash.wav')
+        raise AssertionError("the crash was not reported")
+    except RuntimeError as e:
+        assert 'exited' in str(e), e
+    assert worker.separate(song)['pid'] != after_kill and worker.model_loads == 6
+    stats = worker.stats()
+    worker.close()
+    assert not worker.stats()['running']
+    return warm_seconds, restart_seconds, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-song separation latency: model loaded per song vs. a warm worker")
+    parser.add_argument('songs', nargs='*', help="audio files (their stems are written next to them)")
+    parser.add_argument('--torch-threads', type=int, default=None, help="PyTorch threads in the worker")
+    parser.add_argument('--max-jobs', type=int, default=20, help="songs per worker process")
+    parser.add_argument('--stub', action='store_true',
+                        help="check warm-up, recycling and restarts with a stub model (no torch / demucs needed)")
+    args = parser.parse_args()
+
+    if args.stub:
+        warm_seconds, restart_seconds, stats = check_lifecycle()
+        print("Stub model: warm_up, recycling after max_jobs, a failing song and restarts all behave")
+        print(f"first song after warm_up: {warm_seconds * 1000:.1f} ms, song after a restart: "
+              f"{restart_seconds * 1000:.0f} ms (stub load takes {STUB_LOAD_SECONDS:.1f} s)")
+        print(f"{stats}")
+        print("These times are the process handling only; run with songs (and torch / demucs) for real latencies.")
+    if args.songs:
+        cold = load_per_song(args.songs)
+        warm, stats = warm_worker(args.songs, args.torch_threads, args.max_jobs)
+        print(f"{'song':<40}{'load per song (s)':>19}{'warm worker (s)':>17}")
+        for audio_file, cold_seconds, warm_seconds in zip(args.songs, cold, warm):
+            print(f"{audio_file:<40}{cold_seconds:>19.2f}{warm_seconds:>17.2f}")
+        print(f"\nModel loads: {stats['model_loads']} taking {stats['load_seconds']:.2f}s in total, "
+              f"for {stats['jobs']} songs")
+    elif not args.stub:
+        parser.error("give audio files to time, or --stub")
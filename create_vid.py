@@ -2,8 +2,7 @@ from moviepy.config import change_settings
 change_settings({"IMAGEMAGICK_BINARY": None})
 
 from moviepy.video.tools.drawing import color_gradient
-import sqlite3
-import pickle
+import lyrics_db
 
 import moviepy.editor as mp
 import numpy as np
@@ -354,11 +353,6 @@ def parse_lrc_file(lrc_file):
 '''
 if __name__ == "__main__":
 
-    conn=sqlite3.connect("lyricsdb.db")
-    c=conn.cursor()
-    c.execute("SELECT data FROM records_pickled WHERE record_id = ? ",("GORILLAZ_RHINESTONEEYES",))
-    row=c.fetchone()
-    restored={}
-    if row:
-        restored=pickle.loads(row[0])
+    # lyricsdb.db needs a one-time "python lyrics_db.py lyricsdb.db" to move its pickled rows over
+    restored=lyrics_db.default_store("lyricsdb.db").get_sentences("GORILLAZ_RHINESTONEEYES")
     create_lyric_video_pil("audio.wav",lyrics_with_timing=restored)
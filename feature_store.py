@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import shutil
+from functools import cached_property
+import numpy as np
+from analysis_cache import file_digest
+
+FEATURE_STORE_DIR = '.feature_store'
+# Bump whenever the stored features change so entries written by older code stop matching
+FEATURE_VERSION = 1
+FEATURE_NAMES = ('chroma', 'mfcc', 'mfcc_delta')
+
+
+def feature_params(profile='default', n_mfcc=13, hpss=True, beats=None):
+    """
+    Parameters that determine a song's beat-synchronous features (the key besides the audio itself)
+
+    Args:
+        profile: ana3 analysis profile; gives the beats and the sr / hop_length the features use
+        n_mfcc: number of MFCCs (and of their deltas)
+        hpss: compute chroma on the harmonic part of the signal, as advanced_librosa.py does
+        beats: beats_digest of beat times given by the caller (None: the beats of ana3.analyze_song)
+    """
+    params = {'profile': profile, 'n_mfcc': n_mfcc, 'hpss': hpss}
+    if beats is not None:
+        params['beats'] = beats
+    return params
+
+
+def beats_digest(beat_times):
+    """Content digest of a beat grid, so features synced to other beats get their own entry"""
+    return hashlib.sha256(np.ascontiguousarray(beat_times, dtype=np.float64).tobytes()).hexdigest()
+
+
+def params_digest(params):
+    payload = json.dumps({'version': FEATURE_VERSION, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class BeatFeatures:
+    """
+    Beat-synchronous features of one song, memory-mapped from the feature store
+
+    Row i of every array covers the interval from beat_times[i] to beat_times[i + 1]:
+    chroma (median over the interval), mfcc and mfcc_delta (means). Arrays are float16
+    and only mapped when first accessed, so reading them needs neither librosa nor the audio.
+    """
+
+    def __init__(self, entry_dir):
+        self.entry_dir = entry_dir
+        with open(os.path.join(entry_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+    def _array(self, name):
+        return np.load(os.path.join(self.entry_dir, f'{name}.npy'), mmap_mode='r')
+
+    @property
+    def params(self):
+        return self.meta['params']
+
+    @cached_property
+    def beat_times(self):
+        return self._array('beat_times')
+
+    @cached_property
+    def chroma(self):
+        return self._array('chroma')
+
+    @cached_property
+    def mfcc(self):
+        return self._array('mfcc')
+
+    @cached_property
+    def mfcc_delta(self):
+        return self._array('mfcc_delta')
+
+    @cached_property
+    def stacked(self):
+        """chroma | mfcc | mfcc_delta per beat interval, the beat_features stack of advanced_librosa.py"""
+        return np.hstack([self.chroma, self.mfcc, self.mfcc_delta])
+
+    def __len__(self):
+        return self.meta['n_intervals']
+
+
+def compute_beat_features(audio_file, params, beat_times=None):
+    """
+    Beat-synchronous chroma, MFCC and MFCC deltas of a song
+
+    Beats are the given beat_times (e.g. those of an analysis the caller already ran,
+    possibly on a stem), else they come from ana3.analyze_song (through the default
+    analysis cache); either way rows line up with the beats the rest of the pipeline uses.
+
+    Returns:
+        dict of arrays: beat_times and (n_beats - 1, n) float16 feature matrices
+    """
+    import librosa
+    import ana3
+    import analysis_cache
+    import audio_cache
+
+    resolution = ana3.analysis_resolution(params['profile'])
+    if beat_times is None:
+        beat_times = ana3.analyze_song(audio_file, cache=analysis_cache.default_cache(),
+                                       profile=params['profile']).beat_times
+    y, sr = audio_cache.load_analysis_audio(audio_file, sr=resolution['sr'])
+    y = np.asarray(y)
+    hop_length = resolution['hop_length']
+
+    mfcc = librosa.feature.mfcc(y=y, sr=sr, hop_length=hop_length, n_mfcc=params['n_mfcc'])
+    mfcc_delta = librosa.feature.delta(mfcc)
+    harmonic = librosa.effects.harmonic(y) if params['hpss'] else y
+    chroma = librosa.feature.chroma_cqt(y=harmonic, sr=sr, hop_length=hop_length)
+
+    beat_times = np.asarray(beat_times, dtype=np.float64)
+    beat_frames = librosa.time_to_frames(beat_times, sr=sr, hop_length=hop_length)
+    features = {'beat_times': beat_times}
+    if len(beat_frames) < 2:
+        for name, data in (('chroma', chroma), ('mfcc', mfcc), ('mfcc_delta', mfcc_delta)):
+            features[name] = np.zeros((0, data.shape[0]), dtype=np.float16)
+        return features
+    # pad=False: one column per interval between consecutive beats, none before the first or after the last
+    features['chroma'] = librosa.util.sync(chroma, beat_frames, aggregate=np.median, pad=False).T
+    features['mfcc'] = librosa.util.sync(mfcc, beat_frames, pad=False).T
+    features['mfcc_delta'] = librosa.util.sync(mfcc_delta, beat_frames, pad=False).T
+    for name in FEATURE_NAMES:
+        features[name] = np.ascontiguousarray(features[name], dtype=np.float16)
+    return features
+
+
+class FeatureStore:
+    """
+    Compute-once store of beat-synchronous features keyed by audio content and feature parameters
+
+    Each entry is a directory <audio sha256>-<params sha256> with one .npy per array and
+    meta.json, written last to mark the entry complete. Looking a song up hashes the
+    file but never decodes it; entries() walks the whole library without the audio at all.
+    """
+
+    def __init__(self, store_dir=FEATURE_STORE_DIR):
+        self.store_dir = store_dir
+        self.hits = 0
+        self.computes = 0
+        os.makedirs(store_dir, exist_ok=True)
+
+    def entry_dir(self, audio_file, params):
+        return os.path.join(self.store_dir, f"{file_digest(audio_file)}-{params_digest(params)}")
+
+    def get(self, audio_file, beat_times=None, **params):
+        """BeatFeatures of a song if already stored, else None"""
+        if beat_times is not None:
+            params['beats'] = beats_digest(beat_times)
+        entry_dir = self.entry_dir(audio_file, feature_params(**params))
+        if not os.path.exists(os.path.join(entry_dir, 'meta.json')):
+            return None
+        self.hits += 1
+        return BeatFeatures(entry_dir)
+
+    def load(self, audio_file, beat_times=None, **params):
+        """
+        BeatFeatures of a song, computing and storing them on first use
+
+        Args:
+            beat_times: beats to sync the features to (default: those of ana3.analyze_song with the profile)
+            params: see feature_params
+        """
+        features = self.get(audio_file, beat_times, **params)
+        if features is None:
+            if beat_times is not None:
+                params['beats'] = beats_digest(beat_times)
+            params = feature_params(**params)
+            entry_dir = self.entry_dir(audio_file, params)
+            self._write(entry_dir, compute_beat_features(audio_file, params, beat_times),
+                        {'audio_file': os.path.basename(audio_file), 'params': params})
+            self.computes += 1
+            features = BeatFeatures(entry_dir)
+        return features
+
+    def entries(self):
+        """BeatFeatures of every stored song"""
+        for name in sorted(os.listdir(self.store_dir)):
+            entry_dir = os.path.join(self.store_dir, name)
+            if os.path.exists(os.path.join(entry_dir, 'meta.json')):
+                yield BeatFeatures(entry_dir)
+
+    def invalidate(self, audio_file=None):
+        """Drop every entry for one song (any parameters), or the whole store"""
+        prefix = file_digest(audio_file) + '-' if audio_file else ''
+        names = [name for name in os.listdir(self.store_dir) if name.startswith(prefix)]
+        for name in names:
+            shutil.rmtree(os.path.join(self.store_dir, name), ignore_errors=True)
+        return len(names)
+
+    def stats(self):
+        return {'hits': self.hits, 'computes': self.computes,
+                'entries': sum(1 for _ in self.entries())}
+
+    def _write(self, entry_dir, arrays, meta):
+        # Build the entry under a temporary name and rename it into place in one step
+        tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), array)
+        meta['n_intervals'] = len(arrays['chroma'])
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)  # another process stored it first
+
+
+_default_store = None
+
+
+def default_store():
+    """Process-wide store in ./.feature_store"""
+    global _default_store
+    if _default_store is None:
+        _default_store = FeatureStore()
+    return _default_store
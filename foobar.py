@@ -557,7 +557,7 @@ def create_lyric_video_pil(audio_file: str, lyrics_with_timing: Dict[int, Tuple[
     # Load audio
     audio = mp.AudioFileClip(audio_file).subclipped(0,6)
     duration = audio.duration
-    neighborhoods, stats, significant_transitions,timestamps=ana3.main_with_neighborhoods(audio_file)
+    neighborhoods, stats, significant_transitions,timestamps=ana3.main_with_neighborhoods(audio_file,export=True)
 
     
     avg_dur=0.0
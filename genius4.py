@@ -2,8 +2,8 @@ import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 from PIL import Image, ImageTk, ImageDraw, ImageFont
 import main_prg 
-import lyricsgenius,pickle,sqlite3
-import store_lyrics,spotifyimagedownloader
+import lyricsgenius
+import lyrics_db,separation_worker,store_lyrics,spotifyimagedownloader
 import threading,os
 from PIL import Image, ImageTk
 
@@ -34,6 +34,9 @@ class LyricsDownloaderGUI:
         
         # Start automatic authentication
         self.auto_authenticate()
+
+        # Load htdemucs in the separation worker now, so the first song does not wait for it
+        separation_worker.warm_up()
     
     def setup_background(self):
         """Setup canvas with background image and PIL-drawn text"""
@@ -367,21 +370,7 @@ class LyricsDownloaderGUI:
             store_lyrics.add_to_db(f"{title_clean.lower()}_{artist_clean.lower()}")
 
             name=f"{title_clean.lower()}_{artist_clean.lower()}"
-            conn=sqlite3.connect("lyricsdb2.db")
-            c=conn.cursor()
-            c.execute("SELECT data FROM records_pickled WHERE record_id = ? ",(name+"sentences",))
-            row=c.fetchone()
-            c.execute("SELECT data FROM records_pickled WHERE record_id = ? ",(name+"words",))
-            word_timings=c.fetchone()
-
-            if word_timings:
-                dct={}
-                dct=pickle.loads(word_timings[0])
-                word_timings=dct
-
-            restored={}
-            if row:
-                restored=pickle.loads(row[0])
+            restored,word_timings=lyrics_db.default_store().get_timings(name)
 
             main_prg.create_lyric_video_pil(artist=self.current_song.artist,title=self.current_song.title,audio_file=name+".wav",lyrics_with_timing=restored,word_timings=word_timings)
 
@@ -0,0 +1,220 @@
+import json
+import os
+from collections.abc import Mapping
+import numpy as np
+
+# Word timings as columns instead of {index: (word, start, end)}: float64 start / end
+# arrays (the exact values the aligner and the database hold), an int32 index into a
+# table of distinct words, and sentence boundaries as offsets into the word arrays
+# (sentence i is words sentence_offsets[i]:sentence_offsets[i + 1]). TimingsDict is the
+# old dict view for code that still indexes word by word.
+
+# Row layout of the words file save() writes (little-endian, no header)
+WORD_DTYPE = np.dtype([('word_id', '<i4'), ('start', '<f8'), ('end', '<f8')])
+
+
+def sentence_offsets(word_start, sentence_timings):
+    """
+    Word offsets of the sentences in {index: (sentence, start, end)} timings
+
+    create_dct leaves out the sentences it cannot match to the aligned words, so the keys
+    can have gaps. A stored sentence starts at the first word (after the previous
+    sentence) starting at its start time and takes as many words as it has; a left-out
+    sentence gets the words up to the next stored one.
+
+    Returns:
+        (max key + 2,) int64 offsets, sentence k being words offsets[k]:offsets[k + 1]
+    """
+    n_sentences = max(sentence_timings) + 1 if sentence_timings else 0
+    firsts = {}
+    position = 0
+    for k in sorted(sentence_timings):
+        text, start, _ = sentence_timings[k]
+        firsts[k] = position + int(np.searchsorted(word_start[position:], start, side='left'))
+        position = firsts[k] + len(text.split())
+    offsets = np.zeros(n_sentences + 1, dtype=np.int64)
+    for k in range(n_sentences):
+        if k in firsts:
+            offsets[k] = firsts[k]
+            offsets[k + 1] = firsts[k] + len(sentence_timings[k][0].split())
+        else:
+            offsets[k + 1] = firsts.get(k + 1, offsets[k])
+    return offsets
+
+
+class WordTimings:
+    """
+    Start and end times of every aligned word of a song, column-wise
+
+    Attributes:
+        vocabulary: distinct words (each stored once)
+        word_ids: (n_words,) int32 index into vocabulary
+        start, end: (n_words,) float64 seconds
+        sentence_offsets: (n_sentences + 1,) int64 word offsets, or None when the
+                          sentences are not known
+    """
+
+    def __init__(self, vocabulary, word_ids, start, end, sentence_offsets=None):
+        self.vocabulary = vocabulary
+        self.word_ids = word_ids
+        self.start = start
+        self.end = end
+        self.sentence_offsets = sentence_offsets
+        self._records = None  # every (word, start, end), decoded on first use
+
+    @classmethod
+    def from_records(cls, records, sentences=None):
+        """
+        Build from (word, start, end) records in word order
+
+        Args:
+            records: iterable of (word, start, end)
+            sentences: sentence texts in order; each takes as many words as it has
+                       (the way create_lyric_video_pil splits the words between sentences)
+        """
+        vocabulary, ids, word_ids, start, end = [], {}, [], [], []
+        for word, word_start, word_end in records:
+            if word not in ids:
+                ids[word] = len(vocabulary)
+                vocabulary.append(word)
+            word_ids.append(ids[word])
+            start.append(word_start)
+            end.append(word_end)
+        offsets = None
+        if sentences is not None:
+            offsets = np.concatenate(([0], np.cumsum([len(text.split()) for text in sentences]))).astype(np.int64)
+        return cls(vocabulary, np.array(word_ids, dtype=np.int32), np.array(start, dtype=np.float64),
+                   np.array(end, dtype=np.float64), offsets)
+
+    @classmethod
+    def from_aligned(cls, words, sentences=None):
+        """Build from ForceAlign's inference() output (objects with .word / .time_start / .time_end)"""
+        return cls.from_records(((w.word, w.time_start, w.time_end) for w in words), sentences)
+
+    @classmethod
+    def from_dict(cls, word_timings, sentence_timings=None):
+        """
+        Build from the {index: (word, start, end)} dicts stored so far
+
+        Args:
+            word_timings: {index: (word, start, end)}, indexes 0..n-1 (a TimingsDict or
+                          WordTimings is passed through as is)
+            sentence_timings: optional {index: (sentence, start, end)} giving the sentence boundaries
+                              (see sentence_offsets)
+        """
+        if isinstance(word_timings, TimingsDict):
+            word_timings = word_timings.timings
+        if isinstance(word_timings, WordTimings):
+            return word_timings
+        timings = cls.from_records(word_timings[i] for i in range(len(word_timings)))
+        if sentence_timings is not None:
+            timings.sentence_offsets = sentence_offsets(timings.start, sentence_timings)
+        return timings
+
+    def __len__(self):
+        return len(self.start)
+
+    @property
+    def n_sentences(self):
+        return 0 if self.sentence_offsets is None else len(self.sentence_offsets) - 1
+
+    def word(self, index):
+        return self.vocabulary[self.word_ids[index]]
+
+    def record(self, index):
+        """(word, start, end) of one word, as the dicts held it"""
+        return self.vocabulary[self.word_ids[index]], float(self.start[index]), float(self.end[index])
+
+    def records(self, start=0, stop=None):
+        """(word, start, end) of words start..stop-1 (the whole song is decoded once, then sliced)"""
+        if self._records is None:
+            self._records = list(zip([self.vocabulary[i] for i in self.word_ids.tolist()],
+                                     self.start.tolist(), self.end.tolist()))
+        return self._records[start:stop]
+
+    def sentence_span(self, sentence_index):
+        """[first, stop) word indexes of a sentence"""
+        return int(self.sentence_offsets[sentence_index]), int(self.sentence_offsets[sentence_index + 1])
+
+    def sentence_records(self, sentence_index):
+        return self.records(*self.sentence_span(sentence_index))
+
+    def durations(self):
+        return self.end - self.start
+
+    def gaps(self):
+        """Silence before every word: from the previous word's end (from 0 for the first word)"""
+        return self.start - np.concatenate(([0.0], self.end[:-1]))
+
+    def average_duration(self):
+        """Mean word duration in seconds (0.0 without words)"""
+        return float(np.mean(self.durations())) if len(self) else 0.0
+
+    def average_gap(self):
+        """Mean gap before a word in seconds (0.0 without words)"""
+        return float(np.mean(self.gaps())) if len(self) else 0.0
+
+    def words_between(self, start, end):
+        """[first, stop) indexes of the words overlapping [start, end) seconds (words are in time order)"""
+        first = int(np.searchsorted(self.end, start, side='right'))
+        stop = int(np.searchsorted(self.start, end, side='left'))
+        return first, max(first, stop)
+
+    def as_dict(self):
+        return TimingsDict(self)
+
+    def save(self, directory):
+        """
+        Write the word columns as one raw file of WORD_DTYPE rows that load() can memory-map,
+        and the vocabulary and sentence offsets as JSON (two small files, so a load is two opens)
+        """
+        os.makedirs(directory, exist_ok=True)
+        words = np.empty(len(self), dtype=WORD_DTYPE)
+        words['word_id'], words['start'], words['end'] = self.word_ids, self.start, self.end
+        words.tofile(os.path.join(directory, 'words.bin'))
+        offsets = None if self.sentence_offsets is None else np.asarray(self.sentence_offsets).tolist()
+        with open(os.path.join(directory, 'timings.json'), 'w', encoding='utf-8') as f:
+            json.dump({'n_words': len(self), 'vocabulary': list(self.vocabulary), 'sentence_offsets': offsets}, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Read what save() wrote; with mmap the word columns are mapped rather than copied"""
+        with open(os.path.join(directory, 'timings.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        words_file = os.path.join(directory, 'words.bin')
+        if meta['n_words'] == 0:
+            words = np.empty(0, dtype=WORD_DTYPE)
+        elif mmap:
+            words = np.memmap(words_file, dtype=WORD_DTYPE, mode='r', shape=(meta['n_words'],))
+        else:
+            words = np.fromfile(words_file, dtype=WORD_DTYPE, count=meta['n_words'])
+        offsets = meta['sentence_offsets']
+        return cls(meta['vocabulary'], words['word_id'], words['start'], words['end'],
+                   None if offsets is None else np.array(offsets, dtype=np.int64))
+
+
+class TimingsDict(Mapping):
+    """
+    Read-only {index: (word, start, end)} view of a WordTimings
+
+    Lets code written against the timing dicts keep indexing word by word; .timings is
+    the underlying container for the code that works on whole arrays.
+    """
+
+    def __init__(self, timings):
+        self.timings = timings
+
+    def __getitem__(self, index):
+        if not isinstance(index, (int, np.integer)) or not 0 <= index < len(self.timings):
+            raise KeyError(index)
+        return self.timings.record(index)
+
+    def __iter__(self):
+        return iter(range(len(self.timings)))
+
+    def __len__(self):
+        return len(self.timings)
+
+    def __repr__(self):
+        return f"TimingsDict({len(self.timings)} words)"
+
@@ -0,0 +1,404 @@
+import argparse
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from lyric_timings import TimingsDict, WordTimings, sentence_offsets
+
+DB_PATH = 'lyricsdb2.db'
+
+# Sentence and word timings from forced alignment, one row per sentence / word keyed by
+# song_id, in the same database (and songs table) as analysis_db. Indexes match the dict
+# keys store_lyrics.create_dct produces, so the timing dicts the video code takes come
+# back unchanged: {index: (text, start, end)}.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs(
+    song_id        INTEGER PRIMARY KEY,
+    name           TEXT NOT NULL UNIQUE  -- <title>_<artist>, the audio file name without extension
+);
+CREATE TABLE IF NOT EXISTS sentences(
+    song_id        INTEGER NOT NULL REFERENCES songs(song_id) ON DELETE CASCADE,
+    sentence_index INTEGER NOT NULL,
+    text           TEXT NOT NULL,
+    start_time     REAL NOT NULL,
+    end_time       REAL NOT NULL,
+    PRIMARY KEY(song_id, sentence_index)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sentences_by_time ON sentences(song_id, start_time);
+CREATE TABLE IF NOT EXISTS words(
+    song_id        INTEGER NOT NULL REFERENCES songs(song_id) ON DELETE CASCADE,
+    word_index     INTEGER NOT NULL,
+    word           TEXT NOT NULL,
+    start_time     REAL NOT NULL,
+    end_time       REAL NOT NULL,
+    PRIMARY KEY(song_id, word_index)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS words_by_time ON words(song_id, start_time);
+"""
+
+# records_pickled ids are <name>sentences / <name>words; create_vid's lyricsdb.db keys a
+# song's line timings by the bare name
+PICKLED_KINDS = ('sentences', 'words')
+
+# Connection settings: WAL lets readers run while a song is being saved, NORMAL sync is
+# safe under WAL, and the page cache / memory map keep a library's timings off the disk
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16384",   # KiB
+    "PRAGMA mmap_size = 67108864"
+)
+
+# Extensions song_name strips; anything else is taken to be part of the name already
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.ogg', '.m4a')
+
+
+def song_name(path):
+    """
+    Key a song is stored under in the songs table (the same for lyrics and analysis rows)
+
+    The file name without directory or audio extension; a path whose extension is already
+    cut off, like the pickled record ids, gives the same key.
+    """
+    name = os.path.basename(path)
+    root, extension = os.path.splitext(name)
+    return root if extension.lower() in AUDIO_EXTENSIONS else name
+
+
+def connect(db_path=DB_PATH, shared=False):
+    """
+    Connection to the lyrics database with the schema in place
+
+    Args:
+        shared: allow use from threads other than the creating one (the caller serialises access)
+    """
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=not shared, cached_statements=128)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _timing_rows(song_id, timings):
+    """{index: (text, start, end)} as (song_id, index, text, start, end) rows with plain Python values"""
+    if isinstance(timings, TimingsDict):
+        timings = timings.timings
+    if isinstance(timings, WordTimings):
+        # Straight from the columns, without building a tuple per word first
+        words = [timings.vocabulary[i] for i in timings.word_ids.tolist()]
+        return list(zip([song_id] * len(words), range(len(words)), words, timings.start.tolist(), timings.end.tolist()))
+    return [(song_id, int(index), str(text), float(start), float(end))
+            for index, (text, start, end) in sorted(timings.items())]
+
+
+def _timings(rows):
+    return {index: (text, start, end) for index, text, start, end in rows}
+
+
+class LyricsDB:
+    """
+    Sentence and word timings of the whole library in SQLite
+
+    save() stores the two timing dicts of a song in one transaction. Readers fetch just the
+    rows they need: a whole song's dicts, a time range, or the sentence at a time.
+    """
+
+    def __init__(self, db_path=DB_PATH, shared=False):
+        self.db_path = db_path
+        self.conn = connect(db_path, shared)
+
+    def close(self):
+        self.conn.close()
+
+    def song_id(self, name, create=False):
+        row = self.conn.execute("SELECT song_id FROM songs WHERE name = ?", (name,)).fetchone()
+        if row:
+            return row[0]
+        if create:
+            return self.conn.execute("INSERT INTO songs (name) VALUES (?)", (name,)).lastrowid
+        return None
+
+    def save(self, name, sentences, words):
+        """
+        Store a song's timings, replacing any previous ones, as a single transaction
+
+        Args:
+            name: song name (<title>_<artist>)
+            sentences: {index: (sentence, start, end)} from store_lyrics.create_dct
+            words: {index: (word, start, end)}, a TimingsDict or a WordTimings
+        """
+        self.save_many([(name, sentences, words)])
+        return self.song_id(name)
+
+    def save_many(self, songs):
+        """
+        Store the timings of many songs in one transaction
+
+        Songs are upserted by name; a song already in the database has all its sentence
+        and word rows replaced, so re-ingesting it never leaves stale timings behind.
+        Every statement is an executemany over the whole batch and the batch is committed
+        (and synced) once.
+
+        Args:
+            songs: iterable of (name, sentences, words) as save() takes them; a name
+                   given twice keeps its last timings
+
+        Returns:
+            {'songs', 'rows', 'seconds', 'rows_per_second'}
+        """
+        start = time.perf_counter()
+        songs = {name: (sentences, words) for name, sentences, words in songs}
+        with self.conn:
+            self.conn.executemany("INSERT INTO songs (name) VALUES (?) ON CONFLICT(name) DO NOTHING",
+                                  [(name,) for name in songs])
+            ids = {}
+            names = list(songs)
+            for first in range(0, len(names), 500):  # stays under SQLite's bound-parameter limit
+                chunk = names[first:first + 500]
+                ids.update(self.conn.execute(
+                    f"SELECT name, song_id FROM songs WHERE name IN ({', '.join('?' * len(chunk))})", chunk))
+            song_ids = [(ids[name],) for name in songs]
+            self.conn.executemany("DELETE FROM sentences WHERE song_id = ?", song_ids)
+            self.conn.executemany("DELETE FROM words WHERE song_id = ?", song_ids)
+            sentence_rows = [row for name, (sentences, _) in songs.items() for row in _timing_rows(ids[name], sentences)]
+            word_rows = [row for name, (_, words) in songs.items() for row in _timing_rows(ids[name], words)]
+            self.conn.executemany("INSERT INTO sentences VALUES (?, ?, ?, ?, ?)", sentence_rows)
+            self.conn.executemany("INSERT INTO words VALUES (?, ?, ?, ?, ?)", word_rows)
+        seconds = time.perf_counter() - start
+        rows = len(songs) + len(sentence_rows) + len(word_rows)
+        return {'songs': len(songs), 'rows': rows, 'seconds': seconds,
+                'rows_per_second': rows / seconds if seconds > 0 else float('inf')}
+
+    def has_lyrics(self, name):
+        row = self.conn.execute(
+            "SELECT 1 FROM sentences JOIN songs USING (song_id) WHERE name = ? LIMIT 1", (name,)).fetchone()
+        return row is not None
+
+    def songs(self):
+        """Names of every song with stored sentence timings"""
+        return [name for name, in self.conn.execute(
+            "SELECT name FROM songs WHERE song_id IN (SELECT DISTINCT song_id FROM sentences) ORDER BY name")]
+
+    def _select(self, table, index_column, text_column, name, where='', args=()):
+        rows = self.conn.execute(
+            f"SELECT {index_column}, {text_column}, start_time, end_time FROM {table} "
+            f"WHERE song_id = (SELECT song_id FROM songs WHERE name = ?) {where} ORDER BY {index_column}",
+            (name, *args))
+        return _timings(rows)
+
+    def sentence_timings(self, name):
+        """{index: (sentence, start, end)} of a song, the lyrics_with_timing main_prg renders ({} if not stored)"""
+        return self._select('sentences', 'sentence_index', 'text', name)
+
+    def word_timings(self, name):
+        """{index: (word, start, end)} of a song ({} if not stored)"""
+        return self._select('words', 'word_index', 'word', name)
+
+    def timings(self, name):
+        """WordTimings of a song, with its sentence boundaries (empty if not stored)"""
+        song = "(SELECT song_id FROM songs WHERE name = ?)"
+        words = self.conn.execute(
+            f"SELECT word, start_time, end_time FROM words WHERE song_id = {song} ORDER BY word_index", (name,))
+        timings = WordTimings.from_records(words)
+        # Offsets from the stored sentence indexes and times: create_dct can leave sentences out
+        timings.sentence_offsets = sentence_offsets(timings.start, _timings(self.conn.execute(
+            f"SELECT sentence_index, text, start_time, end_time FROM sentences WHERE song_id = {song}", (name,))))
+        return timings
+
+    def sentences_between(self, name, start, end):
+        """Sentences overlapping [start, end) seconds, as {index: (sentence, start, end)}"""
+        return self._select('sentences', 'sentence_index', 'text', name,
+                            "AND start_time < ? AND end_time > ?", (end, start))
+
+    def words_between(self, name, start, end):
+        """Words overlapping [start, end) seconds, as {index: (word, start, end)}"""
+        return self._select('words', 'word_index', 'word', name, "AND start_time < ? AND end_time > ?", (end, start))
+
+    def sentence_at(self, name, time):
+        """(index, sentence, start, end) of the sentence sung at a time, or None between sentences"""
+        row = self.conn.execute(
+            "SELECT sentence_index, text, start_time, end_time FROM sentences "
+            "WHERE song_id = (SELECT song_id FROM songs WHERE name = ?) AND start_time <= ? "
+            "ORDER BY start_time DESC LIMIT 1", (name, time)).fetchone()
+        return row if row is not None and time < row[3] else None
+
+    def words_in_sentence(self, name, sentence_index):
+        """Words sung within one sentence's time span, as {index: (word, start, end)}"""
+        row = self.conn.execute(
+            "SELECT start_time, end_time FROM sentences WHERE song_id = (SELECT song_id FROM songs WHERE name = ?) "
+            "AND sentence_index = ?", (name, sentence_index)).fetchone()
+        if row is None:
+            return {}
+        return self._select('words', 'word_index', 'word', name, "AND start_time >= ? AND end_time <= ?", row)
+
+    def migrate_pickled(self, drop=False):
+        """
+        Move every song in records_pickled into the sentences / words tables
+
+        Songs that already have rows in the new tables are left alone, so running this
+        twice is harmless. Each blob is unpickled once here and never again.
+
+        Args:
+            drop: delete the migrated records_pickled rows afterwards
+
+        Returns:
+            names of the songs migrated
+        """
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'records_pickled'").fetchone()
+        if not exists:
+            return []
+        blobs = {}
+        for record_id, data in self.conn.execute("SELECT record_id, data FROM records_pickled"):
+            for kind in PICKLED_KINDS:
+                if record_id.endswith(kind):
+                    blobs.setdefault(song_name(record_id[:-len(kind)]), {})[kind] = (record_id, data)
+                    break
+            else:
+                blobs.setdefault(song_name(record_id), {})['sentences'] = (record_id, data)
+
+        migrated, pickled_ids = [], []
+        for name, records in sorted(blobs.items()):
+            if self.has_lyrics(name):
+                continue
+            try:
+                sentences = pickle.loads(records['sentences'][1]) if 'sentences' in records else {}
+                words = pickle.loads(records['words'][1]) if 'words' in records else {}
+            except Exception as e:
+                print(f"Skipping {name}: cannot unpickle its timings ({type(e).__name__}: {e})")
+                continue
+            migrated.append((name, sentences, words))
+            pickled_ids.extend((record_id,) for record_id, _ in records.values())
+        self.save_many(migrated)
+        if drop:
+            with self.conn:
+                self.conn.executemany("DELETE FROM records_pickled WHERE record_id = ?", pickled_ids)
+        return [name for name, _, _ in migrated]
+
+
+class LyricsStore:
+    """
+    Shared access to the lyrics database: one long-lived connection and an LRU of decoded songs
+
+    get_sentences / get_words / get_timings serve a song from memory after its first
+    read; up to max_songs songs are kept, least recently used first out. Every method
+    takes one lock, so one store can be shared by the GUI worker thread and a thread
+    pool. Processes each get their own: a store used after a fork reconnects.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_songs=64):
+        self.db_path = db_path
+        self.max_songs = max_songs
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._pid = None
+        self.db = None
+
+    def _connected(self):
+        if self._pid != os.getpid():
+            # A connection must not cross a fork: the child opens its own and starts with an empty cache
+            self.db = LyricsDB(self.db_path, shared=True)
+            self._pid = os.getpid()
+            self.cache.clear()
+            self.hits = self.misses = 0
+        return self.db
+
+    def _song(self, song):
+        """(sentence timings, WordTimings) of a song, from the LRU or the database"""
+        with self.lock:
+            entry = self.cache.get(song)
+            if entry is not None:
+                self.cache.move_to_end(song)
+                self.hits += 1
+                return entry
+            db = self._connected()
+            entry = (db.sentence_timings(song), db.timings(song))
+            self.misses += 1
+            self.cache[song] = entry
+            while len(self.cache) > self.max_songs:
+                self.cache.popitem(last=False)
+            return entry
+
+    def get_sentences(self, song):
+        """{index: (sentence, start, end)} of a song ({} if not stored); a copy, free to modify"""
+        return dict(self._song(song)[0])
+
+    def get_words(self, song):
+        """WordTimings of a song (empty if not stored); shared between callers, treat as read-only"""
+        return self._song(song)[1]
+
+    def get_timings(self, song):
+        """(sentence timings, word timings as a TimingsDict), the two arguments create_lyric_video_pil takes"""
+        sentences, words = self._song(song)
+        return dict(sentences), words.as_dict()
+
+    def save(self, song, sentences, words):
+        """Store a song's timings (see LyricsDB.save) and drop its cached copy"""
+        with self.lock:
+            song_id = self._connected().save(song, sentences, words)
+            self.cache.pop(song, None)
+            return song_id
+
+    def save_many(self, songs):
+        """Store many songs' timings in one transaction (see LyricsDB.save_many) and drop their cached copies"""
+        songs = list(songs)
+        with self.lock:
+            stats = self._connected().save_many(songs)
+            for name, _, _ in songs:
+                self.cache.pop(name, None)
+            return stats
+
+    def query(self, method, *args):
+        """Run one of LyricsDB's range queries under the store's lock, e.g. query('words_between', song, 30, 40)"""
+        with self.lock:
+            return getattr(self._connected(), method)(*args)
+
+    def invalidate(self, song=None):
+        """Drop one song, or every song, from the LRU"""
+        with self.lock:
+            if song is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(song, None)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'cached_songs': len(self.cache)}
+
+    def close(self):
+        with self.lock:
+            if self.db is not None and self._pid == os.getpid():
+                self.db.close()
+            self.db = None
+            self._pid = None
+            self.cache.clear()
+
+
+_default_stores = {}
+_default_stores_lock = threading.Lock()
+
+
+def default_store(db_path=DB_PATH):
+    """Process-wide LyricsStore for a database file (lyricsdb2.db by default)"""
+    with _default_stores_lock:
+        if db_path not in _default_stores:
+            _default_stores[db_path] = LyricsStore(db_path)
+        return _default_stores[db_path]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move pickled lyric timings (records_pickled) into the indexed tables")
+    parser.add_argument('db', nargs='?', default=DB_PATH, help=f"lyrics database (default: {DB_PATH})")
+    parser.add_argument('--drop', action='store_true', help="delete the pickled rows once migrated")
+    args = parser.parse_args()
+
+    db = LyricsDB(args.db)
+    migrated = db.migrate_pickled(drop=args.drop)
+    print(f"Migrated {len(migrated)} songs: {', '.join(migrated)}" if migrated else "Nothing to migrate")
+    db.close()
@@ -0,0 +1,162 @@
+import numpy as np
+
+def load_beat_table(csv_file):
+    """Read a <song>_analysis_beats.csv written by ana3.save_complete_analysis into columns"""
+    import pandas as pd
+    df = pd.read_csv(csv_file)
+    return {column: df[column].values for column in ('beat_number', 'start_time', 'rms')}
+
+def moving_average(data, window_size):
+    """
+    Trailing moving average; the first window_size-1 beats average what is available
+    
+    Each full window is averaged on its own (a strided view, no per-beat slicing), so the
+    values match np.mean of the slice exactly; a running sum would drift by rounding
+    errors and flip comparisons against the mean and median.
+    """
+    data = np.asarray(data)
+    if not np.issubdtype(data.dtype, np.floating):
+        data = data.astype(np.float64)
+    head = [np.mean(data[:i+1]) for i in range(min(window_size - 1, len(data)))]
+    if len(data) < window_size:
+        return np.array(head, dtype=data.dtype)
+    full = np.lib.stride_tricks.sliding_window_view(data, window_size).mean(axis=1)
+    return np.concatenate((np.array(head, dtype=full.dtype), full))
+
+def find_runs(mask):
+    """
+    Continuous runs of True in a boolean array
+    
+    Returns:
+        start and end indices (inclusive) of each run
+    """
+    edges = np.diff(np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+def merge_short_dips(starts, ends, values, min_threshold, max_dip=3):
+    """
+    Join consecutive runs separated by at most max_dip beats that all stay >= min_threshold
+    
+    Returns:
+        list of [start, end] index pairs (inclusive)
+    """
+    if len(starts) == 0:
+        return []
+    # Count of values below the threshold up to each index, so any gap is checked in O(1)
+    below = np.concatenate(([0], np.cumsum(np.asarray(values) < min_threshold)))
+    gap_start = ends[:-1] + 1
+    gap_end = starts[1:] - 1
+    gap_length = gap_end - gap_start + 1
+    merge = (gap_length > 0) & (gap_length <= max_dip) & (below[gap_end + 1] == below[gap_start])
+    
+    keep = np.concatenate(([True], ~merge))
+    merged_starts = starts[keep]
+    merged_ends = ends[np.concatenate((~merge, [True]))]
+    return [[int(start), int(end)] for start, end in zip(merged_starts, merged_ends)]
+
+def analyze_moving_average_above_thresholds(beats, moving_avg_window=5):
+    """
+    Analyze timestamps where moving average is above both RMS mean and median,
+    ignoring dips below min(mean, median) for less than 4 beats.
+    
+    Args:
+        beats: beat table handed over from the analysis (AnalysisResult.beats), or the path of an exported beats CSV
+        moving_avg_window: moving average window (beats)
+    
+    The diagnostic plot is drawn separately by analysis_report.
+    """
+    # Load data
+    if isinstance(beats, str):
+        beats = load_beat_table(beats)
+    beat_numbers, start_times, rms_values = beats['beat_number'], beats['start_time'], beats['rms']
+    
+    # Calculate RMS statistics
+    rms_mean = np.mean(rms_values)
+    rms_median = np.median(rms_values)
+    min_threshold = min(rms_mean, rms_median)
+    
+    print(f"RMS Mean: {rms_mean:.6f}")
+    print(f"RMS Median: {rms_median:.6f}")
+    print(f"Minimum threshold: {min_threshold:.6f}")
+    
+    rms_moving_avg = moving_average(rms_values, moving_avg_window)
+    
+    # Find periods where moving average is above both mean and median
+    above_both = (rms_moving_avg > rms_mean) & (rms_moving_avg > rms_median)
+    starts, ends = find_runs(above_both)
+    
+    print(f"\nInitial segments above both mean and median: {len(starts)}")
+    
+    # Now apply the rule: ignore dips below min_threshold for less than 4 beats
+    # This means we need to merge segments that are separated by gaps < 4 beats
+    # where the gap values are above min_threshold
+    merged_segments = merge_short_dips(starts, ends, rms_moving_avg, min_threshold)
+    
+    print(f"Merged segments (ignoring brief dips): {len(merged_segments)}")
+    
+    # Extract timestamps for merged segments
+    timestamp_periods = []
+    
+    for start_idx, end_idx in merged_segments:
+        start_time = start_times[start_idx]
+        end_time = start_times[end_idx]
+        duration = end_time - start_time
+        beat_count = end_idx - start_idx + 1
+        
+        timestamp_periods.append({
+            'start_beat': beat_numbers[start_idx],
+            'end_beat': beat_numbers[end_idx],
+            'start_time': start_time,
+            'end_time': end_time,
+            'duration': duration,
+            'beat_count': beat_count,
+            'avg_moving_avg': np.mean(rms_moving_avg[start_idx:end_idx+1]),
+            'max_moving_avg': np.max(rms_moving_avg[start_idx:end_idx+1]),
+            'min_moving_avg': np.min(rms_moving_avg[start_idx:end_idx+1])
+        })
+    
+    # Print results
+    print(f"\n=== TIMESTAMPS WHERE MOVING AVERAGE > BOTH MEAN AND MEDIAN ===")
+    print(f"(Ignoring dips below {min_threshold:.6f} for < 4 beats)")
+    print("="*80)
+    
+    total_duration = 0
+    total_beats = 0
+    
+    for i, period in enumerate(timestamp_periods, 1):
+        print(f"\nPeriod {i}:")
+        print(f"  Beats: {period['start_beat']} - {period['end_beat']} ({period['beat_count']} beats)")
+        print(f"  Time: {period['start_time']:.2f}s - {period['end_time']:.2f}s ({period['duration']:.2f}s)")
+        print(f"  Moving Avg Range: {period['min_moving_avg']:.6f} - {period['max_moving_avg']:.6f}")
+        print(f"  Average Moving Avg: {period['avg_moving_avg']:.6f}")
+        
+        total_duration += period['duration']
+        total_beats += period['beat_count']
+    
+    print(f"\n=== SUMMARY ===")
+    print(f"Total periods: {len(timestamp_periods)}")
+    print(f"Total duration above thresholds: {total_duration:.2f}s")
+    print(f"Total beats above thresholds: {total_beats}")
+    
+    if len(start_times) > 0:
+        total_song_duration = start_times[-1] - start_times[0]
+        print(f"Percentage of song above thresholds: {(total_duration/total_song_duration)*100:.1f}%")
+    
+    periods=[]
+    for p in timestamp_periods:
+        periods.append({'start_time':p['start_time'], 'end_time':p['end_time']})
+    print("Intensity classifications:")
+    print(periods)
+    #return timestamp_periods, df
+    return periods
+
+# Run analysis
+if __name__=="__main__":
+    timestamp_periods = analyze_moving_average_above_thresholds('cigarettedaydreams_cagetheelephant_beats.csv')
+
+    # Print detailed timestamp list for easy reference
+    print(f"\n=== DETAILED TIMESTAMP LIST ===")
+    for i, period in enumerate(timestamp_periods, 1):
+        print(f"Period {i}: {period['start_time']:.2f}s - {period['end_time']:.2f}s")
+    
+    print(type(timestamp_periods))
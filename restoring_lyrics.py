@@ -1,27 +1,10 @@
-import sqlite3
-import pickle,time,pygame
+import time,pygame
+import lyrics_db
 
 #ADD PAUSE BUTTON
 def retrieve_lyrics(file_path):
-    conn=sqlite3.connect("lyricsdb2.db")
-    c=conn.cursor()
-    c.execute("SELECT data FROM records_pickled WHERE record_id = ? ",(file_path[:-4]+"words",))
-    row=c.fetchone()
-    restored={}
-    if row:
-        restored=pickle.loads(row[0])
-    #print(restored)
-
-    avg_gap=0.0
-    avg_dur=0.0
-    prev=0.0
-    for i in range(len(restored)):
-        avg_gap=avg_gap*i+(restored[i][1]-prev)
-        avg_gap/=(i+1)
-        avg_dur=avg_dur*i+(restored[i][2]-restored[i][1])
-        avg_dur/=(i+1)
-        prev=restored[i][2]
-    return restored,avg_dur,avg_gap
+    timings=lyrics_db.default_store().get_words(lyrics_db.song_name(file_path))
+    return timings.as_dict(),timings.average_duration(),timings.average_gap()
 
 def test(restored,avg_gap,avg_dur,):
     print("average gap=",avg_gap)
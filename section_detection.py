@@ -0,0 +1,235 @@
+import numpy as np
+from scipy.ndimage import maximum_filter1d
+
+# Audio-based song structure for when the lyrics carry no [Verse] / [Chorus] headers.
+# Sections are found on a beat-level self-similarity matrix (SSM): boundaries where a
+# checkerboard kernel slid along its diagonal peaks, labels by how much whole sections
+# resemble each other. The SSM is filled block by block into float16 storage, so a
+# 10-minute song (~1200 beats) needs 2.9 MB instead of 11.5 MB of float64, and the
+# temporaries stay one block in size.
+
+
+def normalize_features(features):
+    """Standardise every feature dimension, then scale each beat's vector to unit length"""
+    x = np.asarray(features, dtype=np.float32)
+    x = (x - x.mean(axis=0)) / (x.std(axis=0) + 1e-6)
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-6)
+
+
+def self_similarity(features, block_size=1024, out=None):
+    """
+    Cosine self-similarity of beat-level features
+
+    Args:
+        features: (n_beats, n_features) array
+        block_size: rows and columns computed per matrix product
+        out: (n_beats, n_beats) float16 array to fill, e.g. a np.memmap for very long inputs
+
+    Returns:
+        (n_beats, n_beats) float16 matrix; only the upper blocks are computed, the lower
+        ones are their transposes
+    """
+    x = normalize_features(features)
+    n = len(x)
+    ssm = np.empty((n, n), dtype=np.float16) if out is None else out
+    for row in range(0, n, block_size):
+        for col in range(row, n, block_size):
+            block = (x[row:row + block_size] @ x[col:col + block_size].T).astype(np.float16)
+            ssm[row:row + block_size, col:col + block_size] = block
+            if col != row:
+                ssm[col:col + block_size, row:row + block_size] = block.T
+    return ssm
+
+
+def checkerboard_kernel(half_width):
+    """Gaussian-tapered checkerboard: +1 within the past and within the future, -1 across"""
+    offsets = np.arange(-half_width, half_width) + 0.5
+    taper = np.exp(-0.5 * (offsets / (0.5 * half_width)) ** 2)
+    side = np.sign(offsets) * taper
+    return np.outer(side, side).astype(np.float32)
+
+
+def novelty_curve(ssm, half_width=16):
+    """
+    Foote novelty along the SSM diagonal
+
+    Only the (2 * half_width)^2 neighbourhood of each diagonal cell is read, so this never
+    touches the bulk of the matrix. Near the edges the kernel is cut to what exists.
+    """
+    kernel = checkerboard_kernel(half_width)
+    n = len(ssm)
+    novelty = np.zeros(n, dtype=np.float32)
+    for i in range(n):
+        lo, hi = max(i - half_width, 0), min(i + half_width, n)
+        k = kernel[lo - i + half_width:hi - i + half_width, lo - i + half_width:hi - i + half_width]
+        novelty[i] = np.sum(k * ssm[lo:hi, lo:hi])
+    return novelty
+
+
+def pick_boundaries(novelty, min_section_beats=8, threshold=None):
+    """
+    Section boundaries: local novelty maxima at least min_section_beats apart
+
+    Returns:
+        sorted beat indices, starting with 0 and ending with len(novelty)
+    """
+    n = len(novelty)
+    if threshold is None:
+        threshold = np.mean(novelty) + 0.5 * np.std(novelty)
+    local_max = novelty == maximum_filter1d(novelty, size=2 * min_section_beats + 1, mode='nearest')
+    boundaries = [0]
+    for peak in np.flatnonzero(local_max & (novelty > threshold)):
+        if peak - boundaries[-1] >= min_section_beats and n - peak >= min_section_beats:
+            boundaries.append(int(peak))
+    boundaries.append(n)
+    return boundaries
+
+
+def section_similarity(ssm, boundaries):
+    """Mean similarity between every pair of sections, read from the SSM one block at a time"""
+    k = len(boundaries) - 1
+    similarity = np.zeros((k, k))
+    for a in range(k):
+        for b in range(a, k):
+            block = ssm[boundaries[a]:boundaries[a + 1], boundaries[b]:boundaries[b + 1]]
+            similarity[a, b] = similarity[b, a] = np.mean(block, dtype=np.float64)
+    return similarity
+
+
+def label_sections(similarity, repeat_threshold=0.8):
+    """
+    Letter labels (A, B, ...) with repeats of a section sharing its letter
+
+    A section repeats an earlier one when their cross similarity reaches repeat_threshold
+    of the lesser of the two sections' own (internal) similarity.
+    """
+    labels = []
+    for j in range(len(similarity)):
+        best, best_ratio = None, repeat_threshold
+        for k in range(j):
+            internal = min(similarity[j, j], similarity[k, k])
+            ratio = similarity[j, k] / internal if internal > 0 else 0.0
+            if ratio >= best_ratio:
+                best, best_ratio = k, ratio
+        labels.append(labels[best] if best is not None else chr(ord('A') + len(set(labels)) % 26))
+    return labels
+
+
+def merge_label_pairs(boundaries, labels):
+    """
+    Join sections that only ever occur as a pair
+
+    When every X is directly followed by a Y and every Y directly preceded by an X (e.g. the
+    two halves of a verse split at a chord change), each X+Y becomes one X section.
+
+    Returns:
+        merged boundaries and labels
+    """
+    boundaries, labels = list(boundaries), list(labels)
+    merged = True
+    while merged:
+        merged = False
+        for first in dict.fromkeys(labels):
+            positions = [i for i, label in enumerate(labels) if label == first]
+            if positions[-1] == len(labels) - 1:
+                continue
+            second = labels[positions[0] + 1]
+            if second == first or any(labels[i + 1] != second for i in positions) or \
+                    labels.count(second) != len(positions):
+                continue
+            for i in reversed(positions):
+                del labels[i + 1]
+                del boundaries[i + 1]
+            merged = True
+            break
+    return boundaries, labels
+
+
+def name_sections(labels, loudness):
+    """
+    Map letter labels onto the part names main_prg uses
+
+    The loudest repeated label is the Chorus, other repeated labels are Verses; one-off
+    sections are the Intro at the start, the Outro at the end and Bridges in between.
+    """
+    counts = {label: labels.count(label) for label in labels}
+    repeated = [label for label in counts if counts[label] > 1]
+    chorus = max(repeated, key=lambda label: np.mean([loudness[i] for i, l in enumerate(labels) if l == label]),
+                 default=None)
+    names = []
+    for i, label in enumerate(labels):
+        if label == chorus:
+            names.append('Chorus')
+        elif counts[label] > 1:
+            names.append('Verse')
+        elif i == 0:
+            names.append('Intro')
+        elif i == len(labels) - 1:
+            names.append('Outro')
+        else:
+            names.append('Bridge')
+    return names
+
+
+def sections_from_features(features, beat_times, loudness=None, half_width=16, min_section_beats=8,
+                           repeat_threshold=0.8, block_size=1024):
+    """
+    Labelled sections of a song from its beat-level features
+
+    Args:
+        features: (n_intervals, n_features) array, row i covering beat_times[i] to beat_times[i + 1]
+        beat_times: beat timestamps (n_intervals + 1 of them)
+        loudness: per-row loudness used to tell the chorus from the verses (default: none, first repeat wins)
+        half_width: checkerboard kernel half width in beats
+        min_section_beats: shortest section in beats
+        repeat_threshold: see label_sections
+        block_size: SSM block size
+
+    Returns:
+        list of {'start_time', 'end_time', 'label', 'section'} dicts
+    """
+    if len(features) < 2 * min_section_beats:
+        return [{'start_time': float(beat_times[0]), 'end_time': float(beat_times[-1]), 'label': 'A',
+                 'section': 'Verse'}] if len(features) else []
+    ssm = self_similarity(features, block_size=block_size)
+    boundaries = pick_boundaries(novelty_curve(ssm, half_width), min_section_beats)
+    labels = label_sections(section_similarity(ssm, boundaries), repeat_threshold)
+    boundaries, labels = merge_label_pairs(boundaries, labels)
+    # Letters in order of first appearance again after merging
+    letters = {label: chr(ord('A') + i % 26) for i, label in enumerate(dict.fromkeys(labels))}
+    labels = [letters[label] for label in labels]
+    if loudness is None:
+        loudness = np.zeros(len(features))
+    section_loudness = [np.mean(loudness[start:stop]) for start, stop in zip(boundaries[:-1], boundaries[1:])]
+    names = name_sections(labels, section_loudness)
+    return [{'start_time': float(beat_times[start]), 'end_time': float(beat_times[stop]), 'label': label,
+             'section': name}
+            for start, stop, label, name in zip(boundaries[:-1], boundaries[1:], labels, names)]
+
+
+def detect_sections(audio_file, store=None, beat_times=None, profile='default', **params):
+    """
+    Labelled sections of a song, from the chroma and MFCCs in the beat feature store
+
+    MFCC 0 (overall level) is left out of the similarity so a louder repeat of a section
+    still matches, and is used as the loudness that picks the chorus.
+
+    Args:
+        beat_times: beats of an analysis already run (so no second analysis, and the sections
+                    share its beat grid); default: analyse the mix with the profile
+        profile: analysis profile giving the features' resolution
+        params: see sections_from_features
+    """
+    import feature_store
+    features = (store or feature_store.default_store()).load(audio_file, beat_times=beat_times, profile=profile)
+    stacked = np.hstack([features.chroma, features.mfcc[:, 1:]])
+    return sections_from_features(stacked, features.beat_times, loudness=features.mfcc[:, 0].astype(np.float32),
+                                  **params)
+
+
+def section_at(sections, time, default='Intro'):
+    """Part name of the section playing at a time"""
+    for section in sections:
+        if section['start_time'] <= time < section['end_time']:
+            return section['section']
+    return sections[-1]['section'] if sections and time >= sections[-1]['end_time'] else default
@@ -0,0 +1,260 @@
+import atexit
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+# Demucs source separation in a long-lived process: htdemucs is built and its weights are
+# loaded once, then songs are separated as they come in over a queue. The process exits
+# after max_jobs songs (PyTorch's allocator holds on to memory) and the next job starts a
+# fresh one. Only file paths cross the queues; the stems are written by the worker.
+
+MODEL_NAME = 'htdemucs'
+
+
+def separate_stems(model, audio_file, vocals_prefix, device):
+    """
+    Separate one song with an already loaded model and write its stems
+
+    Args:
+        model: demucs model on device
+        audio_file: path to the song
+        vocals_prefix: path prefix of <prefix>_vocals.wav / <prefix>_instrumental.wav
+                       (store_lyrics uses the lyrics file's)
+        device: 'cuda' or 'cpu'
+
+    Returns:
+        {'vocals', 'instrumental', <other stems>: path}; the non-vocal stems go where
+        ana3.stem_file expects them
+    """
+    import torch
+    import torchaudio
+    from demucs.apply import apply_model
+    import ana3
+    import audio_cache
+
+    # Load audio (decoded once per song and shared with analysis and rendering)
+    audio = audio_cache.default_cache().load(audio_file)
+    waveform, sr = torch.from_numpy(audio.native), audio.sr
+
+    # Add batch dimension: (channels, length) -> (1, channels, length)
+    waveform = waveform.unsqueeze(0).to(device)
+    with torch.no_grad():
+        estimates = apply_model(model, waveform, device=device)
+
+    sources = list(model.sources)
+    vocals_index = sources.index('vocals')
+    paths = {'vocals': vocals_prefix + '_vocals.wav', 'instrumental': vocals_prefix + '_instrumental.wav'}
+    torchaudio.save(paths['vocals'], estimates[0, vocals_index].cpu(), sr)
+    instrumental = sum(estimates[0, index] for index, stem in enumerate(sources) if stem != 'vocals')
+    torchaudio.save(paths['instrumental'], instrumental.cpu(), sr)
+    # Keep the other stems too: ana3 beat-tracks on the drums and can compute energy on any of them
+    for index, stem in enumerate(sources):
+        if stem != 'vocals':
+            paths[stem] = ana3.stem_file(audio_file, stem)
+            torchaudio.save(paths[stem], estimates[0, index].cpu(), sr)
+    return paths
+
+
+def load_model(device=None, torch_threads=None):
+    """
+    Build htdemucs and load its weights (what the worker does once per process)
+
+    Returns:
+        (model in eval mode on device, device); device defaults to cuda when available
+    """
+    import torch
+    from demucs import pretrained
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    model = pretrained.get_model(MODEL_NAME).to(device)
+    model.eval()
+    return model, device
+
+
+def _worker(jobs, results, torch_threads, max_jobs, device, load, separate):
+    """Worker process: load the model, then separate songs until max_jobs or a None job"""
+    try:
+        start = time.perf_counter()
+        model, device = load(device, torch_threads)
+        results.put(('ready', None, time.perf_counter() - start))
+    except Exception as e:
+        results.put(('failed', None, f"Cannot load {MODEL_NAME}: {type(e).__name__}: {e}"))
+        return
+
+    for done in itertools.count(1):
+        job = jobs.get()
+        if job is None:
+            return
+        job_id, audio_file, vocals_prefix = job
+        recycle = max_jobs is not None and done >= max_jobs
+        try:
+            start = time.perf_counter()
+            paths = separate(model, audio_file, vocals_prefix, device)
+            results.put(('done', job_id, {'paths': paths, 'seconds': time.perf_counter() - start,
+                                          'recycle': recycle}))
+        except Exception as e:
+            results.put(('error', job_id, {'message': f"{type(e).__name__}: {e}", 'recycle': recycle}))
+        if recycle:
+            return
+
+
+class SeparationWorker:
+    """
+    Client side of the separation process
+
+    separate() sends one song and waits for its stem paths; calls from several threads are
+    served one at a time, in order. The process starts on first use (or on start(), to
+    have the model loaded before the first song arrives) and is restarted transparently
+    after it recycles itself or dies.
+
+    Args:
+        torch_threads: intra-op threads for PyTorch in the worker (default: PyTorch's choice)
+        max_jobs: songs per worker process before it is replaced (None: never)
+        device: 'cuda' / 'cpu' (default: cuda when available)
+        load: model loader run in the worker, load(device, torch_threads) -> (model, device)
+        separate: separate(model, audio_file, vocals_prefix, device) -> stem paths, run in the worker
+                  (both module-level functions, so the spawned process can import them)
+    """
+
+    def __init__(self, torch_threads=None, max_jobs=20, device=None, load=load_model, separate=separate_stems):
+        self.torch_threads = torch_threads
+        self.max_jobs = max_jobs
+        self.device = device
+        self.load = load
+        self.separate_song = separate
+        self.context = multiprocessing.get_context('spawn')
+        self.lock = threading.Lock()
+        self.process = None
+        self.jobs = None
+        self.results = None
+        self.job_ids = itertools.count()
+        self.jobs_done = 0
+        self.model_loads = 0
+        self.load_seconds = 0.0
+
+    def start(self):
+        """Start the worker and wait until its model is loaded (no-op if it is running)"""
+        with self.lock:
+            self._ensure_running()
+
+    def _ensure_running(self):
+        if self.process is not None and self.process.is_alive():
+            return
+        self._stop_process()
+        self.jobs = self.context.Queue()
+        self.results = self.context.Queue()
+        self.process = self.context.Process(target=_worker, name='demucs-separation', daemon=True,
+                                            args=(self.jobs, self.results, self.torch_threads, self.max_jobs,
+                                                  self.device, self.load, self.separate_song))
+        self.process.start()
+        kind, _, payload = self._receive()
+        if kind != 'ready':
+            self._stop_process()
+            raise RuntimeError(payload)
+        self.model_loads += 1
+        self.load_seconds += payload
+
+    def _receive(self, timeout=None):
+        """Next message from the worker, failing if the process dies before sending one"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self.results.get(timeout=1.0)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError(f"Separation worker exited (code {self.process.exitcode})") from None
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError("Separation worker did not answer in time") from None
+
+    def separate(self, audio_file, vocals_prefix=None, timeout=None):
+        """
+        Separate one song in the worker
+
+        Args:
+            audio_file: path to the song
+            vocals_prefix: prefix of the vocals / instrumental files (default: the song's own, without .wav)
+            timeout: seconds to wait for the stems (default: no limit)
+
+        Returns:
+            {'vocals', 'instrumental', 'drums', 'bass', 'other'}: stem file paths
+        """
+        vocals_prefix = os.path.splitext(audio_file)[0] if vocals_prefix is None else vocals_prefix
+        with self.lock:
+            self._ensure_running()
+            job_id = next(self.job_ids)
+            self.jobs.put((job_id, os.path.abspath(audio_file), os.path.abspath(vocals_prefix)))
+            try:
+                kind, result_id, payload = self._receive(timeout)
+            except (RuntimeError, TimeoutError):
+                self._stop_process()
+                raise
+            if result_id != job_id:
+                self._stop_process()
+                raise RuntimeError(f"Separation worker answered job {result_id} instead of {job_id}")
+            if payload.get('recycle'):
+                self.process.join(timeout=30)
+                self._stop_process()
+            if kind == 'error':
+                raise RuntimeError(f"Separating {audio_file} failed: {payload['message']}")
+            self.jobs_done += 1
+            return payload['paths']
+
+    def _stop_process(self):
+        if self.process is not None:
+            if self.process.is_alive():
+                try:
+                    self.jobs.put(None)
+                except (OSError, ValueError):
+                    pass
+                self.process.join(timeout=5)
+                if self.process.is_alive():
+                    self.process.terminate()
+                    self.process.join()
+            self.process = None
+        for q in (self.jobs, self.results):
+            if q is not None:
+                q.close()
+        self.jobs = self.results = None
+
+    def stats(self):
+        return {'jobs': self.jobs_done, 'model_loads': self.model_loads, 'load_seconds': self.load_seconds,
+                'running': self.process is not None and self.process.is_alive()}
+
+    def close(self):
+        with self.lock:
+            self._stop_process()
+
+
+_default_worker = None
+_default_worker_lock = threading.Lock()
+
+
+def default_worker(torch_threads=None, max_jobs=20):
+    """Process-wide SeparationWorker (created with these settings on first call), stopped at interpreter exit"""
+    global _default_worker
+    with _default_worker_lock:
+        if _default_worker is None:
+            _default_worker = SeparationWorker(torch_threads=torch_threads, max_jobs=max_jobs)
+            atexit.register(_default_worker.close)
+        return _default_worker
+
+
+def warm_up(worker=None):
+    """
+    Load a worker's model in a background thread; a failure is printed and retried by the first job
+
+    Args:
+        worker: SeparationWorker to start (default: default_worker())
+    """
+    def start():
+        try:
+            (worker or default_worker()).start()
+        except RuntimeError as e:
+            print(f"Separation worker not started: {e}")
+    thread = threading.Thread(target=start, name='demucs-warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -1,18 +1,13 @@
-import sqlite3
-import pickle
-import torch
-import torchaudio
-from demucs import pretrained
-from demucs.apply import apply_model
+import lyric_timings
+import lyrics_db
+import separation_worker
 from forcealign import ForceAlign
 
 def create_dct(all_words,sentence_list):
     counter=0
     sentence_counter=0
     lyrics_dct={}
-    words_dct={}
-    for i in range(len(all_words)):
-        words_dct[i]=(all_words[i].word, all_words[i].time_start, all_words[i].time_end)
+    words_dct=lyric_timings.WordTimings.from_aligned(all_words,sentence_list).as_dict()
 
     '''for w in words:
         print(f"{w.word}: {w.time_start:.2f}s – {w.time_end:.2f}s")
@@ -59,54 +54,47 @@ def get_lyrics(filename):
     print(new_list)
     return (sentences,new_list)
 
-def add_to_db(file_path,lyrics_file):
-    lyrics_text,sentence_list=get_lyrics(lyrics_file)
-    # Load the model
-    model = pretrained.get_model('htdemucs')
-
-    # Load audio
-    waveform, sr = torchaudio.load(file_path)
+def align_song(file_path,lyrics_file):
+    """
+    Separate a song's stems and align its lyrics to the vocals
 
-    # Add batch dimension: (channels, length) -> (1, channels, length)
-    waveform = waveform.unsqueeze(0)
+    Returns:
+        (song name, sentence timings, word timings), one entry for ingest()
+    """
+    lyrics_text,sentence_list=get_lyrics(lyrics_file)
+    # Separate in the long-lived worker: htdemucs is loaded once per worker, not once per song
+    stems = separation_worker.default_worker().separate(file_path, lyrics_file[:-4])
+    align = ForceAlign(audio_file=stems['vocals'], transcript=lyrics_text)
+    words = align.inference()
 
-    # Separate stems
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    model = model.to(device)
-    waveform = waveform.to(device)
+    my_dct,words_dct=create_dct(words,sentence_list)
+    #print(my_dct)
+    return lyrics_db.song_name(file_path),my_dct,words_dct
 
-    estimates = apply_model(model, waveform, device=device)
+def ingest(aligned_songs,db_path=lyrics_db.DB_PATH):
+    """
+    Write aligned songs to the lyrics database in one transaction
 
-    # Extract vocals and create instrumental
-    vocals = estimates[0, 3].cpu()   # Vocals are the 4th source
-    instrumental = (estimates[0, 0] + estimates[0, 1] + estimates[0, 2]).cpu()  # Sum drums, bass, other
+    Songs already stored get their timings replaced, so re-running an ingestion is safe.
 
-    # Save vocals and instrumental
-    torchaudio.save(lyrics_file[:-4]+'_vocals.wav', vocals, sr)
-    torchaudio.save(lyrics_file[:-4]+'_instrumental.wav', instrumental, sr)
-    align = ForceAlign(audio_file=lyrics_file[:-4]+'_vocals.wav', transcript=lyrics_text)
-    words = align.inference()
+    Args:
+        aligned_songs: (song name, sentence timings, word timings) entries, as align_song returns them
 
-    my_dct,words_dct=create_dct(words,sentence_list)
-    #print(my_dct)
+    Returns:
+        {'songs', 'rows', 'seconds', 'rows_per_second'}
+    """
+    stats=lyrics_db.default_store(db_path).save_many(aligned_songs)
+    print(f"Wrote {stats['rows']} rows for {stats['songs']} songs in {stats['seconds']:.3f}s "
+          f"({stats['rows_per_second']:.0f} rows/s)")
+    return stats
 
-    record_id1=file_path[:-4]+"sentences"
-    record_id2=file_path[:-4]+"words"
-    conn=sqlite3.connect("lyricsdb2.db")
-    c=conn.cursor()
-    blob1= pickle.dumps(my_dct)
-    c.execute(
-        "INSERT INTO records_pickled (record_id,data) VALUES (?,?)",
-        (record_id1,blob1)
-    )
-    blob2=pickle.dumps(words_dct)
-    c.execute(
-        "INSERT INTO records_pickled (record_id,data) VALUES (?,?)",
-        (record_id2,blob2)
-    )
-
-    conn.commit()
+def add_to_db(file_path,lyrics_file):
+    ingest([align_song(file_path,lyrics_file)])
     print("INSERTED INTO DATABASE")
 
+def add_many_to_db(songs):
+    """Align every (audio file, lyrics file) pair, then store them all in a single transaction"""
+    return ingest([align_song(file_path,lyrics_file) for file_path,lyrics_file in songs])
+
 if __name__=="__main__":
     get_lyrics('comealittlecloser_cagetheelephant.txt')
\ No newline at end of file
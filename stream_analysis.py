@@ -0,0 +1,448 @@
+import bisect
+import numpy as np
+import librosa
+import soundfile as sf
+import soxr
+from scipy.ndimage import gaussian_filter1d
+import ana3
+
+
+def iter_analysis_samples(audio_file, sr=22050, read_size=65536):
+    """
+    Decode a file block by block as mono audio at the analysis rate
+
+    Produces exactly the samples librosa.load(audio_file, sr=sr) returns (same mono
+    mix-down, same soxr 'HQ' resampler, same output length) without ever holding
+    the whole track.
+
+    Yields:
+        float32 arrays of consecutive samples
+    """
+    info = sf.info(audio_file)
+    if info.samplerate == sr:
+        n_out = info.frames
+        resampler = None
+    else:
+        n_out = int(np.ceil(info.frames * float(sr) / info.samplerate))
+        resampler = soxr.ResampleStream(info.samplerate, sr, 1, dtype='float32', quality='HQ')
+
+    emitted = 0
+    for block in sf.blocks(audio_file, blocksize=read_size, dtype='float32', always_2d=True):
+        y = np.mean(block.T, axis=0)
+        if resampler is not None:
+            y = resampler.resample_chunk(y)
+        y = y[:n_out - emitted]
+        emitted += len(y)
+        if len(y):
+            yield y
+    if resampler is not None:
+        tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)[:n_out - emitted]
+        emitted += len(tail)
+        if len(tail):
+            yield tail
+    if emitted < n_out:
+        yield np.zeros(n_out - emitted, dtype=np.float32)
+
+
+class StreamingEnergyAnalyzer:
+    """
+    Beat tracking and per-beat energy features over fixed-size blocks of a recording
+
+    The track is walked in blocks of block_duration seconds. Each block is analysed
+    together with context_duration seconds of audio on either side, so STFT framing,
+    feature smoothing and beat tracking see the same neighbourhood they would in the
+    whole-file analysis. Only beats inside the block's core are kept. State carried
+    from block to block:
+        - the tempo estimate (seeds the next block's beat tracker)
+        - the last emitted beat (avoids duplicate beats at block seams)
+        - the smoothed frame features since that beat (for the segment straddling the seam)
+        - running maxima of RMS, centroid and ZCR (energy normalisation)
+
+    Memory is bounded by the block size, not the track length. A track shorter than
+    one block is analysed in a single pass and gives exactly the in-memory results.
+    """
+
+    def __init__(self, audio_file, block_duration=360.0, context_duration=10.0, sr=22050,
+                 hop_length=512, n_fft=2048):
+        self.audio_file = audio_file
+        self.sr = sr
+        self.hop_length = hop_length
+        self.n_fft = n_fft
+        self.block_frames = max(1, int(block_duration * sr / hop_length))
+        # Smoothing needs 4 frames and centered framing n_fft/hop/2 frames of context at minimum
+        self.context_frames = max(int(context_duration * sr / hop_length), 4 + n_fft // (2 * hop_length))
+
+        info = sf.info(audio_file)
+        if info.samplerate == sr:
+            self.n_samples = info.frames
+        else:
+            self.n_samples = int(np.ceil(info.frames * float(sr) / info.samplerate))
+        self.n_frames = 1 + self.n_samples // hop_length
+
+        self.tempo = None
+        self.beat_times = []
+        self.max_rms = -np.inf
+        self.max_centroid = -np.inf
+        self.max_zcr = -np.inf
+
+    def iter_segments(self):
+        """
+        Yield beat segments block by block
+
+        Segment energies are provisional: they are normalised by the feature maxima
+        seen so far. finalize_segments rescales them once the whole track is read.
+        """
+        samples = iter_analysis_samples(self.audio_file, self.sr)
+        buffer = np.zeros(0, dtype=np.float32)
+        buffer_start = 0  # index of buffer[0] in the track
+        exhausted = False
+
+        last_beat = None
+        beat_count = 0
+        carry_start = 0
+        carry = None
+
+        for core_start in range(0, self.n_frames, self.block_frames):
+            core_stop = min(core_start + self.block_frames, self.n_frames)
+            single_block = core_start == 0 and core_stop == self.n_frames
+            window_start = max(0, core_start - self.context_frames)
+            window_stop = min(self.n_frames, core_stop + self.context_frames)
+
+            # Samples covered by the centered frames of the window
+            lo = window_start * self.hop_length - self.n_fft // 2
+            hi = (window_stop - 1) * self.hop_length + self.n_fft // 2
+            while not exhausted and buffer_start + len(buffer) < min(hi, self.n_samples):
+                try:
+                    buffer = np.concatenate((buffer, next(samples)))
+                except StopIteration:
+                    exhausted = True
+            chunk = buffer[max(lo, 0) - buffer_start:min(hi, self.n_samples) - buffer_start]
+            pad = (max(0, -lo), max(0, hi - self.n_samples))
+            features = self._window_features(chunk, pad)
+
+            # Drop audio no later window needs
+            keep_from = max(0, (core_stop - self.context_frames) * self.hop_length - self.n_fft // 2)
+            if keep_from > buffer_start:
+                buffer = buffer[keep_from - buffer_start:]
+                buffer_start = keep_from
+
+            # Beats in this block's core. Edge trimming would drop quiet beats at every
+            # window boundary, so it is only applied when the window is the whole track.
+            tempo, window_beats = librosa.beat.beat_track(onset_envelope=features['onset_envelope'], sr=self.sr,
+                                                          hop_length=self.hop_length, trim=single_block,
+                                                          start_bpm=self.tempo or 120.0)
+            tempo = float(np.atleast_1d(tempo)[0])
+            if tempo > 0:
+                self.tempo = tempo
+            beats = window_beats + window_start
+            beats = beats[(beats >= core_start) & (beats < core_stop)]
+            if last_beat is not None and self.tempo:
+                min_gap = 0.5 * 60.0 / self.tempo * self.sr / self.hop_length
+                beats = beats[beats > last_beat + min_gap]
+
+            # Smoothed features for the core, appended to what is left since the last beat
+            core = slice(core_start - window_start, core_stop - window_start)
+            rms = gaussian_filter1d(features['rms_energy'], sigma=1)[core]
+            centroid = gaussian_filter1d(features['spectral_centroids'], sigma=1)[core]
+            zcr = features['zero_crossing_rate'][core]
+            self.max_rms = max(self.max_rms, np.max(rms))
+            self.max_centroid = max(self.max_centroid, np.max(centroid))
+            self.max_zcr = max(self.max_zcr, np.max(zcr))
+            if carry is None:
+                carry = (rms, centroid, zcr)
+            else:
+                carry = tuple(np.concatenate((c, new)) for c, new in zip(carry, (rms, centroid, zcr)))
+
+            beat_times = librosa.frames_to_time(beats, sr=self.sr, hop_length=self.hop_length)
+            self.beat_times.extend(beat_times)
+            bounds = beats if last_beat is None else np.concatenate(([last_beat], beats))
+            if last_beat is not None:
+                beat_times = np.concatenate(([librosa.frames_to_time(last_beat, sr=self.sr, hop_length=self.hop_length)],
+                                             beat_times))
+            if len(bounds) >= 2:
+                starts = bounds[:-1] - carry_start
+                stops = bounds[1:] - carry_start
+                segment_rms = ana3._segment_means(carry[0], starts, stops)
+                segment_centroid = ana3._segment_means(carry[1], starts, stops)
+                segment_zcr = ana3._segment_means(carry[2], starts, stops)
+                energies = ana3.energy_score(segment_rms, segment_centroid, segment_zcr,
+                                             self.max_rms, self.max_centroid, self.max_zcr)
+                first_number = beat_count if last_beat is not None else beat_count + 1
+                for k in range(len(starts)):
+                    yield {
+                        'start_time': beat_times[k],
+                        'end_time': beat_times[k + 1],
+                        'energy': energies[k],
+                        'beat_number': first_number + k,
+                        'rms': segment_rms[k],
+                        'centroid': segment_centroid[k],
+                        'zcr': segment_zcr[k]
+                    }
+            if len(beats):
+                beat_count += len(beats)
+                last_beat = beats[-1]
+                carry = tuple(c[last_beat - carry_start:] for c in carry)
+                carry_start = last_beat
+
+    def finalize_segments(self, segments):
+        """
+        Recompute energies with the track-wide maxima (matches ana3.analyze_beat_energy)
+        
+        Returns:
+            ana3.SEGMENT_DTYPE array of the segments
+        """
+        if not segments:
+            return ana3.segment_table()
+        columns = {name: np.array([seg[name] for seg in segments])
+                   for name in ('beat_number', 'start_time', 'end_time', 'rms', 'centroid', 'zcr')}
+        energies = ana3.energy_score(columns['rms'], columns['centroid'], columns['zcr'],
+                                     self.max_rms, self.max_centroid, self.max_zcr)
+        return ana3.segment_table(energy=energies, **columns)
+
+    def _window_features(self, chunk, pad):
+        """ana3.extract_features for a window of frames, given the samples they cover and the edge padding"""
+        y_zero = np.pad(chunk, pad)
+        S = np.abs(librosa.stft(y_zero, n_fft=self.n_fft, hop_length=self.hop_length, center=False))
+        mel = librosa.feature.melspectrogram(S=S**2, sr=self.sr)
+        onset_envelope = librosa.onset.onset_strength(S=librosa.power_to_db(mel), sr=self.sr, hop_length=self.hop_length,
+                                                      n_fft=self.n_fft, aggregate=np.median)
+        spectral_centroids = librosa.feature.spectral_centroid(S=S, sr=self.sr, n_fft=self.n_fft)[0]
+        rms_energy = librosa.feature.rms(y=y_zero, frame_length=self.n_fft, hop_length=self.hop_length, center=False)[0]
+        # ZCR pads by repeating the edge samples rather than with zeros
+        y_edge = np.pad(chunk, pad, mode='edge')
+        zero_crossing_rate = librosa.feature.zero_crossing_rate(y_edge, frame_length=self.n_fft,
+                                                                hop_length=self.hop_length, center=False)[0]
+        return {
+            'onset_envelope': onset_envelope,
+            'spectral_centroids': spectral_centroids,
+            'rms_energy': rms_energy,
+            'zero_crossing_rate': zero_crossing_rate
+        }
+
+
+def stream_beat_segments(audio_file, block_duration=360.0, context_duration=10.0, sr=22050, hop_length=512,
+                         n_fft=2048):
+    """
+    Streaming counterpart of detect_beats + analyze_beat_energy
+
+    Returns:
+        beat_times array and the ana3.SEGMENT_DTYPE array of beat segments with final energies
+    """
+    analyzer = StreamingEnergyAnalyzer(audio_file, block_duration=block_duration, context_duration=context_duration,
+                                       sr=sr, hop_length=hop_length, n_fft=n_fft)
+    segments = list(analyzer.iter_segments())
+    return np.array(analyzer.beat_times), analyzer.finalize_segments(segments)
+
+
+class IncrementalAnalyzer:
+    """
+    Beat tracking and HIGH/LOW energy classification for audio arriving in chunks
+
+    feed() mono samples at the analysis rate as they arrive (from a decoder, a network
+    stream or a playback callback) and poll() for the beats finalised since the last
+    call. Frame features are computed once per frame as soon as its window is complete.
+    Beats come from re-tracking the last window_duration seconds of onset strength and
+    are only emitted once they are latency_beats beats behind the newest audio, so later
+    audio can no longer move them; each comes with the energy of the segment it closes.
+
+    Unlike ana3.analyze_beat_energy, nothing global is known in advance: energies are
+    normalised by the running maxima of the smoothed features, HIGH/LOW is decided
+    against the running median energy and dB levels are floored against the running
+    peak. Early beats are therefore provisional-quality; the stream converges to the
+    offline result as the maxima and median settle.
+    """
+
+    def __init__(self, sr=22050, hop_length=512, n_fft=2048, latency_beats=4, window_duration=12.0, top_db=80.0):
+        self.sr = sr
+        self.hop_length = hop_length
+        self.n_fft = n_fft
+        self.latency_beats = latency_beats
+        self.window_frames = int(window_duration * sr / hop_length)
+        self.top_db = top_db
+        self.onset_lag = 1 + n_fft // (2 * hop_length)  # onset_strength's centering offset
+        self.smooth_radius = 4  # gaussian_filter1d(sigma=1) reaches 4 frames either side
+
+        half = n_fft // 2
+        self._samples = np.zeros(half, dtype=np.float32)  # centre padding before the first sample
+        self._samples_start = -half  # track position of _samples[0]
+        self.n_samples = 0
+        self.n_frames = 0  # frames with final features
+        self.finished = False
+
+        # Per-frame features kept from frame _frames_start on
+        self._frames_start = 0
+        self._onset = np.zeros(0, dtype=np.float32)
+        self._rms = np.zeros(0, dtype=np.float32)
+        self._centroid = np.zeros(0)
+        self._zcr = np.zeros(0)
+        self._db_tail = None  # last onset_lag mel columns in dB
+        self._peak_db = -np.inf
+        self._tracked_frames = 0
+
+        self.tempo = None
+        self.last_beat = None
+        self.beat_count = 0
+        self.max_rms = -np.inf
+        self.max_centroid = -np.inf
+        self.max_zcr = -np.inf
+        self._maxima_until = 0
+        self._energies = []  # sorted, for the running median
+
+    def feed(self, samples):
+        """Append mono samples (at self.sr) and compute every frame they complete"""
+        if self.finished:
+            raise ValueError("feed() after finish()")
+        samples = np.asarray(samples, dtype=np.float32)
+        self._samples = np.concatenate((self._samples, samples))
+        self.n_samples += len(samples)
+        self._compute_frames()
+
+    def finish(self):
+        """Mark the end of the audio and return the remaining beats"""
+        if not self.finished:
+            self.finished = True
+            self._compute_frames()
+        return self.poll()
+
+    def poll(self):
+        """
+        Beats finalised since the last call
+
+        Returns:
+            ana3.SEGMENT_DTYPE array; each row is the segment ending at a new beat, with its
+            energy and classification (smoothed_high_energy mirrors high_energy)
+        """
+        if self.n_frames == self._tracked_frames and not self.finished:
+            return ana3.segment_table()
+        self._tracked_frames = self.n_frames
+
+        # Smoothed features are exact wherever the filter sees its full neighbourhood
+        rms = gaussian_filter1d(self._rms, sigma=1)
+        centroid = gaussian_filter1d(self._centroid, sigma=1)
+        smooth_stop = self.n_frames if self.finished else self.n_frames - self.smooth_radius
+        new = slice(self._maxima_until - self._frames_start, smooth_stop - self._frames_start)
+        if new.stop > new.start:
+            self.max_rms = max(self.max_rms, np.max(rms[new]))
+            self.max_centroid = max(self.max_centroid, np.max(centroid[new]))
+            self.max_zcr = max(self.max_zcr, np.max(self._zcr[new]))
+            self._maxima_until = smooth_stop
+
+        # Re-track the recent window and keep the beats later audio can no longer move
+        window_start = max(self._frames_start, self.n_frames - self.window_frames)
+        window = self._onset[window_start - self._frames_start:]
+        if len(window) < 2:
+            return ana3.segment_table()
+        tempo, window_beats = librosa.beat.beat_track(onset_envelope=window, sr=self.sr, hop_length=self.hop_length,
+                                                      trim=self.finished and window_start == 0,
+                                                      start_bpm=self.tempo or 120.0)
+        tempo = float(np.atleast_1d(tempo)[0])
+        if tempo > 0:
+            self.tempo = tempo
+        period = 60.0 / (self.tempo or 120.0) * self.sr / self.hop_length
+        cutoff = smooth_stop if self.finished else min(smooth_stop, self.n_frames - self.latency_beats * period)
+        beats = window_beats + window_start
+        beats = beats[beats < cutoff]
+        if self.last_beat is not None:
+            beats = beats[beats > self.last_beat + 0.5 * period]
+
+        rows = []
+        for beat in beats:
+            if self.last_beat is not None:
+                segment = slice(self.last_beat - self._frames_start, beat - self._frames_start)
+                segment_rms = np.mean(rms[segment])
+                segment_centroid = np.mean(centroid[segment])
+                segment_zcr = np.mean(self._zcr[segment])
+                energy = ana3.energy_score(np.array([segment_rms]), np.array([segment_centroid]),
+                                           np.array([segment_zcr]), self.max_rms, self.max_centroid,
+                                           self.max_zcr)[0]
+                bisect.insort(self._energies, energy)
+                rows.append((self.beat_count, self.last_beat, beat, energy, segment_rms, segment_centroid,
+                             segment_zcr, energy >= self._running_median()))
+            self.last_beat = int(beat)
+            self.beat_count += 1
+
+        # Keep the onset window and the smoothing context of the last beat, drop the rest
+        keep_from = self.n_frames - self.window_frames
+        if self.last_beat is not None:
+            keep_from = min(keep_from, self.last_beat - self.smooth_radius)
+        self._trim_frames(keep_from)
+
+        segments = ana3.segment_table()
+        if rows:
+            columns = list(zip(*rows))
+            frames_to_time = lambda frames: librosa.frames_to_time(np.array(frames), sr=self.sr,
+                                                                   hop_length=self.hop_length)
+            segments = ana3.segment_table(columns[0], frames_to_time(columns[1]), frames_to_time(columns[2]),
+                                          columns[3], columns[4], columns[5], columns[6])
+            segments['high_energy'] = columns[7]
+            segments['smoothed_high_energy'] = columns[7]
+        return segments
+
+    def _running_median(self):
+        n = len(self._energies)
+        middle = n // 2
+        return self._energies[middle] if n % 2 else (self._energies[middle - 1] + self._energies[middle]) / 2
+
+    def _compute_frames(self):
+        hop, half = self.hop_length, self.n_fft // 2
+        if self.finished:
+            total = 1 + self.n_samples // hop  # same frame count as centered librosa features
+        else:
+            total = (self.n_samples - half) // hop + 1 if self.n_samples >= half else 0
+        first = self.n_frames
+        if total <= first:
+            return
+
+        lo = first * hop - half
+        hi = (total - 1) * hop + half
+        chunk = self._samples[lo - self._samples_start:hi - self._samples_start]
+        if len(chunk) < hi - lo:
+            chunk = np.pad(chunk, (0, hi - lo - len(chunk)))  # centre padding after the last sample
+
+        S = np.abs(librosa.stft(chunk, n_fft=self.n_fft, hop_length=hop, center=False))
+        centroid = librosa.feature.spectral_centroid(S=S, sr=self.sr, n_fft=self.n_fft)[0]
+        rms = librosa.feature.rms(y=chunk, frame_length=self.n_fft, hop_length=hop, center=False)[0]
+
+        # Onset strength as librosa.onset.onset_strength computes it on the dB mel spectrogram,
+        # with the top_db floor taken from the running peak instead of the whole track
+        mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=S**2, sr=self.sr), top_db=None)
+        self._peak_db = max(self._peak_db, np.max(mel_db))
+        mel_db = np.maximum(mel_db, self._peak_db - self.top_db)
+        history = mel_db if self._db_tail is None else np.concatenate((self._db_tail, mel_db), axis=1)
+        history_start = first - (0 if self._db_tail is None else self._db_tail.shape[1])
+        flux = np.median(np.maximum(0.0, history[:, 1:] - history[:, :-1]), axis=0)
+        onset = np.zeros(total - first, dtype=np.float32)
+        for f in range(max(first, self.onset_lag), total):
+            onset[f - first] = flux[f - self.onset_lag - history_start]
+        self._db_tail = history[:, -self.onset_lag:]
+
+        # Zero crossing rate over the real samples of each frame (edge padding adds no crossings)
+        real_lo, real_hi = max(lo, 0), min(hi, self.n_samples)
+        y = self._samples[real_lo - self._samples_start:real_hi - self._samples_start]
+        y = np.where(np.abs(y) <= 1e-10, 0, y)
+        counts = np.concatenate(([0], np.cumsum(np.signbit(y[1:]) != np.signbit(y[:-1]))))
+        frame_starts = np.arange(first, total) * hop - half
+        frame_first = np.clip(frame_starts, 0, self.n_samples - 1) - real_lo
+        frame_last = np.clip(frame_starts + self.n_fft - 1, 0, self.n_samples - 1) - real_lo
+        zcr = (counts[frame_last] - counts[frame_first]) / self.n_fft
+
+        self._onset = np.concatenate((self._onset, onset))
+        self._rms = np.concatenate((self._rms, rms))
+        self._centroid = np.concatenate((self._centroid, centroid))
+        self._zcr = np.concatenate((self._zcr, zcr))
+        self.n_frames = total
+
+        # Samples before the next frame's window are no longer needed
+        next_lo = total * hop - half
+        if next_lo > self._samples_start:
+            self._samples = self._samples[next_lo - self._samples_start:]
+            self._samples_start = next_lo
+
+    def _trim_frames(self, keep_from):
+        drop = keep_from - self._frames_start
+        if drop > 0:
+            self._onset = self._onset[drop:]
+            self._rms = self._rms[drop:]
+            self._centroid = self._centroid[drop:]
+            self._zcr = self._zcr[drop:]
+            self._frames_start = keep_from